@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
-from app.services.fraud.store import get_all, get
-from app.services.fraud.cfg import ENGINE_CONFIG
+from app.services.fraud.store import get_all, get, reload, EngineConfig
 
 router = APIRouter(prefix="/config", tags=["config"])
 
+_CONFIG_KEYS = set(EngineConfig.__dataclass_fields__)
+
 
 @router.get("")
 async def get_config():
@@ -16,12 +17,24 @@ async def get_config():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/reload")
+async def reload_config():
+    """
+    Re-read cfg.py now instead of waiting for the file watcher; returns the thresholds in effect.
+    An invalid cfg.py is rejected and the previous thresholds stay active.
+    """
+    try:
+        return reload().as_dict()
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Engine config not reloaded: {e}")
+
+
 @router.get("/{key}")
 async def get_config_key(key: str):
     """
     Fetch a single column value by key.
     """
-    if key not in ENGINE_CONFIG:
+    if key not in _CONFIG_KEYS:
         raise HTTPException(status_code=404, detail=f"Unknown config key: {key}")
     try:
         value = get(key)
@@ -0,0 +1,73 @@
+from fastapi import APIRouter
+from app.services.fraud.ai.gateway import ai_gateway
+from app.services.fraud.ai.jobs import ai_jobs
+from app.services.fraud.history import transaction_writer
+from app.services.fraud.rule_stats import rule_stats
+from app.services.fraud.verdicts import verdict_cache
+
+router = APIRouter(prefix="/engine", tags=["engine"])
+
+
+@router.get("/stats")
+async def get_engine_stats():
+    """
+    Per-rule counters for this worker: evaluations, hits and hit rate, score points
+    added, final decisions of the scans each rule fired in (and its share of each
+    decision), and time spent when ENGINE_RULE_TIMING_ENABLED is set.
+    """
+    return rule_stats.report()
+
+
+@router.post("/stats/reset")
+async def reset_engine_stats():
+    """
+    Start counting from zero (for this worker).
+    """
+    rule_stats.reset()
+    return rule_stats.report()
+
+
+@router.get("/verdict-cache")
+async def get_verdict_cache_stats():
+    """
+    AI verdict cache for this worker: size, hits/misses and hit rate, stores,
+    TTL expirations, LRU evictions and config-change invalidations.
+    """
+    return verdict_cache.report()
+
+
+@router.post("/verdict-cache/clear")
+async def clear_verdict_cache():
+    """
+    Drop every cached AI verdict (for this worker); counters are kept.
+    """
+    verdict_cache.clear()
+    return verdict_cache.report()
+
+
+@router.get("/ai-gateway")
+async def get_ai_gateway_stats():
+    """
+    AI gateway for this worker: breaker state and openings, calls in flight,
+    completed and slow calls, and rejections by reason (circuit_open,
+    rate_limited, saturated, timeout, error) that got a rule-based decision.
+    """
+    return ai_gateway.report()
+
+
+@router.get("/ai-jobs")
+async def get_ai_jobs_stats():
+    """
+    Background agent runs of the async AI mode for this worker: queue depth,
+    submitted, completed and failed runs, and submissions refused (queue full).
+    """
+    return ai_jobs.report()
+
+
+@router.get("/writer")
+async def get_writer_stats():
+    """
+    Write-behind transaction log for this worker: queue depth, rows not committed
+    yet, rows written, and failing commits (retried until they succeed).
+    """
+    return transaction_writer.report()
@@ -2,14 +2,33 @@
 Health and readiness endpoints for load balancers and existing systems.
 """
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.fraud.history import transaction_writer
 
 router = APIRouter(tags=["health"])
 
 
+def health_status():
+    """200 body, or a 503 while transaction rows can't be committed (callers back up)."""
+    if not transaction_writer.healthy:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "degraded",
+                "service": "fraud-middleware",
+                "reason": "transaction log writes are failing",
+                "writer": transaction_writer.report(),
+            },
+        )
+    return {"status": "ok", "service": "fraud-middleware"}
+
+
 @router.get("/health")
 async def health():
     """
     Liveness/readiness for existing systems and load balancers.
-    Returns 200 when the service is up and can accept middleware requests.
+    Returns 200 when the service is up and can accept middleware requests, 503 while
+    the transaction log is failing to commit.
     """
-    return {"status": "ok", "service": "fraud-middleware"}
+    return health_status()
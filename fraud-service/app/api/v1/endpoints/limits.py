@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from app.services.transaction_middleware.account_limits import (
-    get_limits_for_account,
+    aget_limits_for_account,
     set_account_type,
     ACCOUNT_TYPE_LIMITS,
     OTP_REQUIRED_AMOUNT_THRESHOLD,
 )
-from app.services.fraud.history import history_service
+from app.services.fraud.history import async_history_service
 
 router = APIRouter()
 
@@ -21,8 +21,8 @@ async def get_account_limits(account_id: str):
     Return account type and limits for display (e.g. "Your limit: $5,000 per transaction").
     Used by frontend to show limits and daily used.
     """
-    limits = get_limits_for_account(account_id)
-    daily_used = history_service.get_daily_outbound_total(account_id)
+    limits = await aget_limits_for_account(account_id)
+    daily_used = await async_history_service.get_daily_outbound_total(account_id)
     return {
         "account_id": account_id,
         "account_type": limits["account_type"],
@@ -42,4 +42,4 @@ async def set_account_type_endpoint(account_id: str, body: SetAccountTypeBody):
         set_account_type(account_id, body.account_type)
     except ValueError as e:
         raise HTTPException(status_code=400, detail={"message": str(e)})
-    return get_limits_for_account(account_id)
+    return await aget_limits_for_account(account_id)
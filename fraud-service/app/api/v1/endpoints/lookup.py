@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Any, Dict
+import base64
+import binascii
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Any, Dict, Optional
 from pydantic import BaseModel
-from app.services.fraud.history import history_service
+from app.services.fraud.history import async_history_service
 from app.services.fraud.indicators_agent import get_account_indicators
 
 router = APIRouter()
@@ -18,18 +22,79 @@ class TransactionHistoryItem(BaseModel):
     reason: str
 
 
+class TransactionHistoryPage(BaseModel):
+    items: List[TransactionHistoryItem]
+    next_cursor: Optional[str] = None
+
+
+def _encode_cursor(before: Optional[tuple]) -> Optional[str]:
+    if before is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(before)).encode()).decode()
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Opaque cursor -> (ts_epoch, transaction_id) keyset position."""
+    if not cursor:
+        return None
+    try:
+        ts_epoch, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(ts_epoch, int) or not isinstance(transaction_id, str):
+            raise ValueError("bad cursor fields")
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return ts_epoch, transaction_id
+
+
 @router.get("/lookup/{account_id}", response_model=List[TransactionHistoryItem])
 async def lookup_history(account_id: str):
     """
     Get transaction history for a specific account.
     """
     try:
-        history = history_service.get_account_history(account_id)
+        history = await async_history_service.get_account_history(account_id)
         return history
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/lookup/{account_id}/page", response_model=TransactionHistoryPage)
+async def lookup_history_page(
+    account_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Full transaction history for an account, newest first, one page at a time.
+    Pass the returned next_cursor to get the following page; it is null on the last one.
+    """
+    before = _decode_cursor(cursor)
+    try:
+        items, next_before = await async_history_service.get_account_history_page(account_id, limit, before)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"items": items, "next_cursor": _encode_cursor(next_before)}
+
+
+@router.get("/lookup/{account_id}/stream")
+async def lookup_history_stream(
+    account_id: str,
+    cursor: Optional[str] = None,
+    page_size: int = Query(500, ge=1, le=5000),
+):
+    """
+    Full transaction history for an account as NDJSON (one TransactionHistoryItem per
+    line, newest first), read from the database page by page while it is sent.
+    """
+    before = _decode_cursor(cursor)
+
+    async def lines():
+        async for item in async_history_service.iter_account_history(account_id, page_size, before):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.get("/lookup/{account_id}/indicators")
 async def lookup_account_indicators(account_id: str) -> Dict[str, Any]:
     """
@@ -2,15 +2,25 @@
 Middleware endpoints for integrating the fraud service into existing systems.
 Call these from your existing payment/transfer pipeline to get allow/review/block decisions.
 """
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+from functools import partial
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.websockets import WebSocketState
 from datetime import datetime
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 
+from app.core.config import get_settings
 from app.models.transaction import TransactionScanRequest
+from app.services.fraud.ai.jobs import PENDING, ai_jobs
+from app.services.fraud.batch import evaluate_batch
+from app.services.fraud.history import async_history_service
 from app.services.fraud.service import evaluate_transaction
-from app.services.transaction_middleware.middleware import run_transaction_middleware
+from app.services.fraud.stream import DecisionStream
+from app.services.transaction_middleware.middleware import release_daily_limit, run_transaction_middleware
 
 router = APIRouter(prefix="/middleware", tags=["middleware"])
 logger = logging.getLogger(__name__)
@@ -27,19 +37,28 @@ class MiddlewareTransactionRequest(BaseModel):
     ip_address: str = Field("", description="Client IP (optional)")
     device_id: str = Field("", description="Device or user-agent (optional)")
     otp: Optional[str] = Field(None, description="Required for /check when amount exceeds threshold")
+    async_ai: bool = Field(
+        False,
+        description="Don't wait for the AI agent: escalations return PENDING_AI with a ticket_id; "
+                    "poll GET /middleware/decision/{transaction_id}",
+    )
 
 
 # --- Response schemas for integration docs and consistency ---
 class MiddlewareDecisionResponse(BaseModel):
     """Standard decision response returned to existing systems."""
     transaction_id: str
-    decision: str = Field(..., description="ALLOW | REVIEW | BLOCK | PENDING_REVIEW")
+    decision: str = Field(..., description="ALLOW | REVIEW | BLOCK | PENDING_REVIEW | PENDING_AI")
     score: int = Field(..., ge=0, le=100, description="Risk score 0-100")
     reason: str = Field("", description="Human-readable reason")
     account_type: Optional[str] = Field(None, description="Set for /check when limits applied")
     anomalies: Optional[List[str]] = None
     patterns: Optional[List[str]] = None
     anti_patterns: Optional[List[str]] = None
+    degraded: bool = Field(False, description="True when the AI agent was unavailable and rules decided")
+    degraded_reason: Optional[str] = Field(None, description="circuit_open | rate_limited | saturated | timeout | error")
+    ticket_id: Optional[str] = Field(None, description="Set with PENDING_AI (async_ai) until the agent decides")
+    cached: bool = Field(False, description="True when a recent AI verdict for the same quantized features was reused")
 
 
 class MiddlewareLimitError(BaseModel):
@@ -52,6 +71,35 @@ class MiddlewareLimitError(BaseModel):
     daily_used: Optional[float] = None
 
 
+class MiddlewareBatchError(BaseModel):
+    """A /check/batch transaction stopped by limits or OTP (what /check returns as 400)."""
+    transaction_id: str
+    error: MiddlewareLimitError
+
+
+class MiddlewareBatchResponse(BaseModel):
+    """Batch outcome: decisions of the scored transactions in request order, plus rejections."""
+    results: List[MiddlewareDecisionResponse]
+    errors: List[MiddlewareBatchError] = []
+
+
+class MiddlewareStreamError(BaseModel):
+    """Written in place of the decision for a stream line that could not be read."""
+    line: int = Field(..., description="1-based number of the line on the connection (blank lines not counted)")
+    error: str
+
+
+def _limit_error(mw_result) -> MiddlewareLimitError:
+    return MiddlewareLimitError(
+        error_code=mw_result.error_code,
+        message=mw_result.message,
+        account_type=mw_result.account_type,
+        single_tx_limit=mw_result.single_tx_limit,
+        daily_limit=mw_result.daily_limit,
+        daily_used=mw_result.daily_used,
+    )
+
+
 def _to_scan_request(body: MiddlewareTransactionRequest) -> TransactionScanRequest:
     return TransactionScanRequest(
         transaction_id=body.transaction_id,
@@ -75,6 +123,10 @@ def _to_decision_response(transaction_id: str, ai_result: dict, account_type: Op
         anomalies=ai_result.get("anomalies"),
         patterns=ai_result.get("patterns"),
         anti_patterns=ai_result.get("anti_patterns"),
+        degraded=ai_result.get("degraded", False),
+        degraded_reason=ai_result.get("degraded_reason"),
+        ticket_id=ai_result.get("ticket_id"),
+        cached=ai_result.get("cached", False),
     )
 
 
@@ -94,21 +146,15 @@ async def middleware_check(body: MiddlewareTransactionRequest):
     transaction = req.to_transaction()
     logger.info(f"Middleware check: {transaction.transaction_id}")
 
-    mw_result = run_transaction_middleware(transaction, otp=body.otp)
+    mw_result = await run_transaction_middleware(transaction, otp=body.otp)
     if not mw_result.allowed:
-        raise HTTPException(
-            status_code=400,
-            detail=MiddlewareLimitError(
-                error_code=mw_result.error_code,
-                message=mw_result.message,
-                account_type=mw_result.account_type,
-                single_tx_limit=mw_result.single_tx_limit,
-                daily_limit=mw_result.daily_limit,
-                daily_used=mw_result.daily_used,
-            ).model_dump(exclude_none=True),
-        )
+        raise HTTPException(status_code=400, detail=_limit_error(mw_result).model_dump(exclude_none=True))
 
-    result = await evaluate_transaction(transaction)
+    try:
+        result = await evaluate_transaction(transaction, defer_ai=body.async_ai)
+    finally:
+        # Logged transactions already settled their daily-limit hold; free it otherwise
+        release_daily_limit(transaction.transaction_id)
     return _to_decision_response(transaction.transaction_id, result, account_type=mw_result.account_type)
 
 
@@ -127,5 +173,258 @@ async def middleware_evaluate(body: MiddlewareTransactionRequest):
     transaction = req.to_transaction()
     logger.info(f"Middleware evaluate: {transaction.transaction_id}")
 
-    result = await evaluate_transaction(transaction)
+    result = await evaluate_transaction(transaction, defer_ai=body.async_ai)
     return _to_decision_response(transaction.transaction_id, result)
+
+
+def _check_batch_size(body: List[MiddlewareTransactionRequest]) -> None:
+    max_items = get_settings().BATCH_MAX_ITEMS
+    if len(body) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(body)} transactions exceeds BATCH_MAX_ITEMS ({max_items})")
+
+
+@router.post(
+    "/check/batch",
+    response_model=MiddlewareBatchResponse,
+    summary="Full pipeline for many transactions",
+    description="Run /check on an array of transactions in one request. Limits and OTP apply per transaction, "
+                "in request order per sender; rejected ones are listed in errors. Waits for AI decisions.",
+)
+async def middleware_check_batch(body: List[MiddlewareTransactionRequest]):
+    """
+    Batch /check (e.g. a settlement file). Features are loaded for the whole batch
+    at once, each sender's transfers are checked and scored in order, and the
+    transactions escalated to the AI agent are decided last (see fraud/batch.py).
+    """
+    _check_batch_size(body)
+    transactions = [_to_scan_request(item).to_transaction() for item in body]
+    logger.info(f"Middleware check batch: {len(transactions)} transactions")
+    account_types: dict[int, Optional[str]] = {}
+
+    async def _admit(i: int) -> Optional[dict]:
+        mw_result = await run_transaction_middleware(transactions[i], otp=body[i].otp)
+        account_types[i] = mw_result.account_type
+        return None if mw_result.allowed else {"error": _limit_error(mw_result)}
+
+    def _release(i: int) -> None:
+        # Logged transactions already settled their daily-limit hold; free it otherwise
+        release_daily_limit(transactions[i].transaction_id)
+
+    response = MiddlewareBatchResponse(results=[])
+    for i, result in enumerate(await evaluate_batch(transactions, admit=_admit, release=_release)):
+        transaction_id = transactions[i].transaction_id
+        if "error" in result:
+            response.errors.append(MiddlewareBatchError(transaction_id=transaction_id, error=result["error"]))
+        else:
+            response.results.append(_to_decision_response(transaction_id, result, account_type=account_types[i]))
+    return response
+
+
+@router.post(
+    "/evaluate/batch",
+    response_model=MiddlewareBatchResponse,
+    summary="Fraud-only evaluation for many transactions",
+    description="Run /evaluate on an array of transactions in one request; decisions come back in request "
+                "order. Waits for AI decisions.",
+)
+async def middleware_evaluate_batch(body: List[MiddlewareTransactionRequest]):
+    """
+    Batch /evaluate (e.g. a settlement file): no limits, no OTP. Features are loaded
+    for the whole batch at once, each sender's transfers are scored in order, and
+    the transactions escalated to the AI agent are decided last (see fraud/batch.py).
+    """
+    _check_batch_size(body)
+    transactions = [_to_scan_request(item).to_transaction() for item in body]
+    logger.info(f"Middleware evaluate batch: {len(transactions)} transactions")
+    results = await evaluate_batch(transactions)
+    return MiddlewareBatchResponse(
+        results=[_to_decision_response(t.transaction_id, result) for t, result in zip(transactions, results)]
+    )
+
+
+@router.get(
+    "/decision/{transaction_id}",
+    response_model=MiddlewareDecisionResponse,
+    summary="Decision of an async_ai scan",
+    description="Current decision for a transaction: PENDING_AI while the agent runs, then the final one. "
+                "With wait > 0 the request is held until the agent decides or wait seconds pass (long-poll).",
+)
+async def middleware_decision(
+    transaction_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for a pending decision (capped by AI_ASYNC_MAX_WAIT_SECONDS)"),
+):
+    """
+    Poll for the outcome of a scan sent with async_ai. Recent async results come
+    from memory; anything else is read from the transaction history. 404 if the
+    transaction was never scanned.
+    """
+    job = await ai_jobs.wait(transaction_id, min(wait, get_settings().AI_ASYNC_MAX_WAIT_SECONDS))
+    if job is not None:
+        status, ticket_id, result = job
+        if status == PENDING:
+            result = {**result, "ticket_id": ticket_id}
+        return _to_decision_response(transaction_id, result)
+    result = await async_history_service.get_transaction_decision(transaction_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return _to_decision_response(transaction_id, result)
+
+
+def _stream_decision(transaction_id: str, result: dict) -> str:
+    return _to_decision_response(transaction_id, result).model_dump_json()
+
+
+async def _submit_lines(stream: DecisionStream, lines: list[bytes], first_number: int) -> None:
+    """Queue one read's worth of stream lines for /evaluate-style scoring; each gives one JSON line."""
+    parsed: list = []
+    for number, line in enumerate(lines, first_number):
+        try:
+            body = MiddlewareTransactionRequest.model_validate_json(line)
+        except ValidationError as e:
+            parsed.append(MiddlewareStreamError(line=number, error=str(e)).model_dump_json())
+            continue
+        parsed.append((_to_scan_request(body).to_transaction(), body.async_ai))
+    await stream.prefetch([item[0] for item in parsed if isinstance(item, tuple)])
+    for item in parsed:
+        if isinstance(item, str):
+            await stream.submit_output(item)
+        else:
+            transaction, defer_ai = item
+            await stream.submit(transaction, defer_ai, partial(_stream_decision, transaction.transaction_id))
+
+
+class _LineTooLong(ValueError):
+    """A stream line over STREAM_MAX_LINE_BYTES."""
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[list[bytes]]:
+    """
+    Non-empty lines of a chunked NDJSON body, one list per chunk read. Raises
+    _LineTooLong (after the lines before it) on a line over max_line_bytes.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        too_long = len(buffer) > max_line_bytes
+        for i, line in enumerate(lines):
+            if len(line) > max_line_bytes:
+                lines, too_long = lines[:i], True
+                break
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            yield lines
+        if too_long:
+            raise _LineTooLong(f"line exceeds STREAM_MAX_LINE_BYTES ({max_line_bytes})")
+    if buffer.strip():
+        yield [buffer]
+
+
+async def _read_stream(stream: DecisionStream, reads: AsyncIterator[list[bytes]]) -> None:
+    """
+    Submit the lines of every read until the client stops sending. A line that is
+    too long, or a failure while queueing (e.g. the feature prefetch), is answered
+    with an error line and ends the stream: the decisions before it are still written.
+    """
+    number = 0
+    try:
+        async for lines in reads:
+            await _submit_lines(stream, lines, number + 1)
+            number += len(lines)
+    except _LineTooLong as e:
+        # No safe line boundary to resume from; answer and stop reading
+        await stream.submit_output(MiddlewareStreamError(line=number + 1, error=str(e)).model_dump_json())
+    except ClientDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Middleware stream stopped reading at line {number + 1}: {e}", exc_info=True)
+        error = "internal error while reading the stream; no further lines were read"
+        await stream.submit_output(MiddlewareStreamError(line=number + 1, error=error).model_dump_json())
+    finally:
+        stream.close()
+
+
+class _NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that doesn't listen for the disconnect itself: that would
+    consume the request body the endpoint is still reading. A disconnect ends the
+    body read instead.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+@router.post(
+    "/stream",
+    response_class=_NDJSONStreamingResponse,
+    summary="Fraud-only evaluation of an NDJSON stream",
+    description="Send transactions as NDJSON (one /evaluate body per line) on a long-lived request; decisions "
+                "are written back as NDJSON in the same order while the body is still being sent. A line "
+                "that can't be read gets {\"line\", \"error\"} instead. At most STREAM_MAX_IN_FLIGHT "
+                "transactions are pending per connection; beyond that the body is not read (backpressure).",
+)
+async def middleware_stream(request: Request):
+    """
+    Continuous /evaluate for a feed (e.g. a card switch) without a request per
+    transaction: no limits, no OTP. See fraud/stream.py for ordering and backpressure.
+    """
+    settings = get_settings()
+    stream = DecisionStream(settings.STREAM_MAX_IN_FLIGHT)
+    logger.info("Middleware stream opened")
+
+    async def _write() -> AsyncIterator[bytes]:
+        reader = asyncio.create_task(
+            _read_stream(stream, _ndjson_lines(request.stream(), settings.STREAM_MAX_LINE_BYTES))
+        )
+        try:
+            async for chunk in stream.results():
+                yield ("\n".join(chunk) + "\n").encode()
+        finally:
+            reader.cancel()
+            # Lines already read are still scored and logged, as for a client leaving /evaluate/batch
+            await stream.drain()
+            logger.info(f"Middleware stream closed after {stream.submitted} lines")
+
+    return _NDJSONStreamingResponse(_write())
+
+
+@router.websocket("/stream/ws")
+async def middleware_stream_ws(websocket: WebSocket):
+    """
+    WebSocket form of POST /middleware/stream: each message holds one or more NDJSON
+    transaction lines, and each reply holds the next decisions (NDJSON, in order).
+    Lines over STREAM_MAX_LINE_BYTES end the stream as they do on POST.
+    """
+    settings = get_settings()
+    await websocket.accept()
+    stream = DecisionStream(settings.STREAM_MAX_IN_FLIGHT)
+    logger.info("Middleware stream (WebSocket) opened")
+
+    async def _messages() -> AsyncIterator[bytes]:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            # A message ends its last line
+            yield (message.get("bytes") or (message.get("text") or "").encode()) + b"\n"
+
+    reader = asyncio.create_task(
+        _read_stream(stream, _ndjson_lines(_messages(), settings.STREAM_MAX_LINE_BYTES))
+    )
+    try:
+        async for chunk in stream.results():
+            await websocket.send_text("\n".join(chunk))
+        if websocket.client_state == WebSocketState.CONNECTED:
+            # Reading stopped on an error line; the client may still be sending
+            await websocket.close()
+    except WebSocketDisconnect:
+        # Client went away while decisions were still being written
+        pass
+    finally:
+        reader.cancel()
+        await stream.drain()
+        logger.info(f"Middleware stream (WebSocket) closed after {stream.submitted} lines")
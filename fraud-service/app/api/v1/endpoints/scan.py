@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.models.transaction import TransactionScanRequest
 from app.services.fraud.service import evaluate_transaction
-from app.services.transaction_middleware.middleware import run_transaction_middleware
+from app.services.transaction_middleware.middleware import release_daily_limit, run_transaction_middleware
 import logging
 
 router = APIRouter()
@@ -18,7 +18,7 @@ async def scan_transaction(body: TransactionScanRequest):
     logger.info(f"Received transaction scan request: {transaction.transaction_id}")
 
     # --- Transaction middleware: limits + OTP (before fraud scan) ---
-    mw_result = run_transaction_middleware(transaction, otp=body.otp)
+    mw_result = await run_transaction_middleware(transaction, otp=body.otp)
     if not mw_result.allowed:
         raise HTTPException(
             status_code=400,
@@ -33,7 +33,11 @@ async def scan_transaction(body: TransactionScanRequest):
         )
 
     # --- Fraud evaluation (only after middleware allows) ---
-    result = await evaluate_transaction(transaction)
+    try:
+        result = await evaluate_transaction(transaction)
+    finally:
+        # Logged transactions already settled their daily-limit hold; free it otherwise
+        release_daily_limit(transaction.transaction_id)
     logger.info(f"AI Evaluation Result for {transaction.transaction_id}: {result}")
 
     return {
@@ -8,6 +8,109 @@ class Settings(BaseSettings):
     DB_PATH: str = "transactions.db"
     # LangGraph HITL state; use one path so you don't get multiple checkpoints.db in different cwds
     CHECKPOINTS_DB_PATH: str = "checkpoints.db"
+    # SQLite connection tuning (see app/core/db.py)
+    DB_BUSY_TIMEOUT_SECONDS: float = 5.0
+    DB_STATEMENT_CACHE_SIZE: int = 256
+    DB_CACHE_SIZE_KB: int = 16_384
+    DB_MMAP_SIZE_BYTES: int = 268_435_456
+    DB_ASYNC_POOL_SIZE: int = 4
+    # Max sending accounts kept in the in-memory sliding windows (LRU)
+    WINDOW_MAX_ACCOUNTS: int = 100_000
+    # Sender -> beneficiary pair counts kept in memory (LRU), plus an optional Bloom
+    # filter of every pair ever logged so first-time beneficiaries skip the count
+    # query. The filter is loaded at startup in the background (~1.2 bytes per pair of
+    # capacity); single-writer deployments only, since other workers' pairs are missed
+    BENEFICIARY_CACHE_MAX_PAIRS: int = 500_000
+    BENEFICIARY_FILTER_ENABLED: bool = False
+    BENEFICIARY_FILTER_CAPACITY: int = 10_000_000
+    BENEFICIARY_FILTER_FP_RATE: float = 0.01
+    # account_hour_rollup keeps this many days (>= 8 covers the 7-day histogram);
+    # older days are deleted by the compaction job every interval
+    HOUR_ROLLUP_RETENTION_DAYS: int = 8
+    HOUR_ROLLUP_COMPACTION_INTERVAL_SECONDS: int = 3600
+    # Write-behind transaction log: rows are queued and committed in batches of up to
+    # WRITE_BATCH_SIZE, at least every WRITE_FLUSH_INTERVAL_MS (see fraud/writer.py).
+    # A failing batch is retried (backoff capped at WRITE_RETRY_MAX_BACKOFF_SECONDS) until
+    # it commits; at shutdown, what isn't written within the timeout goes to the spill
+    # file, replayed on the next start
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_QUEUE_MAX_ROWS: int = 10_000
+    WRITE_BATCH_SIZE: int = 500
+    WRITE_FLUSH_INTERVAL_MS: int = 50
+    WRITE_RETRY_MAX_BACKOFF_SECONDS: float = 5.0
+    WRITE_SHUTDOWN_TIMEOUT_SECONDS: float = 30.0
+    WRITE_SPILL_PATH: str = "transactions.spill.jsonl"
+    # Tiered storage: rows older than HOT_RETENTION_DAYS (min 8, the longest feature
+    # window plus a day) move to compressed per-day segments in ARCHIVE_DIR; segments
+    # older than ARCHIVE_RETENTION_DAYS are deleted (0 keeps them forever)
+    ARCHIVE_DIR: str = "archive"
+    HOT_RETENTION_DAYS: int = 8
+    ARCHIVE_RETENTION_DAYS: int = 0
+    ARCHIVE_INTERVAL_SECONDS: int = 3600
+    ARCHIVE_BATCH_SIZE: int = 10_000
+    # Archived days whose parsed index / account filter stay in memory (LRU); a
+    # filter is about 1.2 bytes per account archived that day
+    ARCHIVE_INDEX_CACHE_DAYS: int = 16
+    ARCHIVE_FILTER_CACHE_DAYS: int = 400
+    # Daily-limit ledger (see fraud/ledger.py): reservations not settled within the TTL
+    # are dropped; tracked accounts are re-checked against SQL every interval
+    DAILY_LEDGER_MAX_ACCOUNTS: int = 100_000
+    DAILY_LEDGER_RESERVATION_TTL_SECONDS: int = 300
+    DAILY_LEDGER_RECONCILE_INTERVAL_SECONDS: int = 900
+    # Engine thresholds (fraud/cfg.py) are re-read when the file changes, checked
+    # every interval (0 disables; POST /api/v1/config/reload still works)
+    ENGINE_CONFIG_RELOAD_INTERVAL_SECONDS: float = 5
+    # Device signatures (see fraud/devices.py): empty path uses the built-in list;
+    # verdicts are cached per device_id
+    DEVICE_SIGNATURES_PATH: str = ""
+    DEVICE_VERDICT_CACHE_SIZE: int = 50_000
+    # Extra scoring rules appended to the built-in packs (see fraud/rules.py)
+    CUSTOM_RULES_PATH: str = ""
+    # Per-rule nanosecond timers in GET /api/v1/engine/stats (counters are always on)
+    ENGINE_RULE_TIMING_ENABLED: bool = False
+    # AI agent verdicts reused for scans with the same quantized features (see
+    # fraud/verdicts.py); 0 entries disables the cache
+    AI_VERDICT_CACHE_SIZE: int = 10_000
+    AI_VERDICT_CACHE_TTL_SECONDS: float = 3600
+    # AI gateway (see fraud/ai/gateway.py): agent calls beyond the concurrency cap,
+    # the rate limit or the deadline, or while the breaker is open, get a rule-based
+    # decision marked degraded. Escalations the rules allowed with a combined score of
+    # at least AI_FALLBACK_REVIEW_FROM are held for REVIEW in that case
+    AI_GATEWAY_MAX_CONCURRENCY: int = 8
+    AI_GATEWAY_QUEUE_TIMEOUT_SECONDS: float = 1.0
+    AI_GATEWAY_DEADLINE_SECONDS: float = 8.0
+    AI_GATEWAY_RATE_PER_SECOND: float = 20.0
+    AI_GATEWAY_BURST: int = 40
+    AI_GATEWAY_BREAKER_FAILURES: int = 5
+    AI_GATEWAY_BREAKER_OPEN_SECONDS: float = 30.0
+    AI_GATEWAY_BREAKER_SLOW_CALL_SECONDS: float = 5.0
+    AI_FALLBACK_REVIEW_FROM: int = 25
+    # Give the agent the velocity / beneficiary / pattern-summary tool results from
+    # the scan's feature snapshot up front instead of letting it call the tools
+    AI_TOOL_PREFETCH_ENABLED: bool = True
+    # Async AI mode (async_ai on /middleware/check and /evaluate, see fraud/ai/jobs.py):
+    # escalations return PENDING_AI at once and the agent runs on background workers;
+    # GET /middleware/decision/{transaction_id} long-polls up to the max wait
+    AI_ASYNC_WORKERS: int = 8
+    AI_ASYNC_QUEUE_SIZE: int = 1_000
+    AI_ASYNC_RESULTS_MAX: int = 100_000
+    AI_ASYNC_MAX_WAIT_SECONDS: float = 30
+    # At shutdown the workers get this long to finish the queue; runs left over get
+    # their rule-based decision written instead of staying PENDING_AI
+    AI_ASYNC_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0
+    # At startup, PENDING_AI rows older than this are taken as lost (their process
+    # died) and sent to REVIEW; keep it well above the longest queue wait so other
+    # workers' runs are not settled under them
+    AI_ASYNC_STALE_SECONDS: int = 900
+    # Batch endpoints (/middleware/evaluate/batch, /check/batch, see fraud/batch.py):
+    # max transactions per request, and senders scored concurrently
+    BATCH_MAX_ITEMS: int = 10_000
+    BATCH_MAX_CONCURRENT_ACCOUNTS: int = 64
+    # Streaming endpoints (/middleware/stream NDJSON, /middleware/stream/ws, see
+    # fraud/stream.py): transactions of one connection scored or awaiting write before
+    # it stops reading, and the longest NDJSON line accepted
+    STREAM_MAX_IN_FLIGHT: int = 256
+    STREAM_MAX_LINE_BYTES: int = 65_536
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,200 @@
+"""
+Shared SQLite connections for every store that lives in DB_PATH (transaction
+history, account limits, chat memory).
+
+Each thread gets one long-lived connection per database file. Pragmas (WAL
+journal, synchronous=NORMAL, mmap and page cache sizes) are applied once when the
+connection is opened, and sqlite3's statement cache keeps the prepared form of
+each query string, so repeated calls skip connect, pragma and prepare costs.
+
+Async code paths use AsyncConnectionPool (aiosqlite) with the same pragmas.
+"""
+import asyncio
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import aiosqlite
+
+from app.core.config import get_settings
+
+_local = threading.local()
+# Every connection ever opened, so shutdown can close them from any thread.
+_all_connections: list[sqlite3.Connection] = []
+_all_connections_lock = threading.Lock()
+# Bumped by close_all() so threads drop connections that were closed under them.
+_generation = 0
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    settings = get_settings()
+    conn = sqlite3.connect(
+        path,
+        timeout=settings.DB_BUSY_TIMEOUT_SECONDS,
+        cached_statements=settings.DB_STATEMENT_CACHE_SIZE,
+        # Only the owning thread uses it; False lets close_all() run at shutdown.
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE_BYTES)}")
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size=-{int(settings.DB_CACHE_SIZE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """Return this thread's connection to path (default DB_PATH), opening it on first use."""
+    path = path or get_settings().DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.generation != _generation:
+        connections = _local.connections = {}
+        _local.generation = _generation
+    conn = connections.get(path)
+    if conn is None:
+        conn = _open_connection(path)
+        connections[path] = conn
+        with _all_connections_lock:
+            _all_connections.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction(path: Optional[str] = None):
+    """Yield this thread's connection; commit on success, roll back on error."""
+    conn = get_connection(path)
+    with conn:
+        yield conn
+
+
+@contextmanager
+def read_cursor(path: Optional[str] = None, row_factory=None):
+    """Yield a cursor on this thread's connection; row_factory applies to this cursor only."""
+    cursor = get_connection(path).cursor()
+    if row_factory is not None:
+        cursor.row_factory = row_factory
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def close_all() -> None:
+    """Close every pooled connection (call on shutdown)."""
+    global _generation
+    with _all_connections_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# --- Async (aiosqlite) pool ---
+# aiosqlite runs each connection on its own worker thread, so a small pool lets
+# concurrent requests overlap their SQLite I/O instead of queueing on one thread.
+
+class AsyncConnectionPool:
+    """Bounded pool of aiosqlite connections to one database file."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = max(1, size)
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: list[aiosqlite.Connection] = []
+        self._opening = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _open(self) -> aiosqlite.Connection:
+        settings = get_settings()
+        conn = await aiosqlite.connect(
+            self.path,
+            timeout=settings.DB_BUSY_TIMEOUT_SECONDS,
+            cached_statements=settings.DB_STATEMENT_CACHE_SIZE,
+        )
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE_BYTES)}")
+        await conn.execute(f"PRAGMA cache_size=-{int(settings.DB_CACHE_SIZE_KB)}")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _bind_loop(self):
+        # Queues and futures belong to one event loop; a new loop (e.g. a fresh
+        # test client) gets fresh connections.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            for conn in self._connections:
+                conn.stop()
+            self._connections = []
+            self._opening = 0
+            self._idle = asyncio.Queue()
+            self._loop = loop
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Yield an idle connection, opening one if the pool is below size, else wait."""
+        self._bind_loop()
+        if not self._idle.empty():
+            conn = self._idle.get_nowait()
+        elif len(self._connections) + self._opening < self.size:
+            self._opening += 1
+            try:
+                conn = await self._open()
+            finally:
+                self._opening -= 1
+            self._connections.append(conn)
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Yield a pooled connection; commit on success, roll back on error."""
+        async with self.acquire() as conn:
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            await conn.commit()
+
+    async def close(self):
+        connections = self._connections
+        self._connections = []
+        self._idle = None
+        self._loop = None
+        for conn in connections:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+
+_async_pools: dict[str, AsyncConnectionPool] = {}
+
+
+def get_async_pool(path: Optional[str] = None) -> AsyncConnectionPool:
+    """Return the process-wide async pool for path (default DB_PATH)."""
+    settings = get_settings()
+    path = path or settings.DB_PATH
+    pool = _async_pools.get(path)
+    if pool is None:
+        pool = _async_pools[path] = AsyncConnectionPool(path, settings.DB_ASYNC_POOL_SIZE)
+    return pool
+
+
+async def close_all_async() -> None:
+    """Close every async pool (call on shutdown)."""
+    pools = list(_async_pools.values())
+    _async_pools.clear()
+    for pool in pools:
+        await pool.close()
@@ -3,6 +3,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
 from app.core.logging import setup_logging
 from app.api.v1 import api_router
+from app.api.v1.endpoints.health import health_status
+from app.core.db import close_all as close_db_connections, close_all_async as close_async_db_connections
+from app.services.fraud.history import async_history_service, history_service, transaction_writer
+from app.services.fraud import store as engine_config_store
+from app.services.fraud.ai.jobs import ai_jobs
+from app.services.fraud.beneficiaries import beneficiary_pairs
+from app.services.fraud.ai.runtime import close_agent, start_agent
+import asyncio
 import logging
 
 # Load Settings
@@ -22,15 +30,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+_background_tasks: list[asyncio.Task] = []
+
+
+async def _run_periodically(name: str, job, interval_seconds: float, unit: str = "rows"):
+    """Run an async maintenance job now and then every interval; errors are logged."""
+    while True:
+        try:
+            result = await job()
+            if result:
+                logger.info(f"{name}: {result} {unit}")
+        except Exception as e:
+            logger.error(f"{name} failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def _archive_cold_transactions():
+    return await asyncio.to_thread(history_service.archive_cold_transactions)
+
+
+async def _load_beneficiary_filter():
+    try:
+        pairs = await asyncio.to_thread(history_service.load_beneficiary_filter)
+        logger.info(f"Beneficiary filter loaded with {pairs} pairs")
+    except Exception as e:
+        logger.error(f"Beneficiary filter load failed; counts are read from SQL: {e}")
+
+
+async def _reconcile_daily_ledger():
+    return await asyncio.to_thread(history_service.reconcile_daily_ledger)
+
+
+async def _reload_engine_config():
+    engine_config_store.reload_if_changed()
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Fraud Detection Service Starting up...")
+    if settings.WRITE_BEHIND_ENABLED:
+        transaction_writer.start()
+    # Compile the agent and open the checkpoint DB once, not per escalation
+    await start_agent()
+    ai_jobs.start()
+    if beneficiary_pairs.filter_enabled:
+        _background_tasks.append(asyncio.create_task(_load_beneficiary_filter()))
+    settled = await async_history_service.settle_stale_ai_decisions(settings.AI_ASYNC_STALE_SECONDS)
+    if settled:
+        logger.warning(f"Sent {settled} stale PENDING_AI transactions to REVIEW")
+    _background_tasks.append(asyncio.create_task(_run_periodically(
+        "Hour-rollup compaction",
+        async_history_service.compact_hour_rollup,
+        settings.HOUR_ROLLUP_COMPACTION_INTERVAL_SECONDS,
+    )))
+    _background_tasks.append(asyncio.create_task(_run_periodically(
+        "Cold-tier archiving", _archive_cold_transactions, settings.ARCHIVE_INTERVAL_SECONDS,
+    )))
+    _background_tasks.append(asyncio.create_task(_run_periodically(
+        "Daily-ledger reconciliation",
+        _reconcile_daily_ledger,
+        settings.DAILY_LEDGER_RECONCILE_INTERVAL_SECONDS,
+        unit="accounts corrected",
+    )))
+    if settings.ENGINE_CONFIG_RELOAD_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(_run_periodically(
+            "Engine config reload", _reload_engine_config, settings.ENGINE_CONFIG_RELOAD_INTERVAL_SECONDS,
+        )))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the agent runs first: a finishing run still queues its decision update
+    await ai_jobs.stop(settings.AI_ASYNC_SHUTDOWN_TIMEOUT_SECONDS)
+    # Flush queued transaction rows before the connections go away
+    await transaction_writer.stop()
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await close_agent()
+    await close_async_db_connections()
+    close_db_connections()
 
 
 @app.get("/health")
 async def root_health():
     """Health at root for load balancers and existing systems."""
-    return {"status": "ok", "service": "fraud-middleware"}
+    return health_status()
 
 
 app.include_router(api_router, prefix="/api/v1")
@@ -26,13 +26,14 @@ llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=settings.OPENAI_API
 # Bind tools to LLM
 llm_with_tools = llm.bind_tools(tools)
 
-def agent_node(state: AgentState):
+async def agent_node(state: AgentState):
     messages = state["messages"]
     # If the first message is not SystemMessage, add it.
     if not isinstance(messages[0], SystemMessage):
         messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
         
-    response = llm_with_tools.invoke(messages)
+    # Native async call: no worker thread per request, and a gateway deadline cancels the HTTP call itself
+    response = await llm_with_tools.ainvoke(messages)
     return {"messages": [response]}
 
 def human_review_node(state: AgentState):
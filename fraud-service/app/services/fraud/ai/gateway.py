@@ -0,0 +1,227 @@
+"""
+Admission control for AI agent calls (STEP 4 in service.py).
+
+Every agent run goes through AIGateway.call, which in order:
+  - rejects at once while the circuit breaker is open ("circuit_open"),
+  - takes a token from a token bucket of AI_GATEWAY_RATE_PER_SECOND with bursts
+    of AI_GATEWAY_BURST ("rate_limited"),
+  - waits at most AI_GATEWAY_QUEUE_TIMEOUT_SECONDS for one of
+    AI_GATEWAY_MAX_CONCURRENCY slots ("saturated"),
+  - runs the call under a deadline of AI_GATEWAY_DEADLINE_SECONDS, counted from
+    admission so the queue wait is included ("timeout"),
+and raises AIGatewayRejected with that reason instead of waiting on the
+provider; a provider error is re-raised as AIGatewayRejected("error").
+
+The breaker opens after AI_GATEWAY_BREAKER_FAILURES consecutive failures, where
+a timeout, an error or a call slower than AI_GATEWAY_BREAKER_SLOW_CALL_SECONDS
+is a failure. After AI_GATEWAY_BREAKER_OPEN_SECONDS one probe call is let
+through (half-open): success closes the breaker, failure opens it again.
+
+The caller turns a rejection into a rule-based decision, so a scan's latency
+stays bounded by the deadline when the provider is slow or down.
+
+State lives on the event loop (no locks) and, like the other in-memory state,
+is per process.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.core.config import get_settings
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+REJECT_CIRCUIT_OPEN = "circuit_open"
+REJECT_RATE_LIMITED = "rate_limited"
+REJECT_SATURATED = "saturated"
+REJECT_TIMEOUT = "timeout"
+REJECT_ERROR = "error"
+
+
+class AIGatewayRejected(Exception):
+    """The agent call was not admitted or did not complete; `reason` is one of REJECT_*."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; rate <= 0 means unlimited."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record(self, ok: bool) -> None:
+        self._probe_in_flight = False
+        if ok:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened += 1
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """An admitted probe never ran (rejected further on); let the next one through."""
+        self._probe_in_flight = False
+
+
+class AIGateway:
+    """Concurrency cap, rate limit, deadline and circuit breaker around agent calls."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        queue_timeout_seconds: float,
+        deadline_seconds: float,
+        rate_per_second: float,
+        burst: int,
+        breaker_failures: int,
+        breaker_open_seconds: float,
+        slow_call_seconds: float,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_open_seconds)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.completed = 0
+        self.slow_calls = 0
+        self.rejected: dict[str, int] = {
+            reason: 0
+            for reason in (REJECT_CIRCUIT_OPEN, REJECT_RATE_LIMITED, REJECT_SATURATED, REJECT_TIMEOUT, REJECT_ERROR)
+        }
+
+    def _reject(self, reason: str, detail: str = "") -> AIGatewayRejected:
+        self.rejected[reason] += 1
+        return AIGatewayRejected(reason, detail)
+
+    async def call(self, run: Callable[[], Awaitable[T]]) -> T:
+        """Await run() if admitted and within the deadline; raises AIGatewayRejected otherwise."""
+        self.calls += 1
+        if not self.breaker.allow():
+            raise self._reject(REJECT_CIRCUIT_OPEN)
+        if not self.bucket.take():
+            self.breaker.release()
+            raise self._reject(REJECT_RATE_LIMITED)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(), timeout=min(self.queue_timeout_seconds, self.deadline_seconds)
+            )
+        except asyncio.TimeoutError:
+            self.breaker.release()
+            raise self._reject(REJECT_SATURATED) from None
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+
+        self.in_flight += 1
+        try:
+            remaining = self.deadline_seconds - (time.monotonic() - started)
+            called = time.monotonic()
+            try:
+                result = await asyncio.wait_for(run(), timeout=max(remaining, 0.001))
+            except asyncio.TimeoutError:
+                self.breaker.record(False)
+                raise self._reject(REJECT_TIMEOUT, f"no answer within {self.deadline_seconds:g}s") from None
+            except asyncio.CancelledError:
+                # The scan itself was cancelled; says nothing about the provider
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.breaker.record(False)
+                raise self._reject(REJECT_ERROR, str(e)) from e
+            elapsed = time.monotonic() - called
+            slow = elapsed > self.slow_call_seconds
+            if slow:
+                self.slow_calls += 1
+            self.breaker.record(not slow)
+            self.completed += 1
+            return result
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def report(self) -> dict:
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "breaker_opened": self.breaker.opened,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "deadline_seconds": self.deadline_seconds,
+            "calls": self.calls,
+            "completed": self.completed,
+            "slow_calls": self.slow_calls,
+            "rejected": dict(self.rejected),
+        }
+
+
+def _build_ai_gateway() -> AIGateway:
+    settings = get_settings()
+    return AIGateway(
+        max_concurrency=settings.AI_GATEWAY_MAX_CONCURRENCY,
+        queue_timeout_seconds=settings.AI_GATEWAY_QUEUE_TIMEOUT_SECONDS,
+        deadline_seconds=settings.AI_GATEWAY_DEADLINE_SECONDS,
+        rate_per_second=settings.AI_GATEWAY_RATE_PER_SECOND,
+        burst=settings.AI_GATEWAY_BURST,
+        breaker_failures=settings.AI_GATEWAY_BREAKER_FAILURES,
+        breaker_open_seconds=settings.AI_GATEWAY_BREAKER_OPEN_SECONDS,
+        slow_call_seconds=settings.AI_GATEWAY_BREAKER_SLOW_CALL_SECONDS,
+    )
+
+
+ai_gateway = _build_ai_gateway()
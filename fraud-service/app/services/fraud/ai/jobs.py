@@ -0,0 +1,196 @@
+"""
+Background AI decisions for the async mode of /middleware/check and /evaluate.
+
+With async_ai set, a scan that escalates to the agent (STEP 4 in service.py) logs
+a provisional PENDING_AI row and returns at once; the agent run is queued here and
+picked up by one of AI_ASYNC_WORKERS worker tasks. The queue holds at most
+AI_ASYNC_QUEUE_SIZE runs: when it is full, submit() refuses and the scan gets the
+gateway's rule-based decision instead. Each run writes its final decision to the
+history table itself.
+
+Results are kept by transaction_id (the AI_ASYNC_RESULTS_MAX most recent) for
+GET /middleware/decision/{transaction_id}, which can long-poll with wait(); older
+ones are answered from the history table. At shutdown the workers get
+AI_ASYNC_SHUTDOWN_TIMEOUT_SECONDS to finish the queue; every run still queued or
+in flight after that gets its rule-based decision written instead (degraded, reason
+"shutdown"), so no row is left PENDING_AI. Rows a crashed process left behind are
+settled at startup (AsyncTransactionHistory.settle_stale_ai_decisions).
+
+Like the other in-memory state this is per process.
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+DONE = "DONE"
+
+# degraded_reason of the decisions written for runs cut off by shutdown
+DEGRADED_SHUTDOWN = "shutdown"
+
+
+class _Job:
+    __slots__ = ("ticket_id", "status", "result", "done", "fallback")
+
+    def __init__(self, ticket_id: str, provisional: dict, fallback: Callable[[], Awaitable[dict]]):
+        self.ticket_id = ticket_id
+        self.status = PENDING
+        self.result = provisional
+        self.done = asyncio.Event()
+        self.fallback = fallback
+
+    def finish(self, result: dict) -> None:
+        self.result = result
+        self.status = DONE
+        self.done.set()
+
+
+class AIDecisionJobs:
+    """Bounded queue of agent runs drained by a fixed number of worker tasks."""
+
+    def __init__(self, workers: int, queue_size: int, max_results: int):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.max_results = max(1, max_results)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        # Jobs a worker is running right now
+        self._active: set[_Job] = set()
+        self._stopping = False
+        # transaction_id -> job, oldest first
+        self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.refused = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        """Start the workers on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        Let the workers finish the queued runs for up to timeout seconds, then cancel
+        them and write the fallback decision of every run still queued or in flight.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        in_flight = list(self._active)
+        self._active.clear()
+        queued = []
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait()[0])
+        for job in in_flight + queued:
+            try:
+                job.finish(await job.fallback())
+            except Exception as e:
+                logger.error(f"AI decision job {job.ticket_id}: fallback decision failed: {e}", exc_info=True)
+        if in_flight or queued:
+            logger.warning(
+                f"AI decision jobs: {len(queued)} queued and {len(in_flight)} in-flight runs cut off "
+                f"at shutdown; wrote their rule-based decisions"
+            )
+
+    def submit(
+        self,
+        transaction_id: str,
+        provisional: dict,
+        run: Callable[[], Awaitable[dict]],
+        fallback: Callable[[], Awaitable[dict]],
+    ) -> Optional[str]:
+        """
+        Queue run() (returns the final decision dict) for a transaction whose
+        provisional result was returned to the client. fallback() records and
+        returns the decision to use if shutdown cuts the run off. Returns the ticket
+        id, or None if the workers are not running or the queue is full.
+        """
+        if not self.running or self._stopping or self._queue.full():
+            self.refused += 1
+            return None
+        job = _Job(uuid.uuid4().hex, provisional, fallback)
+        self._queue.put_nowait((job, run))
+        self._jobs[transaction_id] = job
+        self._jobs.move_to_end(transaction_id)
+        while len(self._jobs) > self.max_results:
+            self._jobs.popitem(last=False)
+        self.submitted += 1
+        return job.ticket_id
+
+    def get(self, transaction_id: str) -> Optional[tuple[str, str, dict]]:
+        """(status, ticket_id, result) for a submitted transaction, or None."""
+        job = self._jobs.get(transaction_id)
+        if job is None:
+            return None
+        return job.status, job.ticket_id, job.result
+
+    async def wait(self, transaction_id: str, timeout: float) -> Optional[tuple[str, str, dict]]:
+        """Like get(), waiting up to timeout seconds for a pending run to finish."""
+        job = self._jobs.get(transaction_id)
+        if job is not None and job.status == PENDING and timeout > 0:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(transaction_id)
+
+    async def _work(self):
+        while True:
+            job, run = await self._queue.get()
+            self._active.add(job)
+            try:
+                result = await run()
+                self.completed += 1
+            except Exception as e:
+                logger.error(f"AI decision job {job.ticket_id} failed: {e}", exc_info=True)
+                result = {"decision": "REVIEW", "score": 50, "reason": f"System Error: {str(e)}"}
+                self.failed += 1
+            finally:
+                # Left in _active when cancelled, so stop() settles it
+                self._queue.task_done()
+            self._active.discard(job)
+            job.finish(result)
+
+    def report(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._active),
+            "queue_size": self.queue_size,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "refused": self.refused,
+        }
+
+
+def _build_ai_jobs() -> AIDecisionJobs:
+    settings = get_settings()
+    return AIDecisionJobs(settings.AI_ASYNC_WORKERS, settings.AI_ASYNC_QUEUE_SIZE, settings.AI_ASYNC_RESULTS_MAX)
+
+
+ai_jobs = _build_ai_jobs()
@@ -1,6 +1,7 @@
 import sqlite3
 import json
 from app.core.config import get_settings
+from app.core.db import read_cursor, transaction as db_transaction
 
 class SQLiteMemory:
     def __init__(self):
@@ -9,7 +10,7 @@ class SQLiteMemory:
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with db_transaction(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS chat_history (
@@ -21,21 +22,17 @@ class SQLiteMemory:
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """)
-            conn.commit()
 
     def add_message(self, session_id, role, content, tool_calls=None):
-        with sqlite3.connect(self.db_path) as conn:
+        with db_transaction(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO chat_history (session_id, role, content, tool_calls)
                 VALUES (?, ?, ?, ?)
             """, (session_id, role, content, json.dumps(tool_calls) if tool_calls else None))
-            conn.commit()
 
     def get_messages(self, session_id):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with read_cursor(self.db_path, sqlite3.Row) as cursor:
             cursor.execute("""
                 SELECT role, content, tool_calls FROM chat_history
                 WHERE session_id = ?
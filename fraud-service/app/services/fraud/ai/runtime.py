@@ -0,0 +1,88 @@
+"""
+The compiled agent shared by every scan and review.
+
+The graph in agent.py is compiled once, against one long-lived AsyncSqliteSaver
+on CHECKPOINTS_DB_PATH (WAL, so review reads don't block scan writes), when the
+app starts; evaluate_transaction and POST /review/{transaction_id} both get it
+from get_agent(). Neither graph compilation nor opening the checkpoint DB is
+part of a request any more.
+
+The saver and its connection belong to the event loop they were created on; a
+request on another loop (e.g. a fresh test client) builds a new pair, the same
+way the async connection pool in app/core/db.py does.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from app.core.config import get_settings
+from app.services.fraud.ai.agent import workflow
+
+logger = logging.getLogger(__name__)
+
+_agent = None
+_conn: Optional[aiosqlite.Connection] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock: Optional[asyncio.Lock] = None
+
+
+async def _open_checkpointer() -> AsyncSqliteSaver:
+    settings = get_settings()
+    conn = await aiosqlite.connect(settings.CHECKPOINTS_DB_PATH, timeout=settings.DB_BUSY_TIMEOUT_SECONDS)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    checkpointer = AsyncSqliteSaver(conn)
+    await checkpointer.setup()
+    return checkpointer
+
+
+def _bind_loop() -> asyncio.Lock:
+    global _agent, _conn, _loop, _lock
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        if _conn is not None:
+            _conn.stop()
+        _agent = None
+        _conn = None
+        _lock = asyncio.Lock()
+        _loop = loop
+    return _lock
+
+
+async def get_agent():
+    """The compiled agent (with checkpointer) for the running loop, built on first use."""
+    lock = _bind_loop()
+    if _agent is not None:
+        return _agent
+    async with lock:
+        if _agent is None:
+            await _start()
+    return _agent
+
+
+async def _start() -> None:
+    global _agent, _conn
+    checkpointer = await _open_checkpointer()
+    _conn = checkpointer.conn
+    _agent = workflow.compile(checkpointer=checkpointer, interrupt_before=["human_review"])
+    logger.info(f"AI agent compiled with checkpoints in {get_settings().CHECKPOINTS_DB_PATH}")
+
+
+async def start_agent() -> None:
+    """Compile the agent at startup so the first escalation doesn't pay for it."""
+    await get_agent()
+
+
+async def close_agent() -> None:
+    """Close the checkpoint connection (shutdown)."""
+    global _agent, _conn, _loop
+    if _conn is not None and _loop is asyncio.get_running_loop():
+        await _conn.close()
+    elif _conn is not None:
+        _conn.stop()
+    _agent = None
+    _conn = None
+    _loop = None
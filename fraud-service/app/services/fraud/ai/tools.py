@@ -1,4 +1,5 @@
 from langchain.tools import tool
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
 import random
 from app.services.fraud.history import history_service
 
@@ -17,10 +18,7 @@ def get_recent_transaction_count(account_id: str, minutes: int = 10) -> int:
 def _check_beneficiary_history_logic(from_account: str, to_account: str) -> str:
     """Core logic for checking beneficiary history, decoupled from LangChain tool."""
     try:
-        count = history_service.get_beneficiary_count(from_account, to_account)
-        if count > 0:
-            return f"History Found: {count} previous transactions to {to_account}."
-        return "No previous transactions found to this beneficiary. Logic: New Beneficiary Risk."
+        return _format_beneficiary_history(history_service.get_beneficiary_count(from_account, to_account), to_account)
     except Exception as e:
         return f"Error checking beneficiary history: {str(e)}"
 
@@ -41,23 +39,67 @@ def get_pattern_summary(from_account: str, to_account: str) -> str:
     Use this to decide if the transaction is high velocity, new beneficiary, or amount spike.
     """
     try:
-        stats = history_service.get_pattern_stats(from_account, to_account)
-        recent = stats.get("recent_count_10m", 0)
-        ben_count = stats.get("beneficiary_count", 0)
-        am = stats.get("amount_stats_24h") or {}
-        avg_a = am.get("avg_amount") or 0
-        max_a = am.get("max_amount") or 0
-        n_24h = am.get("transaction_count") or 0
-        return (
-            f"Velocity: {recent} outbound transactions in last 10 minutes. "
-            f"Beneficiary history: {ben_count} past transactions to this payee. "
-            f"Last 24h: {n_24h} transactions, avg amount ${avg_a:,.0f}, max ${max_a:,.0f}. "
-            f"New beneficiary: {'Yes' if ben_count == 0 else 'No'}."
-        )
+        return _format_pattern_summary(history_service.get_pattern_stats(from_account, to_account))
     except Exception as e:
         return f"Error getting pattern summary: {str(e)}"
 
 
+def _format_beneficiary_history(count: int, to_account: str) -> str:
+    if count > 0:
+        return f"History Found: {count} previous transactions to {to_account}."
+    return "No previous transactions found to this beneficiary. Logic: New Beneficiary Risk."
+
+
+def _format_pattern_summary(stats: dict) -> str:
+    recent = stats.get("recent_count_10m", 0)
+    ben_count = stats.get("beneficiary_count", 0)
+    am = stats.get("amount_stats_24h") or {}
+    avg_a = am.get("avg_amount") or 0
+    max_a = am.get("max_amount") or 0
+    n_24h = am.get("transaction_count") or 0
+    return (
+        f"Velocity: {recent} outbound transactions in last 10 minutes. "
+        f"Beneficiary history: {ben_count} past transactions to this payee. "
+        f"Last 24h: {n_24h} transactions, avg amount ${avg_a:,.0f}, max ${max_a:,.0f}. "
+        f"New beneficiary: {'Yes' if ben_count == 0 else 'No'}."
+    )
+
+
+def prefetched_tool_messages(from_account: str, to_account: str, stats: dict) -> list[BaseMessage]:
+    """
+    The required tool checks (velocity, beneficiary, pattern summary) answered from
+    the scan's feature snapshot, as one tool-calling AIMessage plus its ToolMessages.
+    Appended to the agent's initial messages so the model can decide in one turn
+    instead of calling each tool (and re-reading SQLite) first. Contents are exactly
+    what the tools would return for the same history.
+    """
+    results = [
+        (
+            "get_recent_transaction_count",
+            {"account_id": from_account, "minutes": 10},
+            str(stats.get("recent_count_10m", 0)),
+        ),
+        (
+            "check_beneficiary_history",
+            {"from_account": from_account, "to_account": to_account},
+            _format_beneficiary_history(stats.get("beneficiary_count", 0), to_account),
+        ),
+        (
+            "get_pattern_summary",
+            {"from_account": from_account, "to_account": to_account},
+            _format_pattern_summary(stats),
+        ),
+    ]
+    calls = [
+        {"name": name, "args": args, "id": f"prefetch_{name}", "type": "tool_call"}
+        for name, args, _ in results
+    ]
+    return [AIMessage(content="", tool_calls=calls)] + [
+        ToolMessage(content=content, name=name, tool_call_id=f"prefetch_{name}")
+        for name, _, content in results
+    ]
+
+
 @tool
 def fraud(transaction_details: str) -> str:
     """
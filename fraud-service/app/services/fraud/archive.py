@@ -0,0 +1,282 @@
+"""
+Cold storage for transactions that left the hot SQLite table.
+
+One append-only segment file per UTC day holds zlib-compressed JSON blocks of rows
+(one block per sender per archive run). A small JSON index next to it maps each
+account, as sender or beneficiary, to the (offset, length) of the blocks that
+mention it, so a lookup only decompresses what it needs. A Bloom filter of the
+index's accounts (.accounts) lets a lookup skip days the account never appears in
+without parsing the index; both are held in memory in bounded LRUs.
+
+Segments are written before the rows are deleted from SQLite, then the filter and
+the index are each replaced atomically, filter first, so a reader never sees an
+index whose accounts the filter lacks. A crash in between leaves at most unindexed
+bytes or rows archived twice (readers dedupe by transaction_id). Readers take no
+lock over file I/O: blocks are never rewritten, and a day purged mid-read reads
+as empty.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from app.core.config import get_settings
+from app.services.fraud.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+# Row layout, same as history._transaction_row
+ROW_FIELDS = (
+    "transaction_id", "from_account", "to_account", "amount", "timestamp",
+    "ts_epoch", "decision", "risk_score", "reason",
+)
+_SEGMENT_RE = re.compile(r"^transactions-(\d{8})\.seg$")
+# False-positive rate of the per-day account filters
+_FILTER_FP_RATE = 0.01
+
+
+def _day_name(day: int) -> str:
+    return datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _name_day(name: str) -> int:
+    dt = datetime.strptime(name, "%Y%m%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp()) // 86400
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _account_filter(index: dict) -> BloomFilter:
+    bloom = BloomFilter(len(index), _FILTER_FP_RATE)
+    for account in index:
+        bloom.add(account.encode())
+    return bloom
+
+
+class SegmentArchive:
+    """Per-day compressed segment files under one directory; thread-safe."""
+
+    def __init__(
+        self,
+        root: str,
+        compression_level: int = 6,
+        index_cache_days: int = 16,
+        filter_cache_days: int = 400,
+    ):
+        self.root = root
+        self.compression_level = compression_level
+        self.index_cache_days = max(1, index_cache_days)
+        self.filter_cache_days = max(1, filter_cache_days)
+        # day -> (file mtime, {account: [[offset, length], ...]}), LRU order
+        self._indexes: "OrderedDict[int, tuple[float, dict]]" = OrderedDict()
+        # day -> (file mtime, Bloom filter of the index's accounts), LRU order
+        self._filters: "OrderedDict[int, tuple[float, BloomFilter]]" = OrderedDict()
+        # Guards the two caches only; never held over file I/O
+        self._lock = threading.Lock()
+        # Serialises writers (append, purge, filter backfill)
+        self._write_lock = threading.Lock()
+
+    def _segment_path(self, day: int) -> str:
+        return os.path.join(self.root, f"transactions-{_day_name(day)}.seg")
+
+    def _index_path(self, day: int) -> str:
+        return os.path.join(self.root, f"transactions-{_day_name(day)}.idx.json")
+
+    def _filter_path(self, day: int) -> str:
+        return os.path.join(self.root, f"transactions-{_day_name(day)}.accounts")
+
+    def days(self) -> list[int]:
+        """Archived days, newest first."""
+        if not os.path.isdir(self.root):
+            return []
+        days = [
+            _name_day(match.group(1))
+            for match in map(_SEGMENT_RE.match, os.listdir(self.root)) if match
+        ]
+        return sorted(days, reverse=True)
+
+    def _cached(self, cache: OrderedDict, day: int, mtime: float):
+        with self._lock:
+            entry = cache.get(day)
+            if entry is None or entry[0] != mtime:
+                return None
+            cache.move_to_end(day)
+            return entry[1]
+
+    def _cache(self, cache: OrderedDict, limit: int, day: int, mtime: float, value) -> None:
+        with self._lock:
+            cache[day] = (mtime, value)
+            cache.move_to_end(day)
+            while len(cache) > limit:
+                cache.popitem(last=False)
+
+    def _forget(self, day: int) -> None:
+        with self._lock:
+            self._indexes.pop(day, None)
+            self._filters.pop(day, None)
+
+    def _load_index(self, day: int) -> tuple[float, dict]:
+        """(mtime, index) for the day; (0.0, {}) if it has none."""
+        path = self._index_path(day)
+        try:
+            mtime = os.path.getmtime(path)
+            index = self._cached(self._indexes, day, mtime)
+            if index is None:
+                with open(path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                self._cache(self._indexes, self.index_cache_days, day, mtime, index)
+        except FileNotFoundError:
+            return 0.0, {}
+        return mtime, index
+
+    def _load_filter(self, day: int) -> Optional[BloomFilter]:
+        path = self._filter_path(day)
+        try:
+            mtime = os.path.getmtime(path)
+            bloom = self._cached(self._filters, day, mtime)
+            if bloom is None:
+                with open(path, "rb") as f:
+                    bloom = BloomFilter.from_bytes(f.read())
+                self._cache(self._filters, self.filter_cache_days, day, mtime, bloom)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Corrupt account filter {path}; reading the index instead")
+            return None
+        return bloom
+
+    def _backfill_filter(self, day: int, index_mtime: float, index: dict) -> None:
+        """Write the filter for a day archived before filters existed."""
+        with self._write_lock:
+            try:
+                # An append since the index was read would make this filter stale
+                if os.path.getmtime(self._index_path(day)) != index_mtime:
+                    return
+            except FileNotFoundError:
+                return
+            _write_atomic(self._filter_path(day), _account_filter(index).to_bytes())
+
+    def _might_hold(self, day: int, account: str) -> bool:
+        bloom = self._load_filter(day)
+        if bloom is not None:
+            return account.encode() in bloom
+        mtime, index = self._load_index(day)
+        if index:
+            self._backfill_filter(day, mtime, index)
+        return account in index
+
+    def append_day(self, day: int, rows: list[tuple]) -> None:
+        """Append rows (all from one UTC day) as one block per sender, then re-index."""
+        by_sender: dict[str, list] = defaultdict(list)
+        for row in rows:
+            by_sender[row[1]].append(list(row))
+        with self._write_lock:
+            os.makedirs(self.root, exist_ok=True)
+            index = {account: list(blocks) for account, blocks in self._load_index(day)[1].items()}
+            with open(self._segment_path(day), "ab") as segment:
+                offset = segment.tell()
+                for sender_rows in by_sender.values():
+                    block = zlib.compress(
+                        json.dumps(sender_rows, separators=(",", ":")).encode(), self.compression_level
+                    )
+                    segment.write(block)
+                    for account in {r[1] for r in sender_rows} | {r[2] for r in sender_rows}:
+                        index.setdefault(account, []).append([offset, len(block)])
+                    offset += len(block)
+                segment.flush()
+                os.fsync(segment.fileno())
+            _write_atomic(self._filter_path(day), _account_filter(index).to_bytes())
+            _write_atomic(self._index_path(day), json.dumps(index, separators=(",", ":")).encode())
+            self._forget(day)
+
+    def _read_day(self, day: int, account: str) -> list[tuple]:
+        blocks = self._load_index(day)[1].get(account)
+        if not blocks:
+            return []
+        rows = []
+        try:
+            with open(self._segment_path(day), "rb") as segment:
+                for offset, length in blocks:
+                    segment.seek(offset)
+                    for row in json.loads(zlib.decompress(segment.read(length))):
+                        if row[1] == account or row[2] == account:
+                            rows.append(tuple(row))
+        except FileNotFoundError:
+            # Purged while we were reading
+            return []
+        return rows
+
+    def account_rows(
+        self,
+        account: str,
+        limit: int,
+        exclude: Iterable[str] = (),
+        before: Optional[tuple[int, str]] = None,
+    ) -> list[tuple]:
+        """
+        Latest archived rows where the account is sender or beneficiary, newest first
+        by (ts_epoch, transaction_id), optionally strictly before that cursor.
+        """
+        seen = set(exclude)
+        found: list[tuple] = []
+        for day in self.days():
+            if len(found) >= limit:
+                break
+            if before is not None and day > before[0] // 86400:
+                continue
+            if not self._might_hold(day, account):
+                continue
+            day_rows = sorted(self._read_day(day, account), key=lambda r: (r[5] or 0, r[0]), reverse=True)
+            for row in day_rows:
+                if before is not None and (row[5] or 0, row[0]) >= before:
+                    continue
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    found.append(row)
+        return found[:limit]
+
+    def purge_before(self, day: int) -> int:
+        """Delete segments (and their indexes) for days before `day`. Returns segments removed."""
+        removed = 0
+        with self._write_lock:
+            for archived_day in self.days():
+                if archived_day >= day:
+                    continue
+                for path in (
+                    self._segment_path(archived_day),
+                    self._index_path(archived_day),
+                    self._filter_path(archived_day),
+                ):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._forget(archived_day)
+                removed += 1
+        if removed:
+            logger.info(f"Purged {removed} archived day segment(s) past retention")
+        return removed
+
+
+def _build_segment_archive() -> SegmentArchive:
+    settings = get_settings()
+    return SegmentArchive(
+        settings.ARCHIVE_DIR,
+        index_cache_days=settings.ARCHIVE_INDEX_CACHE_DAYS,
+        filter_cache_days=settings.ARCHIVE_FILTER_CACHE_DAYS,
+    )
+
+
+segment_archive = _build_segment_archive()
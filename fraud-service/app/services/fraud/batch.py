@@ -0,0 +1,96 @@
+"""
+Batch scoring for POST /middleware/evaluate/batch and /middleware/check/batch.
+
+A batch is scored in three phases:
+  1. The features of every distinct sender and pair are loaded up front, one
+     set-based query per source (history warm_feature_caches).
+  2. STEPs 1-3 of evaluate_transaction run for every transaction from memory.
+     One sender's transactions are scored one after another in request order, so
+     each one's velocity, pair count, hour histogram and daily total include the
+     ones before it; different senders run concurrently, at most
+     BATCH_MAX_CONCURRENT_ACCOUNTS at a time. Escalations are logged as PENDING_AI and set aside instead of
+     waiting for the agent.
+  3. The residual set goes to the agent, at most AI_GATEWAY_MAX_CONCURRENCY runs
+     at a time (more would only queue in the gateway), and each final decision
+     replaces its PENDING_AI row.
+
+Rows go through the write-behind queue like single scans, so they are committed
+in groups of up to WRITE_BATCH_SIZE rather than one commit per transaction.
+"""
+import asyncio
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from app.core.config import get_settings
+from app.models.transaction import Transaction
+from app.services.fraud.history import async_history_service
+from app.services.fraud.service import evaluate_transaction
+
+
+async def evaluate_batch(
+    transactions: list[Transaction],
+    admit: Optional[Callable[[int], Awaitable[Optional[dict]]]] = None,
+    release: Optional[Callable[[int], None]] = None,
+) -> list[dict]:
+    """
+    Score `transactions`; returns one result per transaction, in order.
+    admit(i), if given, runs right before transaction i is scored (in its sender's
+    order) and returns None to score it or a result to use instead (e.g. a limit
+    rejection); release(i) runs after an admitted transaction was scored.
+    """
+    settings = get_settings()
+    hour_counts = await async_history_service.warm_feature_caches(
+        (t.from_account for t in transactions), ((t.from_account, t.to_account) for t in transactions)
+    )
+
+    results: list[Optional[dict]] = [None] * len(transactions)
+    # (index, run) of escalations left for the agent
+    residual: list[tuple[int, Callable[[], Awaitable[dict]]]] = []
+
+    async def _score(i: int) -> None:
+        transaction = transactions[i]
+        if admit is not None:
+            rejected = await admit(i)
+            if rejected is not None:
+                results[i] = rejected
+                return
+
+        def _set_aside(transaction_id: str, provisional: dict, run, fallback) -> str:
+            residual.append((i, run))
+            return uuid.uuid4().hex
+
+        counts = hour_counts.get(transaction.from_account)
+        preloaded = {"hour_counts_7d": dict(counts)} if counts is not None else None
+        try:
+            results[i] = await evaluate_transaction(
+                transaction, defer_ai=True, submit_ai=_set_aside, preloaded=preloaded
+            )
+        finally:
+            if release is not None:
+                release(i)
+        if counts is not None:
+            # The histogram is read from committed rows; count this one for the sender's next ones
+            counts[datetime.utcnow().hour] += 1
+
+    by_account: dict[str, list[int]] = defaultdict(list)
+    for i, transaction in enumerate(transactions):
+        by_account[transaction.from_account].append(i)
+    accounts = asyncio.Semaphore(max(1, settings.BATCH_MAX_CONCURRENT_ACCOUNTS))
+
+    async def _score_account(indices: list[int]) -> None:
+        async with accounts:
+            for i in indices:
+                await _score(i)
+
+    await asyncio.gather(*(_score_account(indices) for indices in by_account.values()))
+
+    agent_slots = asyncio.Semaphore(max(1, settings.AI_GATEWAY_MAX_CONCURRENCY))
+
+    async def _decide(i: int, run: Callable[[], Awaitable[dict]]) -> None:
+        async with agent_slots:
+            results[i] = await run()
+
+    await asyncio.gather(*(_decide(i, run) for i, run in residual))
+    return results
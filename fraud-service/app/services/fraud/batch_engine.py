@@ -0,0 +1,359 @@
+"""
+Vectorized scoring for bulk work (nightly re-scoring, imports).
+
+score_batch runs basic_rule_check, pattern_check, detect_anomalies_and_patterns
+and the static part of evaluate_transaction (the static-rule BLOCK exit, combining,
+fast-track ALLOW and high-confidence BLOCK) over columnar NumPy arrays, one vector
+operation per rule. Scores and decisions are identical to the scalar functions in
+engine.py and service.py; instead of reason strings each row gets a bitmask
+(RuleFlag, PatternFlag, AnomalyFlag) that describe() turns back into flag names.
+Rows blocked by the static rules alone still get their pattern and anomaly
+columns, although evaluate_transaction never computes those for them.
+
+It mirrors the built-in rule pack (builtin_rules.json): keep it in step when a
+built-in rule changes (tests/test_batch_engine_parity.py catches drift). Custom
+rules (CUSTOM_RULES_PATH) are not applied here.
+
+This is a library entry point: the service itself scores through
+evaluate_transaction, and bulk jobs call score_batch with columns built by
+BatchColumns.from_snapshots.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from enum import IntFlag
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from app.services.fraud.devices import device_classifier
+from app.services.fraud.rules import ROUND_VALUES
+from app.services.fraud.store import EngineConfig, current as _current_engine_config
+
+ALLOW, REVIEW, BLOCK = 0, 1, 2
+DECISIONS = ("ALLOW", "REVIEW", "BLOCK")
+
+
+class RuleFlag(IntFlag):
+    NON_POSITIVE_AMOUNT = 1 << 0
+    HIGH_AMOUNT = 1 << 1
+    VERY_HIGH_AMOUNT = 1 << 2
+    SELF_TRANSFER = 1 << 3
+    SUSPICIOUS_DEVICE = 1 << 4
+
+
+class PatternFlag(IntFlag):
+    HIGH_VELOCITY = 1 << 0
+    ELEVATED_VELOCITY = 1 << 1
+    UNUSUAL_FREQUENCY = 1 << 2
+    NEW_BENEFICIARY_HIGH_AMOUNT = 1 << 3
+    NEW_BENEFICIARY_MEDIUM_AMOUNT = 1 << 4
+    NEW_BENEFICIARY_LOW_AMOUNT = 1 << 5
+    AMOUNT_SPIKE = 1 << 6
+    ABOVE_RECENT_MAX = 1 << 7
+
+
+class AnomalyFlag(IntFlag):
+    # Anomalies
+    AMOUNT_ANOMALY = 1 << 0
+    TIME_ANOMALY = 1 << 1
+    ROUND_AMOUNT = 1 << 2
+    # Patterns (no score)
+    RECURRING_BENEFICIARY = 1 << 3
+    CONSISTENT_AMOUNT = 1 << 4
+    # Anti-patterns
+    STRUCTURING = 1 << 5
+    MULTIPLE_NEW_BENEFICIARIES = 1 << 6
+    ROUND_AMOUNT_BURST = 1 << 7
+    BURST_TO_NEW_BENEFICIARY = 1 << 8
+
+
+@dataclass
+class BatchColumns:
+    """
+    One entry per transaction. hour_counts_7d is (n, 24) in hour order;
+    recent_amounts_10m is (n, k), zero-padded (0 is never a round amount).
+    """
+    amount: np.ndarray
+    recent_count_10m: np.ndarray
+    beneficiary_count: np.ndarray
+    avg_amount_24h: np.ndarray
+    max_amount_24h: np.ndarray
+    tx_count_24h: np.ndarray
+    unique_beneficiaries_10m: np.ndarray
+    hour_counts_7d: Optional[np.ndarray] = None
+    recent_amounts_10m: Optional[np.ndarray] = None
+    self_transfer: Optional[np.ndarray] = None
+    device_score: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        self.amount = np.asarray(self.amount, dtype=np.float64)
+        n = len(self.amount)
+        for name in ("recent_count_10m", "beneficiary_count", "tx_count_24h", "unique_beneficiaries_10m"):
+            setattr(self, name, np.asarray(getattr(self, name), dtype=np.int64))
+        self.avg_amount_24h = np.asarray(self.avg_amount_24h, dtype=np.float64)
+        self.max_amount_24h = np.asarray(self.max_amount_24h, dtype=np.float64)
+        self.hour_counts_7d = (
+            np.zeros((n, 24), dtype=np.int64) if self.hour_counts_7d is None
+            else np.asarray(self.hour_counts_7d, dtype=np.int64).reshape(n, 24)
+        )
+        # reshape(0, -1) can't infer the width of an empty batch
+        self.recent_amounts_10m = (
+            np.zeros((n, 0), dtype=np.float64) if self.recent_amounts_10m is None or n == 0
+            else np.asarray(self.recent_amounts_10m, dtype=np.float64).reshape(n, -1)
+        )
+        self.self_transfer = (
+            np.zeros(n, dtype=bool) if self.self_transfer is None else np.asarray(self.self_transfer, dtype=bool)
+        )
+        self.device_score = (
+            np.zeros(n, dtype=np.int64) if self.device_score is None
+            else np.asarray(self.device_score, dtype=np.int64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    @classmethod
+    def from_snapshots(cls, transactions: Sequence, snapshots: Sequence[dict]) -> "BatchColumns":
+        """Columns for Transactions and their feature snapshots (history get_feature_snapshot)."""
+        n = len(transactions)
+        hours = np.zeros((n, 24), dtype=np.int64)
+        width = max((len(s.get("recent_tx_details_10m") or ()) for s in snapshots), default=0)
+        recent = np.zeros((n, width), dtype=np.float64)
+        for i, stats in enumerate(snapshots):
+            for hour, count in (stats.get("hour_counts_7d") or {}).items():
+                hours[i, hour] = count
+            for j, detail in enumerate(stats.get("recent_tx_details_10m") or ()):
+                recent[i, j] = float(detail.get("amount") or 0)
+        amount_stats = [s.get("amount_stats_24h") or {} for s in snapshots]
+        return cls(
+            amount=[t.amount for t in transactions],
+            recent_count_10m=[s.get("recent_count_10m", 0) for s in snapshots],
+            beneficiary_count=[s.get("beneficiary_count", 0) for s in snapshots],
+            avg_amount_24h=[a.get("avg_amount") or 0 for a in amount_stats],
+            max_amount_24h=[a.get("max_amount") or 0 for a in amount_stats],
+            tx_count_24h=[a.get("transaction_count") or 0 for a in amount_stats],
+            unique_beneficiaries_10m=[s.get("unique_beneficiaries_10m", 0) for s in snapshots],
+            hour_counts_7d=hours,
+            recent_amounts_10m=recent,
+            self_transfer=[t.from_account == t.to_account for t in transactions],
+            device_score=device_scores([t.device_id for t in transactions]),
+        )
+
+
+@dataclass
+class BatchScores:
+    rule_decision: np.ndarray
+    rule_score: np.ndarray
+    rule_flags: np.ndarray
+    pattern_decision: np.ndarray
+    pattern_score: np.ndarray
+    pattern_flags: np.ndarray
+    anomaly_score_delta: np.ndarray
+    anomaly_flags: np.ndarray
+    # evaluate_transaction before the AI step: decision/score it returns without the
+    # agent, or the combined static verdict where needs_ai is set
+    decision: np.ndarray
+    score: np.ndarray
+    needs_ai: np.ndarray
+
+    def decision_labels(self) -> list[str]:
+        return [DECISIONS[d] for d in self.decision]
+
+
+def device_scores(device_ids: Sequence[Optional[str]]) -> np.ndarray:
+    """Device rule score per device_id (cached per distinct id by the classifier)."""
+    return np.fromiter(
+        (device_classifier.classify(d)[0] for d in device_ids), dtype=np.int64, count=len(device_ids)
+    )
+
+
+def describe(mask: int, flags: type[IntFlag]) -> list[str]:
+    """Names of the flags set in one row's bitmask."""
+    return [flag.name for flag in flags if mask & flag]
+
+
+def is_round_amount(amounts: np.ndarray, tolerance: float) -> np.ndarray:
+    """Elementwise rules.is_round_amount."""
+    a = np.asarray(amounts, dtype=np.float64)
+    result = np.zeros(a.shape, dtype=bool)
+    for round_val in ROUND_VALUES:
+        diff = np.abs(a - round_val)
+        result |= (diff <= tolerance) | (diff / max(round_val, 1) <= tolerance)
+    # Distance to the nearest thousand, as abs(amount - round(amount, -3))
+    k = np.floor(a / 1000)
+    nearest = np.minimum(np.abs(a - k * 1000), np.abs(a - (k + 1) * 1000))
+    nearest = np.minimum(nearest, np.abs(a - (k - 1) * 1000))
+    result |= nearest <= tolerance * np.maximum(a, 1)
+    return result & (a > 0)
+
+
+def _rule_scores(c: BatchColumns) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    amount = c.amount
+    high = amount > 50000
+    very_high = amount > 200000
+    score = 40 * high + 50 * very_high + 30 * c.self_transfer + c.device_score
+    flags = (
+        RuleFlag.HIGH_AMOUNT * high
+        + RuleFlag.VERY_HIGH_AMOUNT * very_high
+        + RuleFlag.SELF_TRANSFER * c.self_transfer
+        + RuleFlag.SUSPICIOUS_DEVICE * (c.device_score > 0)
+    )
+    decision = np.where(score > 75, BLOCK, np.where(score >= 50, REVIEW, ALLOW))
+    # Non-positive amounts are blocked outright
+    non_positive = amount <= 0
+    score = np.where(non_positive, 100, score)
+    decision = np.where(non_positive, BLOCK, decision)
+    flags = np.where(non_positive, int(RuleFlag.NON_POSITIVE_AMOUNT), flags)
+    return decision.astype(np.int8), score.astype(np.int64), flags.astype(np.int64)
+
+
+def _pattern_scores(c: BatchColumns, cfg: EngineConfig) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    amount, recent = c.amount, c.recent_count_10m
+    avg_amount, max_amount = c.avg_amount_24h, c.max_amount_24h
+
+    # 1. Velocity
+    v_block = recent >= cfg.velocity_block_threshold
+    v_review = ~v_block & (recent >= cfg.velocity_review_threshold)
+    v_warn = ~v_block & ~v_review & (recent >= cfg.velocity_warn_threshold)
+    score = 85 * v_block + 40 * v_review + 20 * v_warn
+    decision = np.where(v_block, BLOCK, np.where(v_review, REVIEW, ALLOW))
+
+    # 2. New beneficiary + amount tier
+    new = c.beneficiary_count == 0
+    new_high = new & (amount > cfg.new_beneficiary_high_amount)
+    new_med = new & ~new_high & (amount > cfg.new_beneficiary_med_amount)
+    new_low = new & ~new_high & ~new_med & (amount > cfg.new_beneficiary_low_amount)
+    score += 50 * new_high + 35 * new_med + 25 * new_low
+    decision = np.where(new_high | new_med, np.maximum(decision, REVIEW), decision)
+
+    # 3. Amount spike vs recent behavior
+    has_avg = (c.tx_count_24h >= cfg.min_transactions_for_avg) & (avg_amount > 0)
+    spike = has_avg & (amount > cfg.amount_spike_multiplier_avg * avg_amount)
+    above_max = has_avg & (max_amount > 0) & (amount > cfg.amount_spike_multiplier_max * max_amount)
+    score += 30 * spike + 25 * above_max
+    decision = np.where(spike, np.maximum(decision, REVIEW), decision)
+
+    not_block = decision != BLOCK
+    decision = np.where(not_block & (score > 75), BLOCK, np.where(not_block & (score >= 50), REVIEW, decision))
+
+    flags = (
+        PatternFlag.HIGH_VELOCITY * v_block
+        + PatternFlag.ELEVATED_VELOCITY * v_review
+        + PatternFlag.UNUSUAL_FREQUENCY * v_warn
+        + PatternFlag.NEW_BENEFICIARY_HIGH_AMOUNT * new_high
+        + PatternFlag.NEW_BENEFICIARY_MEDIUM_AMOUNT * new_med
+        + PatternFlag.NEW_BENEFICIARY_LOW_AMOUNT * new_low
+        + PatternFlag.AMOUNT_SPIKE * spike
+        + PatternFlag.ABOVE_RECENT_MAX * above_max
+    )
+    return decision.astype(np.int8), np.minimum(score, 100).astype(np.int64), flags.astype(np.int64)
+
+
+def _anomaly_scores(
+    c: BatchColumns, cfg: EngineConfig, current_hour_utc: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    amount, recent, avg_amount = c.amount, c.recent_count_10m, c.avg_amount_24h
+    new = c.beneficiary_count == 0
+    unique_10m = c.unique_beneficiaries_10m
+    has_avg = (c.tx_count_24h >= 2) & (avg_amount > 0)
+    ratio = np.divide(amount, avg_amount, out=np.zeros_like(amount), where=avg_amount > 0)
+
+    # Anomalies
+    amount_anomaly = has_avg & ((ratio > 5) | ((ratio < 0.2) & (amount > 100)))
+    hours = c.hour_counts_7d
+    current_count = hours[np.arange(len(c)), current_hour_utc]
+    peak_hour = hours.argmax(axis=1)
+    time_anomaly = (
+        (hours.sum(axis=1) >= cfg.unusual_hour_min_tx)
+        & (hours > 0).any(axis=1)
+        & (current_count == 0)
+        & (np.abs(current_hour_utc - peak_hour) > 6)
+    )
+    round_amount = (amount >= 500) & is_round_amount(amount, cfg.round_amount_tolerance)
+
+    # Patterns
+    recurring = c.beneficiary_count >= cfg.recurring_beneficiary_min
+    consistent = has_avg & (ratio >= 0.5) & (ratio <= 2.0)
+
+    # Anti-patterns
+    structuring = (unique_10m >= cfg.structuring_min_tx) & (recent >= cfg.structuring_min_tx)
+    multiple_new = new & (unique_10m >= 2)
+    round_recent = is_round_amount(c.recent_amounts_10m, cfg.round_amount_tolerance).sum(axis=1)
+    round_burst = round_amount & (round_recent >= 2)
+    burst_to_new = new & (recent >= 2) & (amount > np.where(avg_amount != 0, avg_amount * 2, 5000))
+
+    delta = (
+        25 * amount_anomaly
+        + cfg.off_hours_score * time_anomaly
+        + cfg.round_amount_score * round_amount
+        + 40 * structuring
+        + cfg.structuring_new_beneficiary_bonus * multiple_new
+        + 15 * round_burst
+        + 20 * burst_to_new
+    )
+    flags = (
+        AnomalyFlag.AMOUNT_ANOMALY * amount_anomaly
+        + AnomalyFlag.TIME_ANOMALY * time_anomaly
+        + AnomalyFlag.ROUND_AMOUNT * round_amount
+        + AnomalyFlag.RECURRING_BENEFICIARY * recurring
+        + AnomalyFlag.CONSISTENT_AMOUNT * consistent
+        + AnomalyFlag.STRUCTURING * structuring
+        + AnomalyFlag.MULTIPLE_NEW_BENEFICIARIES * multiple_new
+        + AnomalyFlag.ROUND_AMOUNT_BURST * round_burst
+        + AnomalyFlag.BURST_TO_NEW_BENEFICIARY * burst_to_new
+    )
+    return delta.astype(np.int64), flags.astype(np.int64)
+
+
+def score_batch(
+    columns: BatchColumns,
+    cfg: Optional[EngineConfig] = None,
+    current_hour_utc: Union[int, np.ndarray, None] = None,
+) -> BatchScores:
+    """
+    Score a batch like evaluate_transaction's static steps. current_hour_utc (scalar
+    or per row) defaults to now, as the scalar time-anomaly check uses.
+    """
+    if cfg is None:
+        cfg = _current_engine_config()
+    if current_hour_utc is None:
+        current_hour_utc = datetime.utcnow().hour
+    hour = np.broadcast_to(np.asarray(current_hour_utc, dtype=np.int64), (len(columns),))
+
+    rule_decision, rule_score, rule_flags = _rule_scores(columns)
+    pattern_decision, pattern_score, pattern_flags = _pattern_scores(columns, cfg)
+    anomaly_delta, anomaly_flags = _anomaly_scores(columns, cfg, hour)
+
+    # Combine as in evaluate_transaction (decision codes order ALLOW < REVIEW < BLOCK)
+    with_anomaly = pattern_score + anomaly_delta
+    combined_pattern = np.where((pattern_decision == ALLOW) & (anomaly_delta >= 50), REVIEW, pattern_decision)
+    combined_pattern = np.where((combined_pattern == ALLOW) & (anomaly_delta > 75), BLOCK, combined_pattern)
+    combined_decision = np.maximum(rule_decision, combined_pattern)
+    combined_score = np.maximum(rule_score, with_anomaly)
+
+    # Fast-track ALLOW and high-confidence BLOCK skip the agent; a static-rule BLOCK
+    # above 75 returns before patterns are looked at, with the rule score alone
+    amount = columns.amount
+    has_history = columns.beneficiary_count > 0
+    static_block = (rule_decision == BLOCK) & (rule_score > 75)
+    fast_track = (combined_decision == ALLOW) & (columns.recent_count_10m < 5)
+    trusted = fast_track & has_history & (amount < 100)
+    micro = fast_track & ~trusted & (amount < 25)
+    hard_block = (combined_decision == BLOCK) & ((rule_score > 75) | (with_anomaly > 75))
+    decision = np.where(trusted | micro, ALLOW, combined_decision)
+    score = np.where(trusted, 5, np.where(micro, 1, np.where(hard_block, np.minimum(combined_score, 100), combined_score)))
+    score = np.where(static_block, np.minimum(rule_score, 100), score)
+
+    return BatchScores(
+        rule_decision=rule_decision,
+        rule_score=rule_score,
+        rule_flags=rule_flags,
+        pattern_decision=pattern_decision,
+        pattern_score=pattern_score,
+        pattern_flags=pattern_flags,
+        anomaly_score_delta=anomaly_delta,
+        anomaly_flags=anomaly_flags,
+        decision=decision.astype(np.int8),
+        score=score.astype(np.int64),
+        needs_ai=~(trusted | micro | hard_block),
+    )
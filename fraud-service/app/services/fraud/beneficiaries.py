@@ -0,0 +1,144 @@
+"""
+Sender -> beneficiary pair counts, cached in memory.
+
+get_beneficiary_count is read by the snapshot, the history fast-track and the
+agent's check_beneficiary_history tool. Counts live in an LRU keyed by
+(from_account, to_account), warmed from SQL on a miss and incremented by
+log_transaction. An optional Bloom filter of every pair ever logged
+(BENEFICIARY_FILTER_ENABLED, off by default) answers the "new beneficiary?"
+question (count 0) without touching disk at all. It is allocated and loaded from
+the DB by a startup task and answers only once that load is done.
+
+Like the sliding windows, this is per-process state; with several workers writing
+the same DB the filter would miss the other workers' pairs, so leave it off there.
+"""
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Iterable, Optional
+
+from app.core.config import get_settings
+from app.services.fraud.bloom import BloomFilter
+
+# Pairs hashed per lock acquisition while the filter is loaded
+_FILTER_LOAD_CHUNK = 10_000
+
+
+def _pair_key(from_account: str, to_account: str) -> bytes:
+    return f"{from_account}\x1f{to_account}".encode()
+
+
+class BeneficiaryPairCache:
+    """LRU of pair counts plus an optional 'seen before' filter; thread-safe."""
+
+    def __init__(self, max_pairs: int, filter_capacity: int = 0, filter_fp_rate: float = 0.01):
+        self.max_pairs = max(1, max_pairs)
+        self._counts: "OrderedDict[tuple[str, str], int]" = OrderedDict()
+        # Pairs being warmed from SQL -> one [writes seen] token per in-flight query
+        self._loading: dict[tuple[str, str], list[list[int]]] = {}
+        self.filter_capacity = filter_capacity
+        self.filter_fp_rate = filter_fp_rate
+        # Allocated by load_filter(); only answers once it holds every existing pair
+        self._filter: Optional[BloomFilter] = None
+        self._filter_ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def filter_enabled(self) -> bool:
+        return self.filter_capacity > 0
+
+    def get(self, from_account: str, to_account: str) -> Optional[int]:
+        """Cached count, 0 if the filter proves the pair was never logged, else None."""
+        pair = (from_account, to_account)
+        with self._lock:
+            count = self._counts.get(pair)
+            if count is not None:
+                self._counts.move_to_end(pair)
+                return count
+            if self._filter_ready and _pair_key(from_account, to_account) not in self._filter:
+                return 0
+            return None
+
+    def begin_load(self, from_account: str, to_account: str) -> list:
+        """Note that a count query is starting; returns the token for finish_load()."""
+        token = [0]
+        with self._lock:
+            self._loading.setdefault((from_account, to_account), []).append(token)
+        return token
+
+    def finish_load(self, from_account: str, to_account: str, token: list, count: Optional[int]) -> None:
+        """
+        Cache a count read from SQL (None if the query failed). Skipped when the pair
+        was logged while the query ran, since the row may or may not be in the count.
+        """
+        pair = (from_account, to_account)
+        with self._lock:
+            tokens = [t for t in self._loading.get(pair, ()) if t is not token]
+            if tokens:
+                self._loading[pair] = tokens
+            else:
+                self._loading.pop(pair, None)
+            if count is None or token[0] > 0:
+                return
+            self._counts[pair] = count
+            self._counts.move_to_end(pair)
+            while len(self._counts) > self.max_pairs:
+                self._counts.popitem(last=False)
+
+    def increment(self, from_account: str, to_account: str) -> None:
+        """A new transaction for the pair was logged."""
+        pair = (from_account, to_account)
+        with self._lock:
+            for token in self._loading.get(pair, ()):
+                token[0] += 1
+            if pair in self._counts:
+                self._counts[pair] += 1
+            if self._filter is not None:
+                self._filter.add(_pair_key(from_account, to_account))
+
+    def invalidate(self, from_account: str, to_account: str) -> None:
+        """Forget the cached count (e.g. a transaction_id was re-logged)."""
+        with self._lock:
+            self._counts.pop((from_account, to_account), None)
+            for token in self._loading.get((from_account, to_account), ()):
+                token[0] += 1
+
+    def load_filter(self, read_pairs: Callable[[], Iterable[tuple[str, str]]]) -> int:
+        """
+        Allocate the filter, seed it with read_pairs() (every pair already in the DB)
+        and start answering from it. Pairs logged meanwhile are added by increment().
+        Blocking: run it off the event loop. Returns pairs read.
+        """
+        if not self.filter_enabled:
+            return 0
+        bloom = BloomFilter(self.filter_capacity, self.filter_fp_rate)
+        with self._lock:
+            # Installed before the read so no pair logged after its snapshot is missed
+            self._filter, self._filter_ready = bloom, False
+        loaded = 0
+        pairs = iter(read_pairs())
+        while chunk := list(islice(pairs, _FILTER_LOAD_CHUNK)):
+            positions = [p for from_account, to_account in chunk for p in bloom.positions(_pair_key(from_account, to_account))]
+            with self._lock:
+                bloom.set(positions)
+            loaded += len(chunk)
+        with self._lock:
+            self._filter_ready = True
+        return loaded
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._loading.clear()
+
+
+def _build_pair_cache() -> BeneficiaryPairCache:
+    settings = get_settings()
+    return BeneficiaryPairCache(
+        settings.BENEFICIARY_CACHE_MAX_PAIRS,
+        settings.BENEFICIARY_FILTER_CAPACITY if settings.BENEFICIARY_FILTER_ENABLED else 0,
+        settings.BENEFICIARY_FILTER_FP_RATE,
+    )
+
+
+beneficiary_pairs = _build_pair_cache()
@@ -0,0 +1,48 @@
+"""Fixed-size Bloom filter, used by the beneficiary cache and the segment archive."""
+import hashlib
+import math
+import struct
+from typing import Iterable
+
+# to_bytes() header: number of bits, number of hashes
+_HEADER = struct.Struct("<QB")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter with double hashing over a blake2b digest."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        capacity = max(1, capacity)
+        fp_rate = min(max(fp_rate, 1e-9), 0.5)
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def positions(self, key: bytes) -> list[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def set(self, positions: Iterable[int]) -> None:
+        bits = self._bits
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def add(self, key: bytes) -> None:
+        self.set(self.positions(key))
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(key))
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(self.num_bits, self.num_hashes) + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        bloom = cls.__new__(cls)
+        bloom.num_bits, bloom.num_hashes = _HEADER.unpack_from(data)
+        bloom._bits = bytearray(data[_HEADER.size:])
+        if len(bloom._bits) != (bloom.num_bits + 7) // 8:
+            raise ValueError("truncated Bloom filter")
+        return bloom
@@ -0,0 +1,176 @@
+"""
+Device classification for basic_rule_check: suspicious tools, rooted devices and
+emulators in the device_id / user-agent string.
+
+Every signature and browser name goes into one Aho-Corasick automaton built at
+startup, so a device_id is scanned once however many signatures there are. The
+built-in list can be replaced by a JSON file (DEVICE_SIGNATURES_PATH):
+
+    {
+      "browsers": ["chrome", "safari", ...],
+      "signatures": {"kali": "tool", "root": "privileged", "nox": "emulator", ...}
+    }
+
+Categories: "tool" scores 90, "emulator" 30, and "privileged" 90 unless the
+device also looks like a browser (then 10, e.g. "root" in a path). Signatures
+are matched case-insensitively anywhere in the string; reasons follow signature
+order. Verdicts are cached per device_id in an LRU, since the same user-agents
+repeat across traffic.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Optional
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+TOOL = "tool"
+EMULATOR = "emulator"
+PRIVILEGED = "privileged"
+CATEGORIES = (TOOL, EMULATOR, PRIVILEGED)
+
+DEFAULT_BROWSERS = ("chrome", "safari", "firefox", "edge", "opera")
+DEFAULT_SIGNATURES = {
+    "kali": TOOL, "parrot os": TOOL, "blackarch": TOOL, "metasploit": TOOL,
+    "root": PRIVILEGED, "jailbreak": TOOL, "magisk": TOOL, "cydia": TOOL,
+    "frida": TOOL, "xposed": TOOL, "emulator": EMULATOR, "nox": EMULATOR, "bluestacks": EMULATOR,
+}
+
+
+class _Automaton:
+    """Aho-Corasick automaton over a fixed set of patterns; matches may overlap."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (pattern_id,)
+        # Breadth-first fail links; each node also reports its fail chain's outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] += self._out[self._fail[child]]
+                queue.append(child)
+
+    def search(self, text: str) -> set[int]:
+        """Ids of every pattern occurring in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class DeviceClassifier:
+    """One-pass device_id matcher with an LRU of (score, reasons) verdicts; thread-safe."""
+
+    def __init__(self, signatures: dict[str, str], browsers: Iterable[str], cache_size: int):
+        self._signatures: list[tuple[str, str]] = []
+        seen: set[str] = set()
+        for keyword, category in signatures.items():
+            keyword = keyword.strip().lower()
+            if category not in CATEGORIES:
+                raise ValueError(f"Unknown device signature category {category!r} for {keyword!r}")
+            if keyword and keyword not in seen:
+                seen.add(keyword)
+                self._signatures.append((keyword, category))
+        browsers = [b.strip().lower() for b in browsers if b.strip()]
+        # Signatures take ids 0..n-1 (in order), browsers come after
+        self._browser_ids = range(len(self._signatures), len(self._signatures) + len(browsers))
+        patterns = [keyword for keyword, _ in self._signatures] + browsers
+        self._automaton = _Automaton(patterns)
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, tuple[int, tuple[str, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def signature_count(self) -> int:
+        return len(self._signatures)
+
+    def classify(self, device_id: Optional[str]) -> tuple[int, tuple[str, ...]]:
+        """(score, reasons) for a device_id; score sums every matched signature."""
+        if not device_id:
+            return 0, ()
+        with self._lock:
+            verdict = self._cache.get(device_id)
+            if verdict is not None:
+                self._cache.move_to_end(device_id)
+                return verdict
+        verdict = self._classify(device_id.lower())
+        if self.cache_size:
+            with self._lock:
+                self._cache[device_id] = verdict
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return verdict
+
+    def _classify(self, device_lower: str) -> tuple[int, tuple[str, ...]]:
+        matched = self._automaton.search(device_lower)
+        if not matched:
+            return 0, ()
+        is_browser = any(pattern_id in matched for pattern_id in self._browser_ids)
+        score = 0
+        reasons = []
+        for pattern_id in sorted(matched):
+            if pattern_id >= len(self._signatures):
+                break
+            keyword, category = self._signatures[pattern_id]
+            if category == PRIVILEGED and is_browser:
+                # Looks like a browser, e.g. "root" in a path: benefit of the doubt
+                score += 10
+            elif category == EMULATOR:
+                # Emulators are suspicious but possibly just devs/gamers
+                score += 30
+                reasons.append(f"Emulator Detected: {keyword}")
+            else:
+                # Strong indicators (Kali, Metasploit, Frida)
+                score += 90
+                reasons.append(f"High Risk Security Tool: {keyword}")
+        return score, tuple(reasons)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+def load_signatures(path: str) -> tuple[dict[str, str], list[str]]:
+    """Read a signatures JSON file; returns (signatures, browsers)."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return dict(data.get("signatures") or {}), list(data.get("browsers", DEFAULT_BROWSERS))
+
+
+def _build_device_classifier() -> DeviceClassifier:
+    settings = get_settings()
+    signatures, browsers = DEFAULT_SIGNATURES, list(DEFAULT_BROWSERS)
+    if settings.DEVICE_SIGNATURES_PATH:
+        signatures, browsers = load_signatures(settings.DEVICE_SIGNATURES_PATH)
+        logger.info(f"Loaded {len(signatures)} device signatures from {settings.DEVICE_SIGNATURES_PATH}")
+    return DeviceClassifier(signatures, browsers, settings.DEVICE_VERDICT_CACHE_SIZE)
+
+
+device_classifier = _build_device_classifier()
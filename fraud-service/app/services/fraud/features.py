@@ -0,0 +1,88 @@
+"""
+Per-transaction feature fetching for the scan pipeline (service.py).
+
+A FeatureContext asks the history service only for the snapshot sources a stage
+declares it needs (SNAPSHOT_SOURCES: the sliding window, the beneficiary pair
+count, the 7-day hour histogram) and keeps what it got for the rest of the
+request, so each source is fetched at most once and a stage whose decision is
+already final never triggers the lookups of the stages after it.
+
+The sources are independent, so each one is its own asyncio task on the async
+connection pool: lookups started together run concurrently and a stage waits
+only for the sources it reads, not for everything asked for so far. A scan's
+wait is then about its slowest lookup instead of the sum of them.
+
+Sources already at hand (e.g. loaded for a whole batch, see fraud/batch.py) can be
+passed in as `preloaded` and are never fetched.
+"""
+import asyncio
+from typing import Iterable, Optional
+
+from app.services.fraud.history import SNAPSHOT_SOURCES, async_history_service, snapshot_sources_split
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # A prefetch nobody awaited (the scan exited early) must not log "never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class FeatureContext:
+    """Lazily filled feature snapshot for one transaction (not shared across requests)."""
+
+    __slots__ = ("from_account", "to_account", "stats", "_tasks")
+
+    def __init__(self, from_account: str, to_account: str, preloaded: Optional[dict] = None):
+        self.from_account = from_account
+        self.to_account = to_account
+        # Same keys as history get_feature_snapshot, filled source by source
+        self.stats: dict = {}
+        # source -> task loading it into stats (a finished future for preloaded ones)
+        self._tasks: dict[str, asyncio.Future] = {}
+        if preloaded:
+            loop = asyncio.get_running_loop()
+            for source, keys in SNAPSHOT_SOURCES.items():
+                if all(key in preloaded for key in keys):
+                    self.stats.update((key, preloaded[key]) for key in keys)
+                    done = loop.create_future()
+                    done.set_result(None)
+                    self._tasks[source] = done
+
+    @property
+    def loaded(self) -> frozenset:
+        """Sources already in stats."""
+        return frozenset(
+            source for source, task in self._tasks.items()
+            if task.done() and not task.cancelled() and task.exception() is None
+        )
+
+    def prefetch(self, sources: Iterable[str]) -> None:
+        """Start loading `sources` (those not started yet) without waiting for them."""
+        missing = [source for source in sources if source not in self._tasks]
+        if not missing:
+            return
+        if snapshot_sources_split():
+            groups = [frozenset((source,)) for source in missing]
+        else:
+            # One query returns every source; don't run it once per source
+            groups = [frozenset(SNAPSHOT_SOURCES)]
+        for group in groups:
+            task = asyncio.create_task(self._fetch(group))
+            task.add_done_callback(_consume_exception)
+            for source in group:
+                self._tasks.setdefault(source, task)
+
+    async def require(self, sources: Iterable[str]) -> dict:
+        """Wait until `sources` are loaded (starting what is missing); returns stats."""
+        sources = list(sources)
+        self.prefetch(sources)
+        tasks = {self._tasks[source] for source in sources}
+        if tasks:
+            await asyncio.gather(*tasks)
+        return self.stats
+
+    async def _fetch(self, sources: frozenset) -> None:
+        snapshot = await async_history_service.get_feature_snapshot(
+            self.from_account, self.to_account, sources=sources
+        )
+        self.stats.update(snapshot)
@@ -1,146 +1,1131 @@
-
+import asyncio
 import sqlite3
 import json
-from datetime import datetime, timedelta
+import logging
+from collections import Counter
+from itertools import groupby
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Generator, Optional
 from app.core.config import get_settings
+from app.core.db import get_async_pool, get_connection, read_cursor, transaction as db_transaction
 from app.models.transaction import Transaction
+from app.services.fraud.archive import ROW_FIELDS as ARCHIVE_ROW_FIELDS, segment_archive
+from app.services.fraud.beneficiaries import beneficiary_pairs
+from app.services.fraud.ledger import LEDGER_WINDOW_SECONDS, daily_ledger
+from app.services.fraud.writer import INSERT, TransactionWriter
+from app.services.fraud.windows import (
+    AMOUNT_WINDOW_SECONDS,
+    DETAILS_LIMIT,
+    VELOCITY_WINDOW_SECONDS,
+    account_windows,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE when backfilling ts_epoch, so a large table is migrated in short
+# write transactions instead of one long lock.
+BACKFILL_BATCH_SIZE = 5_000
+
+# Parts of a feature snapshot that can be fetched on their own (the sources= argument
+# of get_feature_snapshot) -> the snapshot keys each one fills
+SOURCE_WINDOW = "window"
+SOURCE_BENEFICIARY = "beneficiary"
+SOURCE_HOURS = "hours"
+SNAPSHOT_SOURCES = {
+    SOURCE_WINDOW: ("recent_count_10m", "amount_stats_24h", "unique_beneficiaries_10m", "recent_tx_details_10m"),
+    SOURCE_BENEFICIARY: ("beneficiary_count",),
+    SOURCE_HOURS: ("hour_counts_7d",),
+}
+
+
+def _to_epoch(dt: datetime) -> int:
+    """Naive UTC datetime -> integer epoch seconds (same clock as the text timestamp)."""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _now_epoch() -> int:
+    return _to_epoch(datetime.utcnow())
+
+
+def _since_epoch(**delta) -> int:
+    """Epoch seconds for utcnow() minus the given timedelta (e.g. minutes=10)."""
+    return _to_epoch(datetime.utcnow() - timedelta(**delta))
+
+
+# --- Schema migrations ---
+# Each migration runs once, in order, and is recorded in schema_version. Append new
+# migrations to SCHEMA_MIGRATIONS; never edit or reorder ones that have shipped.
+
+def _migration_create_transactions(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id TEXT PRIMARY KEY,
+            from_account TEXT NOT NULL,
+            to_account TEXT NOT NULL,
+            amount REAL,
+            timestamp DATETIME,
+            decision TEXT,
+            risk_score REAL,
+            reason TEXT
+        )
+    """)
+    conn.commit()
+
+
+def _migration_add_ts_epoch(conn: sqlite3.Connection):
+    """Integer epoch-seconds copy of timestamp, backfilled in rowid batches."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+    if "ts_epoch" not in columns:
+        conn.execute("ALTER TABLE transactions ADD COLUMN ts_epoch INTEGER")
+        conn.commit()
+
+    max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions").fetchone()[0]
+    start = 0
+    while start < max_rowid:
+        end = start + BACKFILL_BATCH_SIZE
+        conn.execute("""
+            UPDATE transactions
+            SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER)
+            WHERE rowid > ? AND rowid <= ? AND ts_epoch IS NULL AND timestamp IS NOT NULL
+        """, (start, end))
+        conn.commit()
+        start = end
+    if max_rowid:
+        logger.info(f"Backfilled ts_epoch for transactions up to rowid {max_rowid}")
+
+
+def _migration_add_indexes(conn: sqlite3.Connection):
+    # Sender index also carries amount/to_account so the velocity, 24h-stats and
+    # recent-details queries are answered from the index alone.
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_from_ts
+        ON transactions (from_account, ts_epoch, amount, to_account)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_from_to
+        ON transactions (from_account, to_account)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_to_ts
+        ON transactions (to_account, ts_epoch)
+    """)
+    conn.commit()
+
+
+def _migration_add_hour_rollup(conn: sqlite3.Connection):
+    """Per-account outbound counts by (day, hour-of-day), backfilled for the retention window."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_hour_rollup (
+            account TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (account, day, hour)
+        ) WITHOUT ROWID
+    """)
+    since = _since_epoch(days=get_settings().HOUR_ROLLUP_RETENTION_DAYS)
+    conn.execute("""
+        INSERT OR REPLACE INTO account_hour_rollup (account, day, hour, count)
+        SELECT from_account, ts_epoch / 86400, (ts_epoch / 3600) % 24, COUNT(*)
+        FROM transactions
+        WHERE ts_epoch >= ?
+        GROUP BY from_account, ts_epoch / 86400, (ts_epoch / 3600) % 24
+    """, (since,))
+    conn.commit()
+
+
+def _migration_add_archive_tables(conn: sqlite3.Connection):
+    """Pair counts of rows moved to cold segments, and a time index to find them."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_pair_counts (
+            from_account TEXT NOT NULL,
+            to_account TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (from_account, to_account)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_ts ON transactions (ts_epoch)")
+    conn.commit()
+
+
+def _migration_add_pending_ai_index(conn: sqlite3.Connection):
+    """Partial index of the rows still waiting for an async AI decision."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_pending_ai
+        ON transactions (ts_epoch) WHERE decision = 'PENDING_AI'
+    """)
+    conn.commit()
+
+
+SCHEMA_MIGRATIONS = [
+    (1, "create transactions table", _migration_create_transactions),
+    (2, "add ts_epoch column and backfill", _migration_add_ts_epoch),
+    (3, "add sender/beneficiary indexes", _migration_add_indexes),
+    (4, "add account_hour_rollup and backfill", _migration_add_hour_rollup),
+    (5, "add archived_pair_counts and ts_epoch index", _migration_add_archive_tables),
+    (6, "add pending AI decision index", _migration_add_pending_ai_index),
+]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Apply pending SCHEMA_MIGRATIONS in order. Returns the resulting schema version."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    for version, description, migrate in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        migrate(conn)
+        conn.execute(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description),
+        )
+        conn.commit()
+        current = version
+    return current
+
+
+# --- Queries shared by the sync and async history services ---
+
+_INSERT_TRANSACTION_SQL = """
+    INSERT OR REPLACE INTO transactions 
+    (transaction_id, from_account, to_account, amount, timestamp, ts_epoch, decision, risk_score, reason)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Rows an insert batch is about to replace (ids passed as a JSON array)
+_EXISTING_ROWS_SQL = """
+    SELECT transaction_id, from_account, to_account, ts_epoch FROM transactions
+    WHERE transaction_id IN (SELECT value FROM json_each(?))
+"""
+
+_STORED_PAIR_SQL = "SELECT from_account, to_account FROM transactions WHERE transaction_id = ?"
+
+_DECISION_SQL = "SELECT decision, risk_score, reason FROM transactions WHERE transaction_id = ?"
+
+_ROLLUP_ADD_SQL = """
+    INSERT INTO account_hour_rollup (account, day, hour, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (account, day, hour) DO UPDATE SET count = count + excluded.count
+"""
+
+_ROLLUP_COMPACT_SQL = "DELETE FROM account_hour_rollup WHERE day < ? OR count <= 0"
+
+_UPDATE_DECISION_SQL = """
+    UPDATE transactions
+    SET decision = ?, risk_score = ?, reason = ?
+    WHERE transaction_id = ?
+"""
+
+ACCOUNT_HISTORY_LIMIT = 50
+
+# Keyset page of an account's rows, newest first by (ts_epoch, transaction_id),
+# strictly before the (:before_ts, :before_id) cursor. Sender and beneficiary side
+# are separate range scans on idx_transactions_from_ts / idx_transactions_to_ts
+# (an OR of the two can use neither); UNION drops self-transfers seen by both.
+_ACCOUNT_PAGE_SIDE_SQL = """
+        SELECT * FROM (
+            SELECT transaction_id, from_account, to_account, amount, timestamp,
+                   ts_epoch, decision, risk_score, reason
+            FROM transactions
+            WHERE {column} = :account AND ts_epoch <= :before_ts
+              AND (ts_epoch < :before_ts OR transaction_id < :before_id)
+            ORDER BY ts_epoch DESC, transaction_id DESC
+            LIMIT :limit
+        )"""
+
+_ACCOUNT_PAGE_SQL = (
+    "SELECT * FROM ("
+    + _ACCOUNT_PAGE_SIDE_SQL.format(column="from_account")
+    + "\n        UNION"
+    + _ACCOUNT_PAGE_SIDE_SQL.format(column="to_account")
+    + """
+    )
+    ORDER BY ts_epoch DESC, transaction_id DESC
+    LIMIT :limit
+"""
+)
+
+_RECENT_COUNT_SQL = """
+    SELECT COUNT(*) FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ?
+"""
+
+# Pair count (hot rows + archived), plus how many of the still-queued ids (JSON array) are already
+# committed so the caller can add the rest without double counting.
+_BENEFICIARY_COUNT_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM transactions
+         WHERE from_account = :from_account AND to_account = :to_account)
+        + (SELECT COALESCE(SUM(count), 0) FROM archived_pair_counts
+           WHERE from_account = :from_account AND to_account = :to_account),
+        (SELECT COUNT(*) FROM transactions
+         WHERE transaction_id IN (SELECT value FROM json_each(:pending_ids))
+           AND from_account = :from_account AND to_account = :to_account)
+"""
+
+_RECENT_AMOUNTS_SQL = """
+    SELECT amount FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ? AND amount > 0
+    ORDER BY ts_epoch DESC
+    LIMIT ?
+"""
+
+_AMOUNT_STATS_SQL = """
+    SELECT AVG(amount), MAX(amount), COUNT(*) FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ? AND amount > 0
+"""
+
+_UNIQUE_BENEFICIARIES_SQL = """
+    SELECT COUNT(DISTINCT to_account) FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ?
+"""
+
+_RECENT_DETAILS_SQL = """
+    SELECT amount, to_account, timestamp FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ?
+    ORDER BY ts_epoch DESC
+    LIMIT ?
+"""
+
+# 7-day hour-of-day histogram: whole hours come from account_hour_rollup, the
+# partial hour the window starts in from raw rows, so the result matches a plain
+# ts_epoch >= :since_7d scan.
+_HOUR_COUNTS_SQL = """
+    SELECT hour, SUM(count) AS count FROM (
+        SELECT hour, count FROM account_hour_rollup
+        WHERE account = :from_account
+          AND (day > :since_day OR (day = :since_day AND hour > :since_hour))
+        UNION ALL
+        SELECT (ts_epoch / 3600) % 24, 1 FROM transactions
+        WHERE from_account = :from_account
+          AND ts_epoch >= :since_7d AND ts_epoch < :since_hour_end
+    )
+    GROUP BY hour
+"""
+
+# Every pair ever logged, hot or archived (see beneficiaries.py)
+_DISTINCT_PAIRS_SQL = """
+    SELECT from_account, to_account FROM transactions
+    UNION
+    SELECT from_account, to_account FROM archived_pair_counts
+"""
+
+# Oldest rows due for the cold tier; unresolved reviews and AI runs stay hot until decided
+_COLD_ROWS_SQL = """
+    SELECT transaction_id, from_account, to_account, amount, timestamp,
+           ts_epoch, decision, risk_score, reason
+    FROM transactions
+    WHERE ts_epoch < ? AND decision IS NOT 'PENDING_REVIEW' AND decision IS NOT 'PENDING_AI'
+    ORDER BY ts_epoch
+    LIMIT ?
+"""
+
+# Async AI runs older than the cutoff that never recorded a decision
+_STALE_PENDING_AI_SQL = """
+    SELECT transaction_id, risk_score FROM transactions
+    WHERE decision = 'PENDING_AI' AND ts_epoch < ?
+"""
+
+_STALE_AI_REASON = (
+    "AI decision was never recorded (the service stopped before the agent answered); "
+    "sent to manual review with the provisional rule/pattern score."
+)
+
+# ts_epoch guard: a row re-logged since it was read stays hot
+_ARCHIVE_DELETE_SQL = "DELETE FROM transactions WHERE transaction_id = ? AND ts_epoch = ?"
+
+_ARCHIVED_PAIR_ADD_SQL = """
+    INSERT INTO archived_pair_counts (from_account, to_account, count) VALUES (?, ?, ?)
+    ON CONFLICT (from_account, to_account) DO UPDATE SET count = count + excluded.count
+"""
+
+# Rows that rebuild an account's in-memory sliding window (see windows.py)
+_WINDOW_ROWS_SQL = """
+    SELECT transaction_id, amount, to_account, timestamp, ts_epoch FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ?
+"""
+
+# Rows that rebuild an account's daily-limit ledger (see ledger.py)
+_LEDGER_ROWS_SQL = """
+    SELECT transaction_id, amount, ts_epoch, decision FROM transactions
+    WHERE from_account = ? AND ts_epoch >= ? AND amount > 0
+"""
+
+# Snapshot when the sliding window serves velocity/24h stats: the 7-day hour
+# histogram when :load_hours = 1, the pair count when :load_pair = 1 (not cached)
+# and the window rows when :load_window = 1 (account not yet tracked). Branches
+# are tagged by kind.
+_WINDOWED_SNAPSHOT_SQL = """
+    SELECT 'summary',
+        (SELECT COUNT(*) FROM transactions
+         WHERE from_account = :from_account AND to_account = :to_account)
+        + (SELECT COALESCE(SUM(count), 0) FROM archived_pair_counts
+           WHERE from_account = :from_account AND to_account = :to_account),
+        (SELECT COUNT(*) FROM transactions
+         WHERE transaction_id IN (SELECT value FROM json_each(:pending_ids))
+           AND from_account = :from_account AND to_account = :to_account),
+        NULL, NULL, NULL
+    WHERE :load_pair = 1
+    UNION ALL
+    SELECT 'hour', hour, count, NULL, NULL, NULL FROM (""" + _HOUR_COUNTS_SQL + """)
+    WHERE :load_hours = 1
+    UNION ALL
+    SELECT 'row', transaction_id, amount, to_account, timestamp, ts_epoch
+    FROM transactions
+    WHERE :load_window = 1 AND from_account = :from_account AND ts_epoch >= :since_window
+"""
+
+# Set-based feature loads for a batch of transactions (warm_feature_caches): window
+# rows of many senders, counts of many pairs (JSON array of [from, to]) and the 7-day
+# hour histograms of many senders, one query each.
+_BULK_WINDOW_ROWS_SQL = """
+    SELECT from_account, transaction_id, amount, to_account, timestamp, ts_epoch FROM transactions
+    WHERE from_account IN (SELECT value FROM json_each(:accounts)) AND ts_epoch >= :since_window
+"""
+
+_BULK_PAIR_COUNTS_SQL = """
+    WITH pairs AS (
+        SELECT json_extract(value, '$[0]') AS from_account, json_extract(value, '$[1]') AS to_account
+        FROM json_each(:pairs)
+    )
+    SELECT p.from_account, p.to_account,
+        (SELECT COUNT(*) FROM transactions t
+         WHERE t.from_account = p.from_account AND t.to_account = p.to_account)
+        + (SELECT COALESCE(SUM(count), 0) FROM archived_pair_counts a
+           WHERE a.from_account = p.from_account AND a.to_account = p.to_account),
+        (SELECT COUNT(*) FROM transactions t
+         WHERE t.transaction_id IN (SELECT value FROM json_each(:pending_ids))
+           AND t.from_account = p.from_account AND t.to_account = p.to_account)
+    FROM pairs p
+"""
+
+_BULK_HOUR_COUNTS_SQL = """
+    SELECT account, hour, SUM(count) AS count FROM (
+        SELECT account, hour, count FROM account_hour_rollup
+        WHERE account IN (SELECT value FROM json_each(:accounts))
+          AND (day > :since_day OR (day = :since_day AND hour > :since_hour))
+        UNION ALL
+        SELECT from_account, (ts_epoch / 3600) % 24, 1 FROM transactions
+        WHERE from_account IN (SELECT value FROM json_each(:accounts))
+          AND ts_epoch >= :since_7d AND ts_epoch < :since_hour_end
+    )
+    GROUP BY account, hour
+"""
+
+# Fallback for non-default windows: one pass over the sender's recent rows; each
+# UNION ALL branch is tagged with its kind so the result can be split back into
+# the snapshot dict.
+_FEATURE_SNAPSHOT_SQL = """
+    WITH recent AS (
+        SELECT amount, to_account, timestamp, ts_epoch FROM transactions
+        WHERE from_account = :from_account AND ts_epoch >= :since_window
+    ),
+    amount_window AS (
+        SELECT AVG(amount) AS avg_amount, MAX(amount) AS max_amount, COUNT(*) AS cnt
+        FROM recent WHERE ts_epoch >= :since_amount AND amount > 0
+    )
+    SELECT 'summary',
+        (SELECT COUNT(*) FROM recent WHERE ts_epoch >= :since_velocity),
+        (SELECT COUNT(DISTINCT to_account) FROM recent WHERE ts_epoch >= :since_velocity),
+        (SELECT COUNT(*) FROM transactions
+         WHERE from_account = :from_account AND to_account = :to_account)
+        + (SELECT COALESCE(SUM(count), 0) FROM archived_pair_counts
+           WHERE from_account = :from_account AND to_account = :to_account),
+        avg_amount, max_amount, cnt
+    FROM amount_window
+    UNION ALL
+    SELECT 'hour', hour, count, NULL, NULL, NULL, NULL FROM (""" + _HOUR_COUNTS_SQL + """)
+    UNION ALL
+    SELECT 'detail', amount, to_account, timestamp, NULL, NULL, NULL
+    FROM (
+        SELECT amount, to_account, timestamp FROM recent
+        WHERE ts_epoch >= :since_velocity
+        ORDER BY ts_epoch DESC
+        LIMIT :details_limit
+    )
+"""
+
+
+def _uses_window(velocity_minutes: int = 10, amount_hours: int = 24, details_limit: int = DETAILS_LIMIT) -> bool:
+    """True when the requested windows are the ones the in-memory store maintains."""
+    return (
+        velocity_minutes * 60 == VELOCITY_WINDOW_SECONDS
+        and amount_hours * 3600 == AMOUNT_WINDOW_SECONDS
+        and details_limit <= DETAILS_LIMIT
+    )
+
+
+def snapshot_sources_split() -> bool:
+    """
+    True when get_feature_snapshot can serve each SNAPSHOT_SOURCES entry on its own
+    (default windows); the fallback query always returns every source.
+    """
+    return _uses_window()
+
+
+def _record_in_memory(row: tuple, replaced: Optional[tuple] = None) -> None:
+    """
+    Apply a freshly logged row to the sliding windows and the pair-count cache.
+    `replaced` is the (from_account, to_account) of the row it overwrote, if known.
+    """
+    transaction_id, from_account, to_account, amount, timestamp, ts_epoch = row[:6]
+    if replaced is not None:
+        _forget_replaced(row, replaced)
+    else:
+        beneficiary_pairs.increment(from_account, to_account)
+    account_windows.record(transaction_id, from_account, to_account, amount, ts_epoch, timestamp)
+
+
+def _settle_daily_usage(row: tuple) -> None:
+    """Turn the row's daily-limit reservation into committed usage (see ledger.py)."""
+    daily_ledger.commit(row[0], row[1], row[3], row[5], row[6])
+
+
+def _forget_replaced(row: tuple, replaced: tuple) -> None:
+    # INSERT OR REPLACE: counts did not simply grow, re-read them on next use
+    beneficiary_pairs.invalidate(*replaced)
+    beneficiary_pairs.invalidate(row[1], row[2])
+    if replaced[0] != row[1]:
+        account_windows.invalidate(replaced[0])
+
+
+def _plan_writes(ops: list[tuple], existing: dict) -> tuple[list[tuple[str, list]], dict]:
+    """
+    Statements for a batch of (INSERT, row) / (UPDATE, params) ops, in order, plus
+    transaction_id -> (row, replaced pair) for inserts that overwrote a row.
+    `existing` maps already-stored ids to (from_account, to_account, ts_epoch).
+    """
+    existing = dict(existing)
+    rollup = Counter()
+    replaced = {}
+    for kind, params in ops:
+        if kind != INSERT:
+            continue
+        old = existing.get(params[0])
+        if old is not None:
+            replaced[params[0]] = (params, old[:2])
+            if old[2] is not None:
+                rollup[_rollup_key(old[0], old[2])] -= 1
+        existing[params[0]] = (params[1], params[2], params[5])
+        rollup[_rollup_key(params[1], params[5])] += 1
+
+    statements = [
+        (_INSERT_TRANSACTION_SQL if kind == INSERT else _UPDATE_DECISION_SQL, [p for _, p in group])
+        for kind, group in groupby(ops, key=lambda op: op[0])
+    ]
+    rollup_rows = [(*key, delta) for key, delta in rollup.items() if delta]
+    if rollup_rows:
+        statements.append((_ROLLUP_ADD_SQL, rollup_rows))
+    return statements, replaced
+
+
+def _insert_ids(ops: list[tuple]) -> str:
+    return json.dumps([params[0] for kind, params in ops if kind == INSERT])
+
+
+def _pending_window_rows(from_account: str, since: int) -> list[tuple]:
+    """Queued rows for the sender in window-row layout (see _WINDOW_ROWS_SQL)."""
+    return [
+        (r[0], r[3], r[2], r[4], r[5])
+        for r in transaction_writer.pending_rows(from_account)
+        if r[1] == from_account and r[5] >= since
+    ]
+
+
+def _pending_ledger_rows(from_account: str, since: int) -> list[tuple]:
+    """Queued rows for the sender in ledger-row layout (see _LEDGER_ROWS_SQL)."""
+    return [
+        (r[0], r[3], r[5], r[6])
+        for r in transaction_writer.pending_rows(from_account)
+        if r[1] == from_account and r[5] >= since
+    ]
+
+
+def _ledger_overlay(rows) -> tuple[dict, dict]:
+    """Queued decision updates and queued re-logs (any sender) for rows read from SQL."""
+    ids = [r[0] for r in rows]
+    return transaction_writer.pending_decisions(ids), transaction_writer.pending_versions(ids)
+
+
+def _ledger_rows(from_account: str, rows, pending_rows: list[tuple], overlay: tuple[dict, dict]) -> list[tuple]:
+    """
+    Ledger rows with queued decision updates applied, minus rows a queued re-log
+    moves to another sender, overlaid with the sender's queued rows.
+    """
+    decisions, versions = overlay
+    if decisions or versions:
+        rows = [
+            (r[0], r[1], r[2], decisions[r[0]][0]) if r[0] in decisions else r
+            for r in rows
+            if r[0] not in versions or versions[r[0]][1] == from_account
+        ]
+    return _merge_rows(rows, pending_rows)
+
+
+def _merge_rows(rows, pending_rows) -> list[tuple]:
+    """SQL rows overlaid with queued rows, keyed by transaction_id (first column)."""
+    if not pending_rows:
+        return rows
+    merged = {row[0]: row for row in rows}
+    merged.update((row[0], row) for row in pending_rows)
+    return list(merged.values())
+
+
+def _pair_count(row, pending_ids: list[str]) -> int:
+    total, committed_pending = row
+    return (total or 0) - (committed_pending or 0) + len(pending_ids)
+
+
+def _history_item(row: tuple) -> dict:
+    """Lookup dict (TransactionHistoryItem fields) for a full transaction row."""
+    item = dict(zip(ARCHIVE_ROW_FIELDS, row))
+    del item["ts_epoch"]
+    return item
+
+
+def _page_key(row: tuple) -> tuple[int, str]:
+    """Keyset position of a full transaction row: (ts_epoch, transaction_id)."""
+    return row[5] or 0, row[0]
+
+
+def _account_page_params(account_id: str, limit: int, before: Optional[tuple[int, str]]) -> dict:
+    before_ts, before_id = before if before is not None else (2 ** 62, "")
+    return {"account": account_id, "limit": limit, "before_ts": before_ts, "before_id": before_id}
+
+
+def _pending_history_overlay(
+    account_id: str, rows: list[tuple], before: Optional[tuple[int, str]]
+) -> tuple[list[tuple], dict]:
+    """Queued rows that belong on a page before the cursor, and queued decision updates."""
+    pending = transaction_writer.pending_rows(account_id)
+    if before is not None:
+        pending = [r for r in pending if _page_key(r) < before]
+    return pending, transaction_writer.pending_decisions(r[0] for r in rows)
+
+
+def _merge_history_page(rows: list[tuple], overlay_rows: list[tuple], decisions: dict, limit: int) -> list[tuple]:
+    """Overlay rows (queued or archived) and decision updates on a page, newest first."""
+    if decisions:
+        rows = [r[:6] + decisions[r[0]] if r[0] in decisions else r for r in rows]
+    if not overlay_rows:
+        return list(rows)
+    merged = {r[0]: r for r in rows}
+    merged.update((r[0], r) for r in overlay_rows)
+    return sorted(merged.values(), key=_page_key, reverse=True)[:limit]
+
+
+def _needs_archive(rows: list[tuple], limit: int) -> bool:
+    """
+    The cold tier can change the page when the hot rows don't fill it, or when an
+    unresolved review older than the hot window is on it.
+    """
+    return len(rows) < limit or _page_key(rows[-1])[0] < _archive_cutoff()
+
+
+def _history_page(rows: list[tuple], limit: int) -> tuple[list[dict], Optional[tuple[int, str]]]:
+    """Page items plus the cursor for the next page (None after the last one)."""
+    next_before = _page_key(rows[-1]) if len(rows) >= limit else None
+    return [_history_item(r) for r in rows], next_before
+
+
+def _archive_cutoff() -> int:
+    """Rows before this epoch (start of a UTC day) belong in the cold tier."""
+    hot_days = max(8, get_settings().HOT_RETENTION_DAYS)
+    return (_now_epoch() // 86400 - hot_days) * 86400
+
+
+def _hour_count_params(from_account: str, since_7d: int) -> dict:
+    return {
+        "from_account": from_account,
+        "since_7d": since_7d,
+        "since_day": since_7d // 86400,
+        "since_hour": (since_7d // 3600) % 24,
+        "since_hour_end": (since_7d // 3600 + 1) * 3600,
+    }
+
+
+def _rollup_key(account: str, ts_epoch: int) -> tuple[str, int, int]:
+    return account, ts_epoch // 86400, (ts_epoch // 3600) % 24
+
+
+def _rollup_cutoff_day() -> int:
+    # Keep at least 8 days so the partial first day of the 7-day window survives
+    retention_days = max(8, get_settings().HOUR_ROLLUP_RETENTION_DAYS)
+    return _now_epoch() // 86400 - retention_days
+
+
+def _windowed_snapshot_params(
+    from_account: str,
+    to_account: str,
+    now: int,
+    load_window: bool,
+    pending_pair_ids: Optional[list],
+    load_hours: bool = True,
+) -> dict:
+    return {
+        **_hour_count_params(from_account, now - 7 * 24 * 3600),
+        "to_account": to_account,
+        "since_window": now - AMOUNT_WINDOW_SECONDS,
+        "load_window": 1 if load_window else 0,
+        "load_pair": 0 if pending_pair_ids is None else 1,
+        "load_hours": 1 if load_hours else 0,
+        "pending_ids": json.dumps(pending_pair_ids or []),
+    }
+
+
+def _split_windowed_snapshot_rows(rows) -> tuple[Optional[tuple], dict[int, int], list[tuple]]:
+    pair_row = None
+    hour_counts: dict[int, int] = {h: 0 for h in range(24)}
+    window_rows = []
+    for kind, a, b, c, d, e in rows:
+        if kind == "summary":
+            pair_row = (a, b)
+        elif kind == "hour":
+            hour_counts[a] += b
+        elif kind == "row":
+            window_rows.append((a, b, c, d, e))
+    return pair_row, hour_counts, window_rows
+
+
+def _snapshot_from_window(
+    window: Optional[dict], beneficiary_count: Optional[int], hour_counts: Optional[dict], details_limit: int
+) -> dict:
+    # None parts were not asked for and are left out
+    snapshot = {}
+    if window is not None:
+        snapshot["recent_count_10m"] = window["recent_count_10m"]
+        snapshot["amount_stats_24h"] = window["amount_stats_24h"]
+        snapshot["unique_beneficiaries_10m"] = window["unique_beneficiaries_10m"]
+        snapshot["recent_tx_details_10m"] = window["recent_tx_details_10m"][:details_limit]
+    if beneficiary_count is not None:
+        snapshot["beneficiary_count"] = beneficiary_count
+    if hour_counts is not None:
+        snapshot["hour_counts_7d"] = hour_counts
+    return snapshot
+
+
+def _transaction_row(transaction: Transaction, result: dict) -> tuple:
+    # Use server time for timestamp so velocity "last N minutes" uses a single clock
+    now = datetime.utcnow()
+    return (
+        transaction.transaction_id,
+        transaction.from_account,
+        transaction.to_account,
+        transaction.amount,
+        now.strftime("%Y-%m-%d %H:%M:%S"),
+        _to_epoch(now),
+        result.get("decision"),
+        result.get("score"),
+        result.get("reason"),
+    )
+
+
+def _as_dicts(description, rows) -> list[dict]:
+    columns = [col[0] for col in description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _amount_stats(row) -> dict:
+    avg_a, max_a, cnt = row[0], row[1], row[2]
+    return {
+        "avg_amount": float(avg_a) if avg_a is not None else 0,
+        "max_amount": float(max_a) if max_a is not None else 0,
+        "transaction_count": cnt or 0,
+    }
+
+
+def _hour_counts(rows) -> dict[int, int]:
+    counts: dict[int, int] = {h: 0 for h in range(24)}
+    for hour, count in rows:
+        counts[hour] = count
+    return counts
+
+
+def _snapshot_params(
+    from_account: str, to_account: str, velocity_minutes: int, amount_hours: int, details_limit: int
+) -> dict:
+    since_velocity = _since_epoch(minutes=velocity_minutes)
+    since_amount = _since_epoch(hours=amount_hours)
+    since_7d = _since_epoch(days=7)
+    return {
+        **_hour_count_params(from_account, since_7d),
+        "to_account": to_account,
+        "since_velocity": since_velocity,
+        "since_amount": since_amount,
+        "since_window": min(since_velocity, since_amount),
+        "details_limit": details_limit,
+    }
+
+
+def _snapshot_from_rows(rows) -> dict:
+    snapshot = {
+        "recent_count_10m": 0,
+        "beneficiary_count": 0,
+        "amount_stats_24h": {"avg_amount": 0, "max_amount": 0, "transaction_count": 0},
+        "unique_beneficiaries_10m": 0,
+        "recent_tx_details_10m": [],
+        "hour_counts_7d": {h: 0 for h in range(24)},
+    }
+    for kind, a, b, c, d, e, f in rows:
+        if kind == "summary":
+            snapshot["recent_count_10m"] = a or 0
+            snapshot["unique_beneficiaries_10m"] = b or 0
+            snapshot["beneficiary_count"] = c or 0
+            snapshot["amount_stats_24h"] = _amount_stats((d, e, f))
+        elif kind == "hour":
+            snapshot["hour_counts_7d"][a] += b
+        elif kind == "detail":
+            snapshot["recent_tx_details_10m"].append(
+                {"amount": a, "to_account": b, "timestamp": c}
+            )
+    return snapshot
+
+
+def _indicator_stats(
+    recent_10m: int,
+    daily_used: float,
+    amount_stats: dict,
+    unique_ben_10m: int,
+    hour_counts: dict,
+    history: list[dict],
+) -> dict:
+    return {
+        "recent_count_10m": recent_10m,
+        "daily_used_24h": daily_used,
+        "amount_stats_24h": amount_stats,
+        "unique_beneficiaries_10m": unique_ben_10m,
+        "hour_counts_7d": hour_counts,
+        "history_count": len(history),
+        "history_sample": history[:10],
+    }
+
+
+# Reads shared by TransactionHistory and AsyncTransactionHistory. A plan is a
+# generator that yields (sql, params), gets the fetched rows sent back and returns
+# its result; an exception from the query is thrown into it so it can undo its
+# cache bookkeeping. _run_plan / _run_plan_async do the fetching.
+
+def _run_plan(plan: Generator, fetchall: Callable):
+    rows = None
+    while True:
+        try:
+            sql, params = plan.send(rows)
+        except StopIteration as done:
+            return done.value
+        try:
+            rows = fetchall(sql, params)
+        except Exception as e:
+            plan.throw(e)
+
+
+async def _run_plan_async(plan: Generator, fetchall: Callable):
+    rows = None
+    while True:
+        try:
+            sql, params = plan.send(rows)
+        except StopIteration as done:
+            return done.value
+        try:
+            rows = await fetchall(sql, params)
+        except Exception as e:
+            plan.throw(e)
+
+
+def _window_stats_plan(from_account: str) -> Generator:
+    now = _now_epoch()
+    stats = account_windows.get(from_account, now)
+    if stats is None:
+        rebuild = account_windows.begin_rebuild(from_account)
+        since = now - AMOUNT_WINDOW_SECONDS
+        pending = _pending_window_rows(from_account, since)
+        try:
+            rows = yield _WINDOW_ROWS_SQL, (from_account, since)
+        except Exception:
+            account_windows.cancel_rebuild(from_account, rebuild)
+            raise
+        stats = account_windows.install(from_account, _merge_rows(rows, pending), now, rebuild)
+    return stats
+
+
+def _rebuild_ledger_plan(from_account: str, now: int) -> Generator:
+    rebuild = daily_ledger.begin_rebuild(from_account)
+    since = now - LEDGER_WINDOW_SECONDS
+    try:
+        # Overlay what is still queued; re-read if a batch committed during the query
+        for _ in range(3):
+            generation = transaction_writer.generation
+            pending = _pending_ledger_rows(from_account, since)
+            rows = yield _LEDGER_ROWS_SQL, (from_account, since)
+            overlay = _ledger_overlay(rows)
+            if transaction_writer.generation == generation:
+                break
+    except Exception:
+        daily_ledger.cancel_rebuild(from_account, rebuild)
+        raise
+    return daily_ledger.install(from_account, _ledger_rows(from_account, rows, pending, overlay), now, rebuild)
+
+
+def _feature_snapshot_plan(
+    from_account: str, to_account: str, velocity_minutes: int, amount_hours: int, details_limit: int, sources
+) -> Generator:
+    if not _uses_window(velocity_minutes, amount_hours, details_limit):
+        params = _snapshot_params(from_account, to_account, velocity_minutes, amount_hours, details_limit)
+        return _snapshot_from_rows((yield _FEATURE_SNAPSHOT_SQL, params))
+
+    if sources is None:
+        sources = SNAPSHOT_SOURCES
+    want_window = SOURCE_WINDOW in sources
+    want_pair = SOURCE_BENEFICIARY in sources
+    want_hours = SOURCE_HOURS in sources
+    now = _now_epoch()
+    window = account_windows.get(from_account, now) if want_window else None
+    pair_count = beneficiary_pairs.get(from_account, to_account) if want_pair else None
+    load_window = want_window and window is None
+    load_pair = want_pair and pair_count is None
+    if not (load_window or load_pair or want_hours):
+        # Everything asked for is in memory
+        return _snapshot_from_window(window, pair_count, None, details_limit)
+    # Queued rows are read before the query; ids committed meanwhile are deduped
+    pending_rows = pending_pair_ids = rebuild = load = None
+    if load_window:
+        rebuild = account_windows.begin_rebuild(from_account)
+        pending_rows = _pending_window_rows(from_account, now - AMOUNT_WINDOW_SECONDS)
+    if load_pair:
+        load = beneficiary_pairs.begin_load(from_account, to_account)
+        pending_pair_ids = transaction_writer.pending_pair_ids(from_account, to_account)
+    try:
+        rows = yield _WINDOWED_SNAPSHOT_SQL, _windowed_snapshot_params(
+            from_account, to_account, now, load_window, pending_pair_ids, want_hours
+        )
+    except Exception:
+        if load_window:
+            account_windows.cancel_rebuild(from_account, rebuild)
+        if load_pair:
+            beneficiary_pairs.finish_load(from_account, to_account, load, None)
+        raise
+    pair_row, hour_counts, window_rows = _split_windowed_snapshot_rows(rows)
+    if load_window:
+        window = account_windows.install(
+            from_account, _merge_rows(window_rows, pending_rows), now, rebuild
+        )
+    if load_pair:
+        pair_count = _pair_count(pair_row or (0, 0), pending_pair_ids)
+        beneficiary_pairs.finish_load(from_account, to_account, load, pair_count)
+    return _snapshot_from_window(window, pair_count, hour_counts if want_hours else None, details_limit)
 
 
 class TransactionHistory:
+    """
+    Blocking reads and maintenance (archiving, ledger reconcile, filter load) for
+    worker threads and the agent's tools. Transactions are written only through
+    AsyncTransactionHistory, which routes them via the write-behind writer.
+    """
+
     def __init__(self):
         settings = get_settings()
         self.db_path = settings.DB_PATH
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    transaction_id TEXT PRIMARY KEY,
-                    from_account TEXT NOT NULL,
-                    to_account TEXT NOT NULL,
-                    amount REAL,
-                    timestamp DATETIME,
-                    decision TEXT,
-                    risk_score REAL,
-                    reason TEXT
+        run_migrations(get_connection(self.db_path))
+
+    def load_beneficiary_filter(self) -> int:
+        """
+        Load the "seen before" pair filter (beneficiaries.py) from every pair in the
+        hot and archived tables. Blocking: run it off the event loop. Returns pairs read.
+        """
+        def _read_pairs():
+            with read_cursor(self.db_path) as cursor:
+                cursor.execute(_DISTINCT_PAIRS_SQL)
+                yield from cursor
+
+        return beneficiary_pairs.load_filter(_read_pairs)
+
+    def _fetchone(self, sql: str, params):
+        with read_cursor(self.db_path) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def _fetchall(self, sql: str, params):
+        with read_cursor(self.db_path) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _fetch_dicts(self, sql: str, params) -> list[dict]:
+        with read_cursor(self.db_path) as cursor:
+            cursor.execute(sql, params)
+            return _as_dicts(cursor.description, cursor.fetchall())
+
+    def _window_stats(self, from_account: str) -> dict:
+        """Sliding-window stats for the sender, rebuilt from SQL on an LRU miss."""
+        return _run_plan(_window_stats_plan(from_account), self._fetchall)
+
+    def _rebuild_ledger(self, from_account: str, now: int) -> tuple[float, float]:
+        """Load the sender's daily-limit ledger from SQL; returns ledger.install()'s (used, drift)."""
+        return _run_plan(_rebuild_ledger_plan(from_account, now), self._fetchall)
+
+    def compact_hour_rollup(self) -> int:
+        """Delete rollup days past HOUR_ROLLUP_RETENTION_DAYS. Returns rows removed."""
+        with db_transaction(self.db_path) as conn:
+            return conn.execute(_ROLLUP_COMPACT_SQL, (_rollup_cutoff_day(),)).rowcount
+
+    def archive_cold_transactions(self) -> int:
+        """
+        Move rows older than HOT_RETENTION_DAYS into per-day cold segments, batch by
+        batch, and purge segments past ARCHIVE_RETENTION_DAYS. Their pair counts move
+        to archived_pair_counts (kept after a purge, so a known beneficiary never
+        turns "new"). Blocking: run it off the event loop. Returns rows archived.
+        """
+        settings = get_settings()
+        cutoff = _archive_cutoff()
+        archived = 0
+        while True:
+            rows = self._fetchall(_COLD_ROWS_SQL, (cutoff, settings.ARCHIVE_BATCH_SIZE))
+            if not rows:
+                break
+            by_day: dict[int, list[tuple]] = {}
+            for row in rows:
+                by_day.setdefault(row[5] // 86400, []).append(tuple(row))
+            for day, day_rows in by_day.items():
+                segment_archive.append_day(day, day_rows)
+
+            pairs = Counter()
+            with db_transaction(self.db_path) as conn:
+                for row in rows:
+                    if conn.execute(_ARCHIVE_DELETE_SQL, (row[0], row[5])).rowcount:
+                        pairs[(row[1], row[2])] += 1
+                conn.executemany(
+                    _ARCHIVED_PAIR_ADD_SQL, [(f, t, n) for (f, t), n in pairs.items()]
                 )
-            """)
-            conn.commit()
-
-    def log_transaction(self, transaction: Transaction, result: dict):
-        # Use server time for timestamp so velocity "last N minutes" uses a single clock
-        logged_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO transactions 
-                (transaction_id, from_account, to_account, amount, timestamp, decision, risk_score, reason)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                transaction.transaction_id,
-                transaction.from_account,
-                transaction.to_account,
-                transaction.amount,
-                logged_at,
-                result.get("decision"),
-                result.get("score"),
-                result.get("reason")
-            ))
-            conn.commit()
-
-    def update_transaction_decision(self, transaction_id: str, decision: str, risk_score: float, reason: str):
-        """Update decision/score/reason for an existing transaction (e.g. after human review)."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE transactions
-                SET decision = ?, risk_score = ?, reason = ?
-                WHERE transaction_id = ?
-            """, (decision, risk_score, reason, transaction_id))
-            conn.commit()
+            archived += sum(pairs.values())
+            if len(rows) < settings.ARCHIVE_BATCH_SIZE:
+                break
+        if archived:
+            logger.info(f"Archived {archived} transactions older than {cutoff}")
+        if settings.ARCHIVE_RETENTION_DAYS > 0:
+            segment_archive.purge_before(_now_epoch() // 86400 - settings.ARCHIVE_RETENTION_DAYS)
+        return archived
+
+    def reconcile_daily_ledger(self) -> int:
+        """
+        Reload every account tracked by the daily-limit ledger from SQL, logging any
+        drift from the in-memory usage. Blocking: run it off the event loop. Returns
+        accounts that were off.
+        """
+        corrected = 0
+        for account in daily_ledger.tracked_accounts():
+            _, drift = self._rebuild_ledger(account, _now_epoch())
+            if abs(drift) > 0.005:
+                corrected += 1
+                logger.warning(f"Daily ledger for {account} was off by {drift:.2f}; reloaded from transactions")
+        return corrected
 
     def get_account_history(self, account_id: str):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM transactions
-                WHERE from_account = ? OR to_account = ?
-                ORDER BY timestamp DESC
-                LIMIT 50
-            """, (account_id, account_id))
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-
-    # --- Pattern analytics for real-world fraud detection ---
+        """Latest ACCOUNT_HISTORY_LIMIT rows where the account is sender or beneficiary."""
+        return self.get_account_history_page(account_id)[0]
+
+    def get_account_history_page(
+        self, account_id: str, limit: int = ACCOUNT_HISTORY_LIMIT, before: Optional[tuple[int, str]] = None
+    ) -> tuple[list[dict], Optional[tuple[int, str]]]:
+        """
+        One page of the account's history, newest first, strictly before the
+        (ts_epoch, transaction_id) cursor `before`. Returns the items and the cursor
+        for the next page, or None when there is nothing older.
+        """
+        params = _account_page_params(account_id, limit, before)
+        # Overlay what is still queued; re-read if a batch committed during the query
+        for _ in range(3):
+            generation = transaction_writer.generation
+            rows = self._fetchall(_ACCOUNT_PAGE_SQL, params)
+            pending, decisions = _pending_history_overlay(account_id, rows, before)
+            if transaction_writer.generation == generation:
+                break
+        rows = _merge_history_page(rows, pending, decisions, limit)
+        if _needs_archive(rows, limit):
+            archived = segment_archive.account_rows(
+                account_id, limit, exclude=[r[0] for r in rows], before=before,
+            )
+            rows = _merge_history_page(archived, rows, {}, limit)
+        return _history_page(rows, limit)
+
+    def iter_account_history(
+        self, account_id: str, page_size: int = 500, before: Optional[tuple[int, str]] = None
+    ):
+        """Every row of the account's history, newest first, read one page at a time."""
+        while True:
+            items, before = self.get_account_history_page(account_id, page_size, before)
+            yield from items
+            if before is None:
+                return
 
     def get_recent_count_from_account(self, from_account: str, minutes: int = 10) -> int:
         """Number of outbound transactions in the last N minutes (velocity)."""
-        # Use UTC to match logged_at from log_transaction
-        threshold = (datetime.utcnow() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ?
-            """, (from_account, threshold))
-            return cursor.fetchone()[0] or 0
+        if _uses_window(velocity_minutes=minutes):
+            return self._window_stats(from_account)["recent_count_10m"]
+        row = self._fetchone(_RECENT_COUNT_SQL, (from_account, _since_epoch(minutes=minutes)))
+        return row[0] or 0
 
     def get_beneficiary_count(self, from_account: str, to_account: str) -> int:
-        """Number of past transactions from this sender to this beneficiary."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM transactions
-                WHERE from_account = ? AND to_account = ?
-            """, (from_account, to_account))
-            return cursor.fetchone()[0] or 0
+        """Number of past transactions from this sender to this beneficiary (cached)."""
+        count = beneficiary_pairs.get(from_account, to_account)
+        if count is not None:
+            return count
+        load = beneficiary_pairs.begin_load(from_account, to_account)
+        pending_ids = transaction_writer.pending_pair_ids(from_account, to_account)
+        params = {
+            "from_account": from_account, "to_account": to_account, "pending_ids": json.dumps(pending_ids),
+        }
+        try:
+            row = self._fetchone(_BENEFICIARY_COUNT_SQL, params)
+        except Exception:
+            beneficiary_pairs.finish_load(from_account, to_account, load, None)
+            raise
+        count = _pair_count(row, pending_ids)
+        beneficiary_pairs.finish_load(from_account, to_account, load, count)
+        return count
 
     def get_recent_amounts_from_account(
         self, from_account: str, minutes: int = 10, max_rows: int = 100
     ) -> list[float]:
         """Recent outbound amounts for velocity and amount-spike analysis."""
-        threshold = (datetime.utcnow() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT amount FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ? AND amount > 0
-                ORDER BY timestamp DESC
-                LIMIT ?
-            """, (from_account, threshold, max_rows))
-            return [row[0] for row in cursor.fetchall()]
+        rows = self._fetchall(
+            _RECENT_AMOUNTS_SQL, (from_account, _since_epoch(minutes=minutes), max_rows)
+        )
+        return [row[0] for row in rows]
 
     def get_daily_outbound_total(self, from_account: str) -> float:
-        """Total amount sent from this account in the last 24 hours (for limit enforcement)."""
-        threshold = (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ? AND amount > 0
-            """, (from_account, threshold))
-            return float(cursor.fetchone()[0] or 0)
+        """Total amount sent from this account in the last 24 hours, blocked transfers excluded (for limit enforcement)."""
+        now = _now_epoch()
+        used = daily_ledger.used(from_account, now)
+        return used if used is not None else self._rebuild_ledger(from_account, now)[0]
+
+    def reserve_daily_limit(
+        self, from_account: str, transaction_id: str, amount: float, daily_limit: float
+    ) -> tuple[bool, float]:
+        """
+        Check `amount` against the daily limit and reserve it for the transaction in
+        one atomic step (see ledger.py). Returns (accepted, used before this transfer).
+        """
+        while True:
+            now = _now_epoch()
+            reserved = daily_ledger.reserve(from_account, transaction_id, amount, daily_limit, now)
+            if reserved is not None:
+                return reserved
+            self._rebuild_ledger(from_account, now)
 
     def get_amount_stats_last_hours(self, from_account: str, hours: int = 24) -> dict:
         """Average and max outbound amount in the last N hours for spike detection."""
-        threshold = (datetime.utcnow() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT AVG(amount), MAX(amount), COUNT(*) FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ? AND amount > 0
-            """, (from_account, threshold))
-            row = cursor.fetchone()
-        avg_a, max_a, cnt = row[0], row[1], row[2]
-        return {
-            "avg_amount": float(avg_a) if avg_a is not None else 0,
-            "max_amount": float(max_a) if max_a is not None else 0,
-            "transaction_count": cnt or 0,
-        }
+        if _uses_window(amount_hours=hours):
+            return self._window_stats(from_account)["amount_stats_24h"]
+        row = self._fetchone(_AMOUNT_STATS_SQL, (from_account, _since_epoch(hours=hours)))
+        return _amount_stats(row)
 
     def get_pattern_stats(
         self,
@@ -160,50 +1145,25 @@ class TransactionHistory:
 
     def get_unique_beneficiaries_in_window(self, from_account: str, minutes: int = 10) -> int:
         """Count of distinct to_account in last N minutes (structuring detection)."""
-        threshold = (datetime.utcnow() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(DISTINCT to_account) FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ?
-            """, (from_account, threshold))
-            return cursor.fetchone()[0] or 0
+        if _uses_window(velocity_minutes=minutes):
+            return self._window_stats(from_account)["unique_beneficiaries_10m"]
+        row = self._fetchone(_UNIQUE_BENEFICIARIES_SQL, (from_account, _since_epoch(minutes=minutes)))
+        return row[0] or 0
 
     def get_recent_tx_details(
         self, from_account: str, minutes: int = 10, limit: int = 50
     ) -> list[dict]:
         """Recent outbound tx with amount and to_account for pattern analysis."""
-        threshold = (datetime.utcnow() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT amount, to_account, timestamp FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            """, (from_account, threshold, limit))
-            return [dict(row) for row in cursor.fetchall()]
+        if _uses_window(velocity_minutes=minutes, details_limit=limit):
+            return self._window_stats(from_account)["recent_tx_details_10m"][:limit]
+        return self._fetch_dicts(
+            _RECENT_DETAILS_SQL, (from_account, _since_epoch(minutes=minutes), limit)
+        )
 
     def get_hour_counts_last_7d(self, from_account: str) -> dict[int, int]:
         """Hour-of-day (0-23 UTC) -> count of tx in last 7 days. For unusual-time detection."""
-        threshold = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT substr(timestamp, 12, 2) AS hour_str FROM transactions
-                WHERE from_account = ? AND timestamp IS NOT NULL AND timestamp >= ?
-            """, (from_account, threshold))
-            rows = cursor.fetchall()
-        counts: dict[int, int] = {h: 0 for h in range(24)}
-        for (hour_str,) in rows:
-            try:
-                h = int(hour_str)
-                if 0 <= h <= 23:
-                    counts[h] = counts.get(h, 0) + 1
-            except (ValueError, TypeError):
-                pass
-        return counts
+        params = _hour_count_params(from_account, _since_epoch(days=7))
+        return _hour_counts(self._fetchall(_HOUR_COUNTS_SQL, params))
 
     def get_anomaly_stats(
         self,
@@ -223,23 +1183,439 @@ class TransactionHistory:
         stats["hour_counts_7d"] = self.get_hour_counts_last_7d(from_account)
         return stats
 
+    def get_feature_snapshot(
+        self,
+        from_account: str,
+        to_account: str,
+        velocity_minutes: int = 10,
+        amount_hours: int = 24,
+        details_limit: int = 50,
+        sources=None,
+    ) -> dict:
+        """
+        Every stat used by pattern_check and detect_anomalies_and_patterns, from one
+        connection and one query. Same keys as get_anomaly_stats (which it replaces on
+        the scan path): recent_count_10m, beneficiary_count, amount_stats_24h,
+        unique_beneficiaries_10m, recent_tx_details_10m, hour_counts_7d.
+
+        Velocity, beneficiary-spread and 24h stats come from the in-memory sliding
+        window and the pair count from the beneficiary cache; the query only adds the
+        hour histogram (plus whatever of those is not in memory yet).
+
+        sources limits the snapshot to some SNAPSHOT_SOURCES (default: all); when
+        they are all in memory no query is made. The fallback for non-default
+        windows always returns the full snapshot.
+        """
+        plan = _feature_snapshot_plan(from_account, to_account, velocity_minutes, amount_hours, details_limit, sources)
+        return _run_plan(plan, self._fetchall)
+
     def get_account_indicators_stats(self, account_id: str) -> dict:
         """Account-level stats for indicators/risk profile (no specific beneficiary)."""
-        recent_10m = self.get_recent_count_from_account(account_id, 10)
-        daily_used = self.get_daily_outbound_total(account_id)
-        amount_stats = self.get_amount_stats_last_hours(account_id, 24)
-        unique_ben_10m = self.get_unique_beneficiaries_in_window(account_id, 10)
-        hour_counts = self.get_hour_counts_last_7d(account_id)
-        history = self.get_account_history(account_id)
+        return _indicator_stats(
+            self.get_recent_count_from_account(account_id, 10),
+            self.get_daily_outbound_total(account_id),
+            self.get_amount_stats_last_hours(account_id, 24),
+            self.get_unique_beneficiaries_in_window(account_id, 10),
+            self.get_hour_counts_last_7d(account_id),
+            self.get_account_history(account_id),
+        )
+
+
+class AsyncTransactionHistory:
+    """
+    TransactionHistory's reads, awaited on a pooled aiosqlite connection so queries
+    and commits never block the event loop, plus the transaction writes. Use from
+    async request paths.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.db_path = settings.DB_PATH
+        # Schema is owned by the sync service; make sure it is migrated first.
+        run_migrations(get_connection(self.db_path))
+
+    async def _fetchone(self, sql: str, params):
+        async with get_async_pool(self.db_path).acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def _fetchall(self, sql: str, params):
+        async with get_async_pool(self.db_path).acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def _fetch_dicts(self, sql: str, params) -> list[dict]:
+        async with get_async_pool(self.db_path).acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return _as_dicts(cursor.description, await cursor.fetchall())
+
+    async def _window_stats(self, from_account: str) -> dict:
+        """Sliding-window stats for the sender, rebuilt from SQL on an LRU miss."""
+        return await _run_plan_async(_window_stats_plan(from_account), self._fetchall)
+
+    async def _rebuild_ledger(self, from_account: str, now: int) -> tuple[float, float]:
+        """Load the sender's daily-limit ledger from SQL; returns ledger.install()'s (used, drift)."""
+        return await _run_plan_async(_rebuild_ledger_plan(from_account, now), self._fetchall)
+
+    async def log_transaction(self, transaction: Transaction, result: dict):
+        """
+        Persist a scored transaction. With the write-behind writer running this only
+        queues the row (in-memory features see it immediately); otherwise it commits.
+        """
+        row = _transaction_row(transaction, result)
+        if transaction_writer.running:
+            stored = await self._stored_pair(row)
+            # No await from here until put(): re-logs of one id must reach the queue
+            # (and the in-memory state) in the order they were tracked
+            op, superseded = transaction_writer.track_insert(row)
+            _settle_daily_usage(row)
+            _record_in_memory(row, superseded[1:3] if superseded is not None else stored)
+            await transaction_writer.put(op)
+            return
+        replaced = await self.write_batch([(INSERT, row)])
+        _settle_daily_usage(row)
+        _record_in_memory(row, replaced[row[0]][1] if replaced else None)
+
+    async def update_transaction_decision(self, transaction_id: str, decision: str, risk_score: float, reason: str):
+        """Update decision/score/reason for an existing transaction (e.g. after human review)."""
+        if transaction_writer.running:
+            op = transaction_writer.track_update(transaction_id, decision, risk_score, reason)
+            daily_ledger.set_decision(transaction_id, decision)
+            await transaction_writer.put(op)
+            return
+        async with get_async_pool(self.db_path).transaction() as conn:
+            await conn.execute(_UPDATE_DECISION_SQL, (decision, risk_score, reason, transaction_id))
+        daily_ledger.set_decision(transaction_id, decision)
+
+    async def settle_stale_ai_decisions(self, older_than_seconds: int) -> int:
+        """
+        Send PENDING_AI rows older than older_than_seconds to REVIEW: the process that
+        queued their agent run is gone. Returns rows settled.
+        """
+        rows = await self._fetchall(_STALE_PENDING_AI_SQL, (_now_epoch() - older_than_seconds,))
+        for transaction_id, risk_score in rows:
+            await self.update_transaction_decision(transaction_id, "REVIEW", risk_score, _STALE_AI_REASON)
+        return len(rows)
+
+    async def get_transaction_decision(self, transaction_id: str) -> Optional[dict]:
+        """{decision, score, reason} of a logged transaction (queued writes included), or None."""
+        pending = transaction_writer.pending_versions((transaction_id,))
+        if pending:
+            decision = pending[transaction_id][6:9]
+        else:
+            queued = transaction_writer.pending_decisions((transaction_id,))
+            decision = queued.get(transaction_id) or await self._fetchone(_DECISION_SQL, (transaction_id,))
+        if not decision:
+            return None
+        return {"decision": decision[0], "score": decision[1], "reason": decision[2]}
+
+    async def _stored_pair(self, row: tuple) -> Optional[tuple]:
+        """
+        (from_account, to_account) of the committed row a queued insert will overwrite.
+        Retries are found in the sender's window without a query (queued ones by
+        track_insert); an id older than the window is only caught when its batch is
+        written (_flush_queued).
+        """
+        tracked, to_account = account_windows.find_transaction(row[1], row[0])
+        if tracked:
+            return (row[1], to_account) if to_account is not None else None
+        stored = await self._fetchone(_STORED_PAIR_SQL, (row[0],))
+        return tuple(stored) if stored else None
+
+    async def write_batch(self, ops: list[tuple]) -> dict:
+        """
+        Write (INSERT, row) / (UPDATE, params) ops in one transaction, in order.
+        Returns transaction_id -> (row, replaced pair) for inserts that overwrote a row.
+        """
+        async with get_async_pool(self.db_path).transaction() as conn:
+            async with conn.execute(_EXISTING_ROWS_SQL, (_insert_ids(ops),)) as cursor:
+                existing = {r[0]: r[1:] for r in await cursor.fetchall()}
+            statements, replaced = _plan_writes(ops, existing)
+            for sql, params in statements:
+                await conn.executemany(sql, params)
+        return replaced
+
+    async def _flush_queued(self, ops: list[tuple]):
+        """Writer callback: commit a queued batch, then fix up rows it replaced."""
+        replaced = await self.write_batch(ops)
+        for row, pair in replaced.values():
+            _forget_replaced(row, pair)
+
+    async def compact_hour_rollup(self) -> int:
+        """Delete rollup days past HOUR_ROLLUP_RETENTION_DAYS. Returns rows removed."""
+        async with get_async_pool(self.db_path).transaction() as conn:
+            cursor = await conn.execute(_ROLLUP_COMPACT_SQL, (_rollup_cutoff_day(),))
+            return cursor.rowcount
+
+    async def get_account_history(self, account_id: str):
+        """Latest ACCOUNT_HISTORY_LIMIT rows where the account is sender or beneficiary."""
+        return (await self.get_account_history_page(account_id))[0]
+
+    async def get_account_history_page(
+        self, account_id: str, limit: int = ACCOUNT_HISTORY_LIMIT, before: Optional[tuple[int, str]] = None
+    ) -> tuple[list[dict], Optional[tuple[int, str]]]:
+        """
+        One page of the account's history, newest first, strictly before the
+        (ts_epoch, transaction_id) cursor `before`. Returns the items and the cursor
+        for the next page, or None when there is nothing older.
+        """
+        params = _account_page_params(account_id, limit, before)
+        # Overlay what is still queued; re-read if a batch committed during the query
+        for _ in range(3):
+            generation = transaction_writer.generation
+            rows = await self._fetchall(_ACCOUNT_PAGE_SQL, params)
+            pending, decisions = _pending_history_overlay(account_id, rows, before)
+            if transaction_writer.generation == generation:
+                break
+        rows = _merge_history_page(rows, pending, decisions, limit)
+        if _needs_archive(rows, limit):
+            archived = await asyncio.to_thread(
+                segment_archive.account_rows,
+                account_id, limit, [r[0] for r in rows], before,
+            )
+            rows = _merge_history_page(archived, rows, {}, limit)
+        return _history_page(rows, limit)
+
+    async def iter_account_history(
+        self, account_id: str, page_size: int = 500, before: Optional[tuple[int, str]] = None
+    ):
+        """Every row of the account's history, newest first, read one page at a time."""
+        while True:
+            items, before = await self.get_account_history_page(account_id, page_size, before)
+            for item in items:
+                yield item
+            if before is None:
+                return
+
+    async def get_recent_count_from_account(self, from_account: str, minutes: int = 10) -> int:
+        """Number of outbound transactions in the last N minutes (velocity)."""
+        if _uses_window(velocity_minutes=minutes):
+            return (await self._window_stats(from_account))["recent_count_10m"]
+        row = await self._fetchone(_RECENT_COUNT_SQL, (from_account, _since_epoch(minutes=minutes)))
+        return row[0] or 0
+
+    async def get_beneficiary_count(self, from_account: str, to_account: str) -> int:
+        """Number of past transactions from this sender to this beneficiary (cached)."""
+        count = beneficiary_pairs.get(from_account, to_account)
+        if count is not None:
+            return count
+        load = beneficiary_pairs.begin_load(from_account, to_account)
+        pending_ids = transaction_writer.pending_pair_ids(from_account, to_account)
+        params = {
+            "from_account": from_account, "to_account": to_account, "pending_ids": json.dumps(pending_ids),
+        }
+        try:
+            row = await self._fetchone(_BENEFICIARY_COUNT_SQL, params)
+        except Exception:
+            beneficiary_pairs.finish_load(from_account, to_account, load, None)
+            raise
+        count = _pair_count(row, pending_ids)
+        beneficiary_pairs.finish_load(from_account, to_account, load, count)
+        return count
+
+    async def get_recent_amounts_from_account(
+        self, from_account: str, minutes: int = 10, max_rows: int = 100
+    ) -> list[float]:
+        """Recent outbound amounts for velocity and amount-spike analysis."""
+        rows = await self._fetchall(
+            _RECENT_AMOUNTS_SQL, (from_account, _since_epoch(minutes=minutes), max_rows)
+        )
+        return [row[0] for row in rows]
+
+    async def get_daily_outbound_total(self, from_account: str) -> float:
+        """Total amount sent from this account in the last 24 hours, blocked transfers excluded (for limit enforcement)."""
+        now = _now_epoch()
+        used = daily_ledger.used(from_account, now)
+        return used if used is not None else (await self._rebuild_ledger(from_account, now))[0]
+
+    async def reserve_daily_limit(
+        self, from_account: str, transaction_id: str, amount: float, daily_limit: float
+    ) -> tuple[bool, float]:
+        """
+        Check `amount` against the daily limit and reserve it for the transaction in
+        one atomic step (see ledger.py). Returns (accepted, used before this transfer).
+        """
+        while True:
+            now = _now_epoch()
+            reserved = daily_ledger.reserve(from_account, transaction_id, amount, daily_limit, now)
+            if reserved is not None:
+                return reserved
+            await self._rebuild_ledger(from_account, now)
+
+    async def get_amount_stats_last_hours(self, from_account: str, hours: int = 24) -> dict:
+        """Average and max outbound amount in the last N hours for spike detection."""
+        if _uses_window(amount_hours=hours):
+            return (await self._window_stats(from_account))["amount_stats_24h"]
+        row = await self._fetchone(_AMOUNT_STATS_SQL, (from_account, _since_epoch(hours=hours)))
+        return _amount_stats(row)
+
+    async def get_pattern_stats(
+        self,
+        from_account: str,
+        to_account: str,
+        velocity_minutes: int = 10,
+        amount_hours: int = 24,
+    ) -> dict:
+        """Single call for all stats used by pattern-based fraud rules."""
         return {
-            "recent_count_10m": recent_10m,
-            "daily_used_24h": daily_used,
-            "amount_stats_24h": amount_stats,
-            "unique_beneficiaries_10m": unique_ben_10m,
-            "hour_counts_7d": hour_counts,
-            "history_count": len(history),
-            "history_sample": history[:10],
+            "recent_count_10m": await self.get_recent_count_from_account(from_account, velocity_minutes),
+            "beneficiary_count": await self.get_beneficiary_count(from_account, to_account),
+            "amount_stats_24h": await self.get_amount_stats_last_hours(from_account, amount_hours),
+        }
+
+    async def get_unique_beneficiaries_in_window(self, from_account: str, minutes: int = 10) -> int:
+        """Count of distinct to_account in last N minutes (structuring detection)."""
+        if _uses_window(velocity_minutes=minutes):
+            return (await self._window_stats(from_account))["unique_beneficiaries_10m"]
+        row = await self._fetchone(
+            _UNIQUE_BENEFICIARIES_SQL, (from_account, _since_epoch(minutes=minutes))
+        )
+        return row[0] or 0
+
+    async def get_recent_tx_details(
+        self, from_account: str, minutes: int = 10, limit: int = 50
+    ) -> list[dict]:
+        """Recent outbound tx with amount and to_account for pattern analysis."""
+        if _uses_window(velocity_minutes=minutes, details_limit=limit):
+            return (await self._window_stats(from_account))["recent_tx_details_10m"][:limit]
+        return await self._fetch_dicts(
+            _RECENT_DETAILS_SQL, (from_account, _since_epoch(minutes=minutes), limit)
+        )
+
+    async def get_hour_counts_last_7d(self, from_account: str) -> dict[int, int]:
+        """Hour-of-day (0-23 UTC) -> count of tx in last 7 days. For unusual-time detection."""
+        params = _hour_count_params(from_account, _since_epoch(days=7))
+        return _hour_counts(await self._fetchall(_HOUR_COUNTS_SQL, params))
+
+    async def get_anomaly_stats(
+        self,
+        from_account: str,
+        to_account: str,
+        velocity_minutes: int = 10,
+        amount_hours: int = 24,
+    ) -> dict:
+        """Stats for anomaly and pattern/anti-pattern detection."""
+        stats = await self.get_pattern_stats(from_account, to_account, velocity_minutes, amount_hours)
+        stats["unique_beneficiaries_10m"] = await self.get_unique_beneficiaries_in_window(
+            from_account, velocity_minutes
+        )
+        stats["recent_tx_details_10m"] = await self.get_recent_tx_details(
+            from_account, velocity_minutes
+        )
+        stats["hour_counts_7d"] = await self.get_hour_counts_last_7d(from_account)
+        return stats
+
+    async def get_feature_snapshot(
+        self,
+        from_account: str,
+        to_account: str,
+        velocity_minutes: int = 10,
+        amount_hours: int = 24,
+        details_limit: int = 50,
+        sources=None,
+    ) -> dict:
+        """Async counterpart of TransactionHistory.get_feature_snapshot (at most one query)."""
+        plan = _feature_snapshot_plan(from_account, to_account, velocity_minutes, amount_hours, details_limit, sources)
+        return await _run_plan_async(plan, self._fetchall)
+
+    async def warm_feature_caches(self, from_accounts, pairs) -> dict[str, dict[int, int]]:
+        """
+        Load the features of a batch of transactions with one query per source: the
+        sliding windows of untracked senders and the counts of uncached pairs go into
+        the in-memory caches, the senders' 7-day hour histograms are returned
+        ({account: {hour: count}}, the snapshot's hour_counts_7d). After this, scoring
+        the batch reads nothing else from SQL. Does nothing (returns {}) with
+        non-default windows, where get_feature_snapshot does not use the caches.
+        """
+        if not _uses_window():
+            return {}
+        from_accounts = sorted(set(from_accounts))
+        now = _now_epoch()
+        accounts = [a for a in from_accounts if account_windows.get(a, now) is None]
+        pairs = [p for p in set(pairs) if beneficiary_pairs.get(*p) is None]
+        hour_counts, _, _ = await asyncio.gather(
+            self._bulk_hour_counts(from_accounts, now),
+            self._bulk_windows(accounts, now),
+            self._bulk_pair_counts(pairs),
+        )
+        return hour_counts
+
+    async def _bulk_hour_counts(self, accounts: list[str], now: int) -> dict[str, dict[int, int]]:
+        hour_counts = {account: {h: 0 for h in range(24)} for account in accounts}
+        if not accounts:
+            return hour_counts
+        params = {**_hour_count_params("", now - 7 * 24 * 3600), "accounts": json.dumps(accounts)}
+        for account, hour, count in await self._fetchall(_BULK_HOUR_COUNTS_SQL, params):
+            hour_counts[account][hour] += count
+        return hour_counts
+
+    async def _bulk_windows(self, accounts: list[str], now: int) -> None:
+        if not accounts:
+            return
+        since = now - AMOUNT_WINDOW_SECONDS
+        rebuilds = {account: account_windows.begin_rebuild(account) for account in accounts}
+        pending = {account: _pending_window_rows(account, since) for account in accounts}
+        try:
+            rows = await self._fetchall(
+                _BULK_WINDOW_ROWS_SQL, {"accounts": json.dumps(accounts), "since_window": since}
+            )
+        except Exception:
+            for account, rebuild in rebuilds.items():
+                account_windows.cancel_rebuild(account, rebuild)
+            raise
+        by_account: dict[str, list[tuple]] = {account: [] for account in accounts}
+        for row in rows:
+            by_account[row[0]].append(row[1:])
+        for account, rebuild in rebuilds.items():
+            account_windows.install(account, _merge_rows(by_account[account], pending[account]), now, rebuild)
+
+    async def _bulk_pair_counts(self, pairs: list[tuple[str, str]]) -> None:
+        if not pairs:
+            return
+        loads = {pair: beneficiary_pairs.begin_load(*pair) for pair in pairs}
+        pending_ids = {pair: transaction_writer.pending_pair_ids(*pair) for pair in pairs}
+        params = {
+            "pairs": json.dumps(pairs),
+            "pending_ids": json.dumps([tx_id for ids in pending_ids.values() for tx_id in ids]),
         }
+        try:
+            rows = await self._fetchall(_BULK_PAIR_COUNTS_SQL, params)
+        except Exception:
+            for pair, load in loads.items():
+                beneficiary_pairs.finish_load(*pair, load, None)
+            raise
+        counts = {(from_account, to_account): (total, committed) for from_account, to_account, total, committed in rows}
+        for pair, load in loads.items():
+            beneficiary_pairs.finish_load(*pair, load, _pair_count(counts.get(pair, (0, 0)), pending_ids[pair]))
+
+    async def get_account_indicators_stats(self, account_id: str) -> dict:
+        """Account-level stats for indicators/risk profile (no specific beneficiary)."""
+        return _indicator_stats(
+            await self.get_recent_count_from_account(account_id, 10),
+            await self.get_daily_outbound_total(account_id),
+            await self.get_amount_stats_last_hours(account_id, 24),
+            await self.get_unique_beneficiaries_in_window(account_id, 10),
+            await self.get_hour_counts_last_7d(account_id),
+            await self.get_account_history(account_id),
+        )
 
 
 history_service = TransactionHistory()
+async_history_service = AsyncTransactionHistory()
+
+
+def _build_transaction_writer() -> TransactionWriter:
+    settings = get_settings()
+    return TransactionWriter(
+        async_history_service._flush_queued,
+        settings.WRITE_QUEUE_MAX_ROWS,
+        settings.WRITE_BATCH_SIZE,
+        settings.WRITE_FLUSH_INTERVAL_MS,
+        max_backoff_seconds=settings.WRITE_RETRY_MAX_BACKOFF_SECONDS,
+        shutdown_timeout_seconds=settings.WRITE_SHUTDOWN_TIMEOUT_SECONDS,
+        spill_path=settings.WRITE_SPILL_PATH,
+    )
+
+
+# Started/stopped with the app (see main.py); until then log_transaction writes directly
+transaction_writer = _build_transaction_writer()
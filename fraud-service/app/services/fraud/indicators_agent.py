@@ -4,10 +4,10 @@ Returns structured indicators for the lookup UI.
 """
 import json
 import logging
-from app.services.fraud.history import history_service
+from app.services.fraud.history import async_history_service
 from app.services.fraud.store import get_all as get_engine_config
 from app.services.transaction_middleware.account_limits import (
-    get_limits_for_account,
+    aget_limits_for_account,
     ACCOUNT_TYPE_LIMITS,
     OTP_REQUIRED_AMOUNT_THRESHOLD,
 )
@@ -29,10 +29,10 @@ Output ONLY valid JSON with these exact keys (no markdown, no code fence):
 - "summary": 2-3 sentence plain-language summary: whether this account is currently at risk, what the main triggers are, and what would make it safer or riskier."""
 
 
-def _build_context(account_id: str) -> str:
-    limits = get_limits_for_account(account_id)
+async def _build_context(account_id: str) -> str:
+    limits = await aget_limits_for_account(account_id)
     engine_config = get_engine_config()
-    stats = history_service.get_account_indicators_stats(account_id)
+    stats = await async_history_service.get_account_indicators_stats(account_id)
     am = stats.get("amount_stats_24h") or {}
     hour_counts = stats.get("hour_counts_7d") or {}
     typical_hours = [h for h, c in hour_counts.items() if c and c > 0]
@@ -89,7 +89,7 @@ async def get_account_indicators(account_id: str) -> dict:
     """Run the indicators agent and return structured JSON for the lookup UI."""
     settings = get_settings()
     llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=settings.OPENAI_API_KEY)
-    context = _build_context(account_id)
+    context = await _build_context(account_id)
     user_message = f"Analyze this account and return the JSON only.\n\n{context}"
 
     try:
@@ -106,16 +106,16 @@ async def get_account_indicators(account_id: str) -> dict:
         return data
     except json.JSONDecodeError as e:
         logger.warning(f"Indicators agent returned invalid JSON: {e}")
-        return _fallback_indicators(account_id, str(e))
+        return await _fallback_indicators(account_id, str(e))
     except Exception as e:
         logger.exception(f"Indicators agent error: {e}")
-        return _fallback_indicators(account_id, str(e))
+        return await _fallback_indicators(account_id, str(e))
 
 
-def _fallback_indicators(account_id: str, error_msg: str) -> dict:
+async def _fallback_indicators(account_id: str, error_msg: str) -> dict:
     """Non-LLM fallback when agent fails."""
-    limits = get_limits_for_account(account_id)
-    stats = history_service.get_account_indicators_stats(account_id)
+    limits = await aget_limits_for_account(account_id)
+    stats = await async_history_service.get_account_indicators_stats(account_id)
     daily_used = stats.get("daily_used_24h", 0)
     daily_limit = limits.get("daily_limit", 0)
     return {
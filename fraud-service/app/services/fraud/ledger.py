@@ -0,0 +1,335 @@
+"""
+Daily-limit ledger: 24h outbound usage per sending account plus in-flight reservations.
+
+The transaction middleware reserves a transfer's amount against the daily limit
+in one locked check-and-add, so parallel transfers from one account cannot all
+pass the check. The reservation turns into committed usage when the transaction
+is logged (log_transaction calls commit()), or is dropped when the fraud engine
+blocks it or the request fails (release(), or after RESERVATION_TTL_SECONDS).
+
+Committed usage sits in per-second buckets so the 24h window slides cheaply.
+BLOCKed transactions never count; a later decision change (e.g. a declined
+review) moves the amount in or out. Accounts live in an LRU and are rebuilt from
+the transactions table on a miss; the history service also re-checks tracked
+accounts against SQL periodically and drops any that drifted (see
+reconcile_daily_ledger).
+
+Like the sliding windows this is per-process state: run one worker per DB.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from app.core.config import get_settings
+
+LEDGER_WINDOW_SECONDS = 24 * 60 * 60
+BLOCK = "BLOCK"
+
+
+class _AccountLedger:
+    __slots__ = ("buckets", "total", "entries")
+
+    def __init__(self):
+        # [ts_epoch, counted sum, tx_ids] per second with a positive amount
+        self.buckets: deque = deque()
+        self.total = 0.0
+        # transaction_id -> [ts_epoch, amount, counted]
+        self.entries: dict[str, list] = {}
+
+    def _bucket(self, ts_epoch: int) -> Optional[list]:
+        for bucket in reversed(self.buckets):
+            if bucket[0] == ts_epoch:
+                return bucket
+            if bucket[0] < ts_epoch:
+                break
+        return None
+
+    def add(self, transaction_id: str, amount: float, ts_epoch: int, decision: Optional[str]):
+        if transaction_id in self.entries:
+            self.remove(transaction_id)
+        if amount is None or amount <= 0:
+            return
+        counted = decision != BLOCK
+        self.entries[transaction_id] = [ts_epoch, amount, counted]
+        bucket = self._bucket(ts_epoch)
+        if bucket is None:
+            bucket = [ts_epoch, 0.0, []]
+            self.buckets.append(bucket)
+        bucket[2].append(transaction_id)
+        if counted:
+            bucket[1] += amount
+            self.total += amount
+
+    def remove(self, transaction_id: str):
+        ts_epoch, amount, counted = self.entries.pop(transaction_id)
+        bucket = self._bucket(ts_epoch)
+        if bucket is not None:
+            bucket[2].remove(transaction_id)
+            if counted:
+                bucket[1] -= amount
+        if counted:
+            self.total -= amount
+
+    def set_decision(self, transaction_id: str, decision: str) -> bool:
+        """Count or uncount a tracked transaction; False if it is not in the window."""
+        entry = self.entries.get(transaction_id)
+        if entry is None:
+            return False
+        counted = decision != BLOCK
+        if entry[2] != counted:
+            delta = entry[1] if counted else -entry[1]
+            entry[2] = counted
+            bucket = self._bucket(entry[0])
+            if bucket is not None:
+                bucket[1] += delta
+            self.total += delta
+        return True
+
+    def evict(self, now_epoch: int) -> list[str]:
+        """Drop buckets older than 24h; returns the transaction_ids that left."""
+        since = now_epoch - LEDGER_WINDOW_SECONDS
+        evicted = []
+        while self.buckets and self.buckets[0][0] < since:
+            _, total, tx_ids = self.buckets.popleft()
+            self.total -= total
+            for tx_id in tx_ids:
+                self.entries.pop(tx_id, None)
+            evicted.extend(tx_ids)
+        if not self.buckets:
+            # Reset so float drift from add/subtract never outlives the window
+            self.total = 0.0
+        return evicted
+
+    def used(self) -> float:
+        return round(self.total, 6) if self.entries else 0.0
+
+    def replay(self, account: str, event: tuple):
+        """Apply a commit/decision event buffered while this ledger was read from SQL."""
+        if event[0] == "commit":
+            _, transaction_id, sender, amount, ts_epoch, decision = event
+            if sender == account:
+                self.add(transaction_id, amount, ts_epoch, decision)
+            elif transaction_id in self.entries:
+                # Re-logged under another sender
+                self.remove(transaction_id)
+        else:
+            self.set_decision(event[1], event[2])
+
+
+class DailyLimitLedger:
+    """LRU of per-account 24h usage plus limit reservations; thread-safe."""
+
+    def __init__(self, max_accounts: int, reservation_ttl_seconds: float):
+        self.max_accounts = max(1, max_accounts)
+        self.reservation_ttl = max(1.0, reservation_ttl_seconds)
+        self._accounts: "OrderedDict[str, _AccountLedger]" = OrderedDict()
+        # transaction_id -> sending account, for committed entries of tracked accounts
+        self._tx_accounts: dict[str, str] = {}
+        # transaction_id -> (account, amount, expires_at); kept outside the LRU so an
+        # evicted account never loses its in-flight reservations
+        self._reservations: dict[str, tuple[str, float, float]] = {}
+        self._reserved: dict[str, float] = {}
+        # (expires_at, transaction_id) in reservation order; the TTL is fixed so it is sorted
+        self._expiry: deque = deque()
+        # Accounts being rebuilt from SQL -> one event buffer per in-flight rebuild
+        self._pending: dict[str, list[list[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    # --- reservations ---
+
+    def reserve(
+        self, account: str, transaction_id: str, amount: float, daily_limit: float, now_epoch: int
+    ) -> Optional[tuple[bool, float]]:
+        """
+        Atomically check the limit and reserve `amount` for the transaction. Returns
+        (accepted, used before this transfer), or None if the account is not tracked
+        (caller rebuilds and retries). A retried transaction_id replaces its reservation.
+        """
+        with self._lock:
+            ledger = self._accounts.get(account)
+            if ledger is None:
+                return None
+            self._accounts.move_to_end(account)
+            self._expire_reservations()
+            self._evict(account, ledger, now_epoch)
+            self._drop_reservation(transaction_id)
+            used = ledger.used() + self._reserved.get(account, 0.0)
+            if used + amount > daily_limit:
+                return False, round(used, 6)
+            expires_at = time.monotonic() + self.reservation_ttl
+            self._reservations[transaction_id] = (account, amount, expires_at)
+            self._reserved[account] = self._reserved.get(account, 0.0) + amount
+            self._expiry.append((expires_at, transaction_id))
+            return True, round(used, 6)
+
+    def release(self, transaction_id: str) -> None:
+        """Drop the transaction's reservation if it is still held (no-op once committed)."""
+        with self._lock:
+            self._drop_reservation(transaction_id)
+
+    def _drop_reservation(self, transaction_id: str) -> None:
+        reservation = self._reservations.pop(transaction_id, None)
+        if reservation is None:
+            return
+        account, amount, _ = reservation
+        remaining = self._reserved.get(account, 0.0) - amount
+        if remaining > 1e-9:
+            self._reserved[account] = remaining
+        else:
+            self._reserved.pop(account, None)
+
+    def _expire_reservations(self) -> None:
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, transaction_id = self._expiry.popleft()
+            reservation = self._reservations.get(transaction_id)
+            if reservation is not None and reservation[2] == expires_at:
+                self._drop_reservation(transaction_id)
+
+    # --- committed usage ---
+
+    def commit(
+        self,
+        transaction_id: str,
+        account: str,
+        amount: float,
+        ts_epoch: int,
+        decision: Optional[str],
+    ) -> None:
+        """A transaction was logged: settle its reservation and count it unless BLOCKed."""
+        event = ("commit", transaction_id, account, amount, ts_epoch, decision)
+        with self._lock:
+            self._drop_reservation(transaction_id)
+            # Every rebuild sees it: a re-logged id may have moved away from its account
+            for buffers in self._pending.values():
+                for buffer in buffers:
+                    buffer.append(event)
+            previous = self._tx_accounts.get(transaction_id)
+            if previous is not None and previous != account:
+                # INSERT OR REPLACE moved the row to another sender
+                self._accounts[previous].remove(transaction_id)
+                del self._tx_accounts[transaction_id]
+            ledger = self._accounts.get(account)
+            if ledger is None:
+                return
+            self._evict(account, ledger, ts_epoch)
+            ledger.add(transaction_id, amount, ts_epoch, decision)
+            if transaction_id in ledger.entries:
+                self._tx_accounts[transaction_id] = account
+            else:
+                self._unmap(account, transaction_id)
+
+    def set_decision(self, transaction_id: str, decision: str) -> None:
+        """A logged transaction's decision changed (e.g. review declined -> BLOCK)."""
+        event = ("decision", transaction_id, decision)
+        with self._lock:
+            for buffers in self._pending.values():
+                for buffer in buffers:
+                    buffer.append(event)
+            account = self._tx_accounts.get(transaction_id)
+            if account is not None:
+                self._accounts[account].set_decision(transaction_id, decision)
+
+    def _unmap(self, account: str, transaction_id: str) -> None:
+        if self._tx_accounts.get(transaction_id) == account:
+            del self._tx_accounts[transaction_id]
+
+    def _evict(self, account: str, ledger: _AccountLedger, now_epoch: int) -> None:
+        for transaction_id in ledger.evict(now_epoch):
+            self._unmap(account, transaction_id)
+
+    def _drop_account(self, account: str) -> None:
+        ledger = self._accounts.pop(account, None)
+        if ledger is not None:
+            for transaction_id in ledger.entries:
+                self._unmap(account, transaction_id)
+
+    def used(self, account: str, now_epoch: int) -> Optional[float]:
+        """Committed 24h usage (without reservations), or None if the account is not tracked."""
+        with self._lock:
+            ledger = self._accounts.get(account)
+            if ledger is None:
+                return None
+            self._accounts.move_to_end(account)
+            self._evict(account, ledger, now_epoch)
+            return ledger.used()
+
+    def tracked_accounts(self) -> list[str]:
+        with self._lock:
+            return list(self._accounts)
+
+    # --- rebuild from SQL ---
+
+    def begin_rebuild(self, account: str) -> list:
+        """
+        Start buffering events for an account whose rows are about to be read from SQL.
+        Returns the buffer to pass to install() / cancel_rebuild().
+        """
+        buffer: list[tuple] = []
+        with self._lock:
+            self._pending.setdefault(account, []).append(buffer)
+        return buffer
+
+    def _end_rebuild(self, account: str, buffer: list) -> None:
+        buffers = self._pending.get(account, [])
+        if any(b is buffer for b in buffers):
+            buffers[:] = [b for b in buffers if b is not buffer]
+        if not buffers:
+            self._pending.pop(account, None)
+
+    def install(self, account: str, rows, now_epoch: int, buffer: list) -> tuple[float, float]:
+        """
+        Build the account's ledger from SQL rows (transaction_id, amount, ts_epoch,
+        decision) covering the last 24h and replay events buffered since begin_rebuild.
+        Replaces any state already tracked. Returns (committed usage, drift), where
+        drift is how far the replaced in-memory usage was off (0 if none was tracked).
+        """
+        ledger = _AccountLedger()
+        for transaction_id, amount, ts_epoch, decision in sorted(rows, key=lambda r: r[2]):
+            ledger.add(transaction_id, amount, ts_epoch, decision)
+        with self._lock:
+            self._end_rebuild(account, buffer)
+            old = self._accounts.get(account)
+            previous_used = None
+            if old is not None:
+                self._evict(account, old, now_epoch)
+                previous_used = old.used()
+                self._drop_account(account)
+            for event in buffer:
+                ledger.replay(account, event)
+            for transaction_id in ledger.entries:
+                other = self._tx_accounts.get(transaction_id)
+                if other is not None and other != account:
+                    # Our read saw the row move here after the other ledger counted it
+                    self._accounts[other].remove(transaction_id)
+                self._tx_accounts[transaction_id] = account
+            self._evict(account, ledger, now_epoch)
+            self._accounts[account] = ledger
+            while len(self._accounts) > self.max_accounts:
+                self._drop_account(next(iter(self._accounts)))
+            used = ledger.used()
+            return used, (used - previous_used if previous_used is not None else 0.0)
+
+    def cancel_rebuild(self, account: str, buffer: list) -> None:
+        """Drop the event buffer of a rebuild whose query failed."""
+        with self._lock:
+            self._end_rebuild(account, buffer)
+
+    def invalidate(self, account: str) -> None:
+        with self._lock:
+            self._drop_account(account)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+            self._tx_accounts.clear()
+            self._pending.clear()
+
+
+def _build_daily_ledger() -> DailyLimitLedger:
+    settings = get_settings()
+    return DailyLimitLedger(settings.DAILY_LEDGER_MAX_ACCOUNTS, settings.DAILY_LEDGER_RESERVATION_TTL_SECONDS)
+
+
+daily_ledger = _build_daily_ledger()
@@ -0,0 +1,168 @@
+"""
+Per-rule counters for the scoring rule packs (see fraud/rules.py).
+
+For every rule: how often it was evaluated and fired, the score it added, how
+the scans it fired in were finally decided and, with ENGINE_RULE_TIMING_ENABLED,
+the nanoseconds spent on it. Counters live in per-thread shards written only by
+their own thread, so the scoring path takes no lock; report() sums the shards.
+reset() stores a baseline instead of zeroing shards other threads are writing.
+
+Like the other in-memory state this is per process: each worker reports its own.
+"""
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from app.core.config import get_settings
+
+# Per-rule counter slots
+EVALUATED, HITS, POINTS, NANOS = range(4)
+
+
+class _Shard:
+    __slots__ = ("packs", "outcomes", "scans")
+
+    def __init__(self):
+        # pack -> one [evaluated, hits, points, nanos] per rule
+        self.packs: dict[str, list[list]] = {}
+        # rule key -> final decision -> scans the rule fired in
+        self.outcomes: dict[str, dict[str, int]] = {}
+        # final decision -> scans
+        self.scans: dict[str, int] = {}
+
+
+class _Scan:
+    """Collects the rules fired during one evaluate_transaction call."""
+
+    __slots__ = ("stats", "fired", "decision", "_token")
+
+    def __init__(self, stats: "RuleStats"):
+        self.stats = stats
+        self.fired: list[str] = []
+        self.decision: Optional[str] = None
+
+    def __enter__(self) -> "_Scan":
+        self._token = self.stats._current.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stats._current.reset(self._token)
+        if self.decision is not None:
+            self.stats._record_scan(self.fired, self.decision)
+
+
+class RuleStats:
+    """Lock-free (per-thread) rule counters."""
+
+    def __init__(self, timing: bool = False):
+        self.timing = timing
+        self._local = threading.local()
+        self._shards: list[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._packs: dict[str, list[str]] = {}
+        self._current: ContextVar[Optional[_Scan]] = ContextVar("rule_scan", default=None)
+        self._baseline: Optional[dict] = None
+        self._since = time.time()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def register_pack(self, pack: str, rule_ids: list[str]) -> None:
+        self._packs[pack] = list(rule_ids)
+
+    def counters(self, pack: str, size: int) -> list[list]:
+        """This thread's counters for a pack, one slot list per rule."""
+        shard = self._shard()
+        counters = shard.packs.get(pack)
+        if counters is None or len(counters) != size:
+            counters = shard.packs[pack] = [[0, 0, 0, 0] for _ in range(size)]
+        return counters
+
+    def scan(self) -> _Scan:
+        """Context manager around one transaction; set .decision to record the outcome."""
+        return _Scan(self)
+
+    def current_scan(self) -> Optional[_Scan]:
+        return self._current.get()
+
+    def _record_scan(self, fired: list[str], decision: str) -> None:
+        shard = self._shard()
+        shard.scans[decision] = shard.scans.get(decision, 0) + 1
+        for key in fired:
+            outcomes = shard.outcomes.get(key)
+            if outcomes is None:
+                outcomes = shard.outcomes[key] = {}
+            outcomes[decision] = outcomes.get(decision, 0) + 1
+
+    def _totals(self) -> dict:
+        rules: dict[str, list] = {}
+        outcomes: dict[str, dict[str, int]] = {}
+        scans: dict[str, int] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for pack, counters in list(shard.packs.items()):
+                ids = self._packs.get(pack, [])
+                for rule_id, counter in zip(ids, counters):
+                    total = rules.setdefault(f"{pack}.{rule_id}", [0, 0, 0, 0])
+                    for slot in range(4):
+                        total[slot] += counter[slot]
+            for key, by_decision in list(shard.outcomes.items()):
+                total = outcomes.setdefault(key, {})
+                for decision, count in list(by_decision.items()):
+                    total[decision] = total.get(decision, 0) + count
+            for decision, count in list(shard.scans.items()):
+                scans[decision] = scans.get(decision, 0) + count
+        return {"rules": rules, "outcomes": outcomes, "scans": scans}
+
+    def reset(self) -> None:
+        """Count from now on (other threads' shards are left alone)."""
+        self._baseline = self._totals()
+        self._since = time.time()
+
+    def report(self) -> dict:
+        totals = self._totals()
+        base = self._baseline or {"rules": {}, "outcomes": {}, "scans": {}}
+        scans = {d: n - base["scans"].get(d, 0) for d, n in totals["scans"].items()}
+        rules = []
+        for pack, ids in self._packs.items():
+            for rule_id in ids:
+                key = f"{pack}.{rule_id}"
+                counter = totals["rules"].get(key, [0, 0, 0, 0])
+                before = base["rules"].get(key, [0, 0, 0, 0])
+                evaluated, hits, points, nanos = (counter[s] - before[s] for s in range(4))
+                fired_in = {
+                    d: n - base["outcomes"].get(key, {}).get(d, 0)
+                    for d, n in totals["outcomes"].get(key, {}).items()
+                }
+                rules.append({
+                    "rule": key,
+                    "evaluated": evaluated,
+                    "hits": hits,
+                    "hit_rate": round(hits / evaluated, 6) if evaluated else 0.0,
+                    "score_points": points,
+                    # Final decisions of the scans this rule fired in, and its share of each
+                    "decisions": fired_in,
+                    "decision_share": {
+                        d: round(n / scans[d], 6) for d, n in fired_in.items() if scans.get(d)
+                    },
+                    "total_ms": round(nanos / 1e6, 3) if self.timing else None,
+                    "avg_ns": round(nanos / evaluated) if self.timing and evaluated else None,
+                })
+        return {
+            "pid": os.getpid(),
+            "since": self._since,
+            "timing_enabled": self.timing,
+            "scans": {"total": sum(scans.values()), **scans},
+            "rules": rules,
+        }
+
+
+rule_stats = RuleStats(timing=get_settings().ENGINE_RULE_TIMING_ENABLED)
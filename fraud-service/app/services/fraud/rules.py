@@ -0,0 +1,487 @@
+"""
+Declarative scoring rules: JSON rule packs compiled once into closures.
+
+builtin_rules.json holds the "basic_rule_check", "pattern_check" and
+"anomalies" packs behind the engine.py functions of the same names. Extra rules
+from CUSTOM_RULES_PATH (same file layout, "rules" only) are appended to the
+pack of the same name at startup, so new rules need no code release.
+
+A rule:
+
+    {
+      "id": "velocity_review",
+      "when": "recent_count_10m >= cfg.velocity_review_threshold",
+      "score": 40,                      # number or expression, default 0
+      "decision": "REVIEW",             # optional: raise the decision to at least this
+      "output": "reason",               # list the reason goes to (default "reason")
+      "reason": "Elevated velocity: {recent_count_10m} transactions in last 10 minutes",
+      "group": "velocity",              # optional: only the first matching rule of a group fires
+      "stop": false                     # optional: skip the remaining rules once this fires
+    }
+
+Expressions are a small Python subset: features (FEATURES), cfg.<EngineConfig
+field>, numbers, comparisons (chained), and/or/not, + - * /, "a if c else b"
+and abs/min/max. Each is checked against that whitelist and compiled once
+into a lambda; features are computed on first use and shared by every rule in
+the scan. Reason templates are str.format strings over features.
+
+A pack may set decision_thresholds ({"block_above", "review_from"}) applied to
+the summed score after all rules, and max_score to cap it. Every evaluation is
+counted per rule in rule_stats (GET /api/v1/engine/stats).
+
+Each rule knows which feature-snapshot sources (FEATURE_SOURCES) it reads, so a
+pack can also be evaluated in steps (RulePack.start): rules run as soon as their
+sources are loaded, and headroom() bounds what the rest could still add, which
+lets the caller skip fetching features that cannot change the decision.
+"""
+import ast
+import json
+import logging
+import math
+import os
+from dataclasses import fields
+import time
+from datetime import datetime
+from string import Formatter
+from typing import Callable, NamedTuple, Optional
+
+from app.core.config import get_settings
+from app.services.fraud.devices import device_classifier
+from app.services.fraud.rule_stats import EVALUATED, HITS, NANOS, POINTS, rule_stats
+from app.services.fraud.store import EngineConfig
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_RULES_PATH = os.path.join(os.path.dirname(__file__), "builtin_rules.json")
+
+DECISIONS = ("ALLOW", "REVIEW", "BLOCK")
+_ALLOW, _REVIEW, _BLOCK = 0, 1, 2
+
+# Round values checked by is_round_amount
+ROUND_VALUES = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+
+class RuleError(ValueError):
+    """A rule pack that does not compile."""
+
+
+def is_round_amount(amount: float, tolerance: float) -> bool:
+    """True if amount is a round number (e.g. 1000, 5000, 10000) often seen in fraud."""
+    if amount <= 0:
+        return False
+    for round_val in ROUND_VALUES:
+        diff = abs(amount - round_val)
+        if diff <= tolerance or diff / round_val <= tolerance:
+            return True
+    # Check round thousands
+    if abs(amount - round(amount, -3)) <= tolerance * max(amount, 1):
+        return True
+    return False
+
+
+class _Features(dict):
+    """Feature values for one scan: plain stats up front, derived ones on first lookup."""
+
+    __slots__ = ("transaction", "stats", "cfg")
+
+    def __init__(self, transaction, stats: dict, cfg: EngineConfig):
+        amount_stats = stats.get("amount_stats_24h") or {}
+        super().__init__(
+            amount=transaction.amount,
+            recent_count_10m=stats.get("recent_count_10m", 0),
+            beneficiary_count=stats.get("beneficiary_count", 0),
+            unique_beneficiaries_10m=stats.get("unique_beneficiaries_10m", 0),
+            avg_amount_24h=amount_stats.get("avg_amount") or 0,
+            max_amount_24h=amount_stats.get("max_amount") or 0,
+            tx_count_24h=amount_stats.get("transaction_count") or 0,
+        )
+        self.transaction = transaction
+        self.stats = stats
+        self.cfg = cfg
+
+    def __missing__(self, name: str):
+        value = self[name] = FEATURES[name](self)
+        return value
+
+
+def _hour_counts(f: _Features) -> dict:
+    return f.stats.get("hour_counts_7d") or {}
+
+
+def _recent_details(f: _Features) -> list:
+    return f.stats.get("recent_tx_details_10m") or []
+
+
+def _peak_hour(f: _Features) -> int:
+    hour_counts = _hour_counts(f)
+    return max(hour_counts, key=hour_counts.get) if hour_counts else -1
+
+
+FEATURES: dict[str, Optional[Callable[[_Features], object]]] = {
+    # Filled in by _Features.__init__
+    "amount": None,
+    "recent_count_10m": None,
+    "beneficiary_count": None,
+    "unique_beneficiaries_10m": None,
+    "avg_amount_24h": None,
+    "max_amount_24h": None,
+    "tx_count_24h": None,
+    # Derived, computed on first use
+    "self_transfer": lambda f: f.transaction.from_account == f.transaction.to_account,
+    # Suspicious-device score from the device classifier (0 when nothing matches)
+    "device_score": lambda f: device_classifier.classify(f.transaction.device_id)[0],
+    # amount / 24h average, 0 without an average
+    "amount_ratio_24h": lambda f: f["amount"] / f["avg_amount_24h"] if f["avg_amount_24h"] else 0,
+    "amount_is_round": lambda f: is_round_amount(f["amount"], f.cfg.round_amount_tolerance),
+    "recent_details_10m": lambda f: len(_recent_details(f)),
+    "recent_round_count_10m": lambda f: sum(
+        1 for r in _recent_details(f) if is_round_amount(float(r.get("amount") or 0), f.cfg.round_amount_tolerance)
+    ),
+    "hour_total_7d": lambda f: sum(_hour_counts(f).values()),
+    "active_hours_7d": lambda f: sum(1 for c in _hour_counts(f).values() if c > 0),
+    "current_hour_utc": lambda f: datetime.utcnow().hour,
+    "current_hour_count_7d": lambda f: _hour_counts(f).get(f["current_hour_utc"], 0),
+    # Busiest hour (the earliest on ties), -1 without history
+    "peak_hour_7d": _peak_hour,
+}
+
+# Feature -> history feature-snapshot source it is computed from (SNAPSHOT_SOURCES
+# in history.py); features not listed need only the transaction
+FEATURE_SOURCES = {
+    "recent_count_10m": "window",
+    "unique_beneficiaries_10m": "window",
+    "avg_amount_24h": "window",
+    "max_amount_24h": "window",
+    "tx_count_24h": "window",
+    "amount_ratio_24h": "window",
+    "recent_details_10m": "window",
+    "recent_round_count_10m": "window",
+    "beneficiary_count": "beneficiary",
+    "hour_total_7d": "hours",
+    "active_hours_7d": "hours",
+    "current_hour_count_7d": "hours",
+    "peak_hour_7d": "hours",
+}
+
+
+def _sources(features: set) -> frozenset:
+    return frozenset(FEATURE_SOURCES[name] for name in features if name in FEATURE_SOURCES)
+
+
+_CONFIG_FIELDS = {field.name for field in fields(EngineConfig)}
+_ALLOWED_OPS = (
+    ast.And, ast.Or, ast.Not, ast.USub, ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+_FUNCTIONS = {"abs": abs, "min": min, "max": max}
+
+
+class _Rewrite(ast.NodeTransformer):
+    """Check an expression against the whitelist; features become f["name"] lookups."""
+
+    def __init__(self):
+        self.features: set[str] = set()
+
+    def visit_Name(self, node: ast.Name):
+        if node.id not in FEATURES:
+            raise RuleError(f"Unknown feature: {node.id}")
+        self.features.add(node.id)
+        return ast.copy_location(ast.Subscript(ast.Name("f", ast.Load()), ast.Constant(node.id), ast.Load()), node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not (isinstance(node.value, ast.Name) and node.value.id == "cfg"):
+            raise RuleError(f"Unsupported attribute: {ast.unparse(node)}")
+        if node.attr not in _CONFIG_FIELDS:
+            raise RuleError(f"Unknown engine config key: {node.attr}")
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        if not (isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS) or node.keywords:
+            raise RuleError(f"Unsupported call: {ast.unparse(node)}")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_Constant(self, node: ast.Constant):
+        if not isinstance(node.value, (int, float)):
+            raise RuleError(f"Unsupported constant: {node.value!r}")
+        return node
+
+    def generic_visit(self, node: ast.AST):
+        allowed = (ast.Expression, ast.BoolOp, ast.Compare, ast.BinOp, ast.UnaryOp, ast.IfExp, ast.Load)
+        if not isinstance(node, allowed + _ALLOWED_OPS):
+            raise RuleError(f"Unsupported syntax: {type(node).__name__}")
+        return super().generic_visit(node)
+
+
+def compile_expression(source, features: Optional[set] = None) -> Callable[[_Features, EngineConfig], object]:
+    """
+    Compile a rule expression (or a plain number) into a function of (features, cfg).
+    Only whitelisted syntax gets through, so the generated lambda cannot reach
+    anything but features, cfg fields and abs/min/max. The feature names used
+    are added to `features` if given.
+    """
+    if isinstance(source, (int, float)) and not isinstance(source, bool):
+        return lambda f, cfg: source
+    if not isinstance(source, str):
+        raise RuleError(f"Expected an expression, got {source!r}")
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"Invalid expression {source!r}: {e.msg}") from e
+    rewrite = _Rewrite()
+    body = rewrite.visit(tree).body
+    if features is not None:
+        features.update(rewrite.features)
+    args = ast.arguments(
+        posonlyargs=[], args=[ast.arg("f"), ast.arg("cfg")], kwonlyargs=[], kw_defaults=[], defaults=[]
+    )
+    code = compile(ast.fix_missing_locations(ast.Expression(ast.Lambda(args, body))), f"<rule {source}>", "eval")
+    return eval(code, {"__builtins__": {}, **_FUNCTIONS})
+
+
+def _compile_template(template: str, features: set) -> Callable[[_Features], str]:
+    names = [name for _, name, _, _ in Formatter().parse(template) if name is not None]
+    for name in names:
+        if name not in FEATURES:
+            raise RuleError(f"Unknown feature in reason template: {{{name}}}")
+    features.update(names)
+    if not names:
+        return lambda f: template
+    return template.format_map
+
+
+class _Rule(NamedTuple):
+    id: str
+    group: Optional[str]
+    when: Callable
+    score: Callable
+    decision: int
+    output: str
+    reason: Optional[Callable]
+    stop: bool
+    # Snapshot sources read by the whole rule, and by its score alone
+    sources: frozenset
+    score_sources: frozenset
+
+
+def _compile_rule(spec: dict) -> _Rule:
+    rule_id = spec.get("id")
+    if not rule_id or "when" not in spec:
+        raise RuleError(f"Rule needs an id and a when condition: {spec!r}")
+    decision = spec.get("decision") or "ALLOW"
+    if decision not in DECISIONS:
+        raise RuleError(f"Rule {rule_id}: unknown decision {decision!r}")
+    used: set[str] = set()
+    score_used: set[str] = set()
+    try:
+        when = compile_expression(spec["when"], used)
+        score = compile_expression(spec.get("score", 0), score_used)
+        reason = _compile_template(spec["reason"], used) if spec.get("reason") else None
+        return _Rule(
+            id=rule_id,
+            group=spec.get("group"),
+            when=when,
+            score=score,
+            decision=DECISIONS.index(decision),
+            output=spec.get("output", "reason"),
+            reason=reason,
+            stop=bool(spec.get("stop", False)),
+            sources=_sources(used | score_used),
+            score_sources=_sources(score_used),
+        )
+    except RuleError as e:
+        raise RuleError(f"Rule {rule_id}: {e}") from e
+
+
+class RuleResult(NamedTuple):
+    decision: str
+    score: float
+    # output name -> reasons, in rule order
+    outputs: dict[str, list[str]]
+    # ids of the rules that fired, in rule order
+    fired: tuple[str, ...] = ()
+
+
+class RulePack:
+    """An ordered, compiled list of rules plus the pack's decision cut-offs."""
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.rules: list[_Rule] = []
+        thresholds = spec.get("decision_thresholds")
+        self.block_above = thresholds.get("block_above") if thresholds else None
+        self.review_from = thresholds.get("review_from") if thresholds else None
+        self.max_score = spec.get("max_score")
+        self.extend(spec.get("rules") or [])
+
+    def extend(self, rule_specs: list[dict]) -> None:
+        rules = list(self.rules)
+        ids = {rule.id for rule in rules}
+        for spec in rule_specs:
+            rule = _compile_rule(spec)
+            if rule.id in ids:
+                raise RuleError(f"Duplicate rule id in pack {self.name}: {rule.id}")
+            ids.add(rule.id)
+            rules.append(rule)
+        self.rules = rules
+        # Every source the pack reads
+        self.sources = frozenset().union(*(rule.sources for rule in rules))
+        rule_stats.register_pack(self.name, [rule.id for rule in rules])
+
+    def evaluate(self, transaction, stats: dict, cfg: EngineConfig) -> RuleResult:
+        scan = self.start(transaction, stats, cfg)
+        scan.run()
+        return scan.result()
+
+    def start(self, transaction, stats: dict, cfg: EngineConfig) -> "PackScan":
+        """An evaluation to run in steps as feature sources are added to stats."""
+        return PackScan(self, transaction, stats, cfg)
+
+
+class PackScan:
+    """
+    One evaluation of a RulePack. run(loaded) evaluates the rules whose sources
+    are all loaded and defers the others, keeping the pack's semantics: a rule
+    after a deferred one in the same group, or after a deferred "stop" rule, is
+    deferred too. Reasons are reported in rule order whatever the run order.
+    stats is read again on every run, so the caller can keep filling it.
+    """
+
+    __slots__ = (
+        "pack", "transaction", "stats", "cfg", "pending", "loaded",
+        "_score", "_decision", "_reasons", "_fired", "_fired_groups", "_runs",
+    )
+
+    def __init__(self, pack: RulePack, transaction, stats: dict, cfg: EngineConfig):
+        self.pack = pack
+        self.transaction = transaction
+        self.stats = stats
+        self.cfg = cfg
+        # Indexes of the rules not evaluated yet
+        self.pending = range(len(pack.rules))
+        self.loaded: Optional[frozenset] = frozenset()
+        self._score = 0
+        self._decision = _ALLOW
+        self._reasons: list[tuple[int, str, str]] = []
+        self._fired: list[int] = []
+        self._fired_groups: set[str] = set()
+        self._runs = 0
+
+    def run(self, loaded: Optional[frozenset] = None) -> bool:
+        """Evaluate what `loaded` sources allow (None: everything); True when no rule is left."""
+        self.loaded = loaded
+        self._runs += 1
+        partial = loaded is not None
+        rules = self.pack.rules
+        cfg = self.cfg
+        features = _Features(self.transaction, self.stats, cfg)
+        counters = rule_stats.counters(self.pack.name, len(rules))
+        timing = rule_stats.timing
+        scan = rule_stats.current_scan()
+        fired_groups = self._fired_groups
+        deferred: list[int] = []
+        deferred_groups: set[str] = set()
+        held = False
+        for index in self.pending:
+            rule = rules[index]
+            group = rule.group
+            if group is not None and group in fired_groups:
+                continue
+            if partial and (held or group in deferred_groups or not rule.sources <= loaded):
+                deferred.append(index)
+                if group is not None:
+                    deferred_groups.add(group)
+                held = held or rule.stop
+                continue
+            counter = counters[index]
+            counter[EVALUATED] += 1
+            start = time.perf_counter_ns() if timing else 0
+            hit = rule.when(features, cfg)
+            if hit:
+                if group is not None:
+                    fired_groups.add(group)
+                points = rule.score(features, cfg)
+                self._score += points
+                counter[HITS] += 1
+                counter[POINTS] += points
+                if rule.decision > self._decision:
+                    self._decision = rule.decision
+                self._fired.append(index)
+                if rule.reason is not None:
+                    self._reasons.append((index, rule.output, rule.reason(features)))
+                if scan is not None:
+                    scan.fired.append(f"{self.pack.name}.{rule.id}")
+            if timing:
+                counter[NANOS] += time.perf_counter_ns() - start
+            if hit and rule.stop:
+                # Only the deferred rules before this one can still run
+                break
+        self.pending = deferred
+        return not deferred
+
+    @property
+    def sources(self) -> frozenset:
+        """Sources the deferred rules still need."""
+        return frozenset().union(*(self.pack.rules[index].sources for index in self.pending))
+
+    def headroom(self) -> tuple[float, str]:
+        """
+        Upper bound of the score the deferred rules could still add, and the
+        highest decision they could set. The bound is infinite when a deferred
+        rule's score itself depends on a source that is not loaded.
+        """
+        rules = self.pack.rules
+        loaded = self.loaded
+        features = _Features(self.transaction, self.stats, self.cfg)
+        extra = 0
+        decision = _ALLOW
+        for index in self.pending:
+            rule = rules[index]
+            if loaded is not None and not rule.score_sources <= loaded:
+                extra = math.inf
+            elif extra != math.inf:
+                extra += max(rule.score(features, self.cfg), 0)
+            decision = max(decision, rule.decision)
+        return extra, DECISIONS[decision]
+
+    def result(self) -> RuleResult:
+        """Outcome of the rules evaluated so far."""
+        score = self._score
+        decision = self._decision
+        pack = self.pack
+        if decision != _BLOCK:
+            if pack.block_above is not None and score > pack.block_above:
+                decision = _BLOCK
+            elif pack.review_from is not None and score >= pack.review_from:
+                decision = _REVIEW
+        if pack.max_score is not None:
+            score = min(score, pack.max_score)
+        reasons = self._reasons
+        fired = self._fired
+        if self._runs > 1:
+            # Deferred rules were evaluated late; report in rule order
+            reasons = sorted(reasons, key=lambda item: item[0])
+            fired = sorted(fired)
+        outputs: dict[str, list[str]] = {}
+        for _, output, reason in reasons:
+            outputs.setdefault(output, []).append(reason)
+        rules = pack.rules
+        return RuleResult(DECISIONS[decision], score, outputs, tuple(rules[index].id for index in fired))
+
+
+def load_rule_packs(path: str = BUILTIN_RULES_PATH, custom_path: str = "") -> dict[str, RulePack]:
+    """Compile the built-in packs, then append the rules from custom_path (if set)."""
+    with open(path, "r", encoding="utf-8") as f:
+        packs = {name: RulePack(name, spec) for name, spec in json.load(f).items()}
+    if custom_path:
+        with open(custom_path, "r", encoding="utf-8") as f:
+            custom = json.load(f)
+        for name, spec in custom.items():
+            if name not in packs:
+                raise RuleError(f"Unknown rule pack in {custom_path}: {name}")
+            packs[name].extend(spec.get("rules") or [])
+            logger.info(f"Loaded {len(spec.get('rules') or [])} custom rule(s) into {name} from {custom_path}")
+    return packs
+
+
+rule_packs = load_rule_packs(custom_path=get_settings().CUSTOM_RULES_PATH)
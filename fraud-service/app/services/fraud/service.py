@@ -1,22 +1,54 @@
 import logging
 import json
+from typing import Callable, Optional
 from app.models.transaction import Transaction
-from app.services.fraud.engine import basic_rule_check, pattern_check, detect_anomalies_and_patterns
-from app.services.fraud.ai.tools import _check_beneficiary_history_logic
-from app.services.fraud.ai.agent import workflow, get_system_message
+from app.services.fraud.engine import anomaly_outputs, basic_rule_check, degraded_decision, pattern_outputs
+from app.services.fraud.features import FeatureContext
+from app.services.fraud.rules import rule_packs
+from app.services.fraud.ai.agent import get_system_message
+from app.services.fraud.ai.gateway import REJECT_SATURATED, AIGatewayRejected, ai_gateway
+from app.services.fraud.ai.jobs import DEGRADED_SHUTDOWN, ai_jobs
 from app.services.fraud.ai.memory import SQLiteMemory
+from app.services.fraud.ai.runtime import get_agent
+from app.services.fraud.ai.tools import prefetched_tool_messages
 from app.core.config import get_settings
 from app.utils.helpers import format_transaction
 from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-from app.services.fraud.history import history_service
+from app.services.fraud.history import SOURCE_BENEFICIARY, SOURCE_WINDOW, async_history_service
+from app.services.fraud.rule_stats import rule_stats
+from app.services.fraud.store import current as current_engine_config
+from app.services.fraud.verdicts import verdict_cache, verdict_key
 
 logger = logging.getLogger(__name__)
 
-async def evaluate_transaction(transaction: Transaction):
+_PARSE_FALLBACK_REASON = "AI parsing fallback - Invalid JSON"
+
+async def evaluate_transaction(
+    transaction: Transaction,
+    defer_ai: bool = False,
+    submit_ai: Optional[Callable] = None,
+    preloaded: Optional[dict] = None,
+):
     """
     Hybrid Logic with HITL
+    defer_ai: return PENDING_AI instead of waiting for the agent; the run goes to
+    submit_ai(transaction_id, provisional, run, fallback) -> ticket id or None
+    (default: the background workers, fraud/ai/jobs.py)
+    preloaded: feature snapshot keys already loaded (batch scoring)
     """
+    # Attribute the rules fired during this scan to its final decision (engine stats)
+    with rule_stats.scan() as scan:
+        result = await _evaluate_transaction(transaction, defer_ai, submit_ai, preloaded)
+        scan.decision = result.get("decision")
+        return result
+
+
+async def _evaluate_transaction(
+    transaction: Transaction,
+    defer_ai: bool = False,
+    submit_ai: Optional[Callable] = None,
+    preloaded: Optional[dict] = None,
+):
     session_id = transaction.transaction_id
     logger.info(f"Evaluating transaction {transaction.transaction_id} for account: {transaction.from_account}")
 
@@ -24,19 +56,56 @@ async def evaluate_transaction(transaction: Transaction):
         # --- STEP 1: STATIC RULES (Zero Cost) ---
         rule_decision, rule_score = basic_rule_check(transaction)
 
+        # Nothing below can lift a high-confidence static BLOCK, so skip the history lookups
+        if rule_decision == "BLOCK" and rule_score > 75:
+            logger.info(f"BLOCK flagged by static rules (Rule score {rule_score}); history not consulted")
+            result = {
+                "decision": "BLOCK",
+                "score": min(rule_score, 100),
+                "reason": "Static rules: high risk (amount/device/self-transfer).",
+            }
+            await async_history_service.log_transaction(transaction, result)
+            return result
+
+        # Stats are fetched per source as the stages below ask for them, once per request;
+        # lookups run concurrently and each stage waits only for the sources it reads
+        features = FeatureContext(transaction.from_account, transaction.to_account, preloaded)
+
+        # One config snapshot for the whole scan, even if cfg.py is reloaded meanwhile
+        engine_cfg = current_engine_config()
+
+        is_low_amount = transaction.amount < 100
+        is_micro_amount = transaction.amount < 25
+
         # --- STEP 2: PATTERN ANALYSIS (past transactions, velocity, new beneficiary, amount spike) ---
-        pattern_stats = history_service.get_pattern_stats(
-            transaction.from_account, transaction.to_account
+        # STEP 3's fast-track checks read the window and the pair count as well
+        if not is_low_amount:
+            # Never fast-tracked, so STEP 2b needs all its sources anyway: start them alongside
+            features.prefetch(rule_packs["anomalies"].sources)
+        feature_stats = await features.require(
+            rule_packs["pattern_check"].sources | {SOURCE_WINDOW, SOURCE_BENEFICIARY}
         )
-        pattern_decision, pattern_score, pattern_reasons = pattern_check(transaction, pattern_stats)
+        pattern_result = rule_packs["pattern_check"].evaluate(transaction, feature_stats, engine_cfg)
+        pattern_decision, pattern_score, pattern_reasons = pattern_outputs(pattern_result)
 
-        # --- STEP 2b: ANOMALY DETECTION & PATTERNS / ANTI-PATTERNS ---
-        anomaly_stats = history_service.get_anomaly_stats(
-            transaction.from_account, transaction.to_account
-        )
-        anomaly_score_delta, anomalies, patterns, anti_patterns = detect_anomalies_and_patterns(
-            transaction, anomaly_stats
+        has_history = feature_stats.get("beneficiary_count", 0) > 0
+        high_velocity = feature_stats.get("recent_count_10m", 0) >= 5
+        fast_track_candidate = (
+            rule_decision == "ALLOW" and pattern_decision == "ALLOW" and not high_velocity
+            and (is_micro_amount or (has_history and is_low_amount))
         )
+
+        # --- STEP 2b: ANOMALY DETECTION & PATTERNS / ANTI-PATTERNS ---
+        # Rules run as their sources are loaded; a fast-track candidate skips the rest
+        # (e.g. the hour histogram) when they cannot push it out of ALLOW
+        anomaly_scan = rule_packs["anomalies"].start(transaction, feature_stats, engine_cfg)
+        if not anomaly_scan.run(features.loaded):
+            extra_score, _ = anomaly_scan.headroom()
+            if not (fast_track_candidate and anomaly_scan.result().score + extra_score < 50):
+                await features.require(anomaly_scan.sources)
+                anomaly_scan.run(features.loaded)
+        anomaly_result = anomaly_scan.result()
+        anomaly_score_delta, anomalies, patterns, anti_patterns = anomaly_outputs(anomaly_result)
         pattern_score_with_anomaly = pattern_score + anomaly_score_delta
         if pattern_decision == "ALLOW" and anomaly_score_delta >= 50:
             pattern_decision = "REVIEW"
@@ -59,13 +128,6 @@ async def evaluate_transaction(transaction: Transaction):
             )
 
         # --- STEP 3: HISTORY CHECK (Low Cost) ---
-        history_result = _check_beneficiary_history_logic(transaction.from_account, transaction.to_account)
-        has_history = "History Found" in history_result
-
-        is_low_amount = transaction.amount < 100
-        is_micro_amount = transaction.amount < 25
-        high_velocity = pattern_stats.get("recent_count_10m", 0) >= 5
-
         def _enrich_result(r):
             out = dict(r)
             if anomalies:
@@ -85,7 +147,7 @@ async def evaluate_transaction(transaction: Transaction):
                     "score": 5,
                     "reason": "Trusted beneficiary with significant history. Fast-tracked."
                 })
-                history_service.log_transaction(transaction, result)
+                await async_history_service.log_transaction(transaction, result)
                 return result
 
             if is_micro_amount:
@@ -95,7 +157,7 @@ async def evaluate_transaction(transaction: Transaction):
                     "score": 1,
                     "reason": "Micro-transaction within safe limits. Fast-tracked."
                 })
-                history_service.log_transaction(transaction, result)
+                await async_history_service.log_transaction(transaction, result)
                 return result
 
         # If rules or patterns say BLOCK with high confidence, return immediately (no AI needed)
@@ -112,10 +174,25 @@ async def evaluate_transaction(transaction: Transaction):
                 "score": min(combined_score, 100),
                 "reason": " ".join(reason_parts) if reason_parts else "Pattern and rule analysis: high risk."
             })
-            history_service.log_transaction(transaction, result)
+            await async_history_service.log_transaction(transaction, result)
             return result
 
         # --- STEP 4: AI AGENT (High Cost - Escalate) ---
+        # Same quantized features as a recent escalation: reuse its verdict
+        cache_key = verdict_key(
+            transaction.amount,
+            feature_stats.get("recent_count_10m", 0),
+            feature_stats.get("beneficiary_count", 0),
+            rule_score,
+            pattern_result.fired + anomaly_result.fired,
+        )
+        cached = verdict_cache.get(cache_key, engine_cfg)
+        if cached is not None:
+            logger.info(f"AI verdict cache hit for {transaction.transaction_id}: {cached['decision']}")
+            result = _enrich_result(cached)
+            await async_history_service.log_transaction(transaction, result)
+            return result
+
         logger.info("Escalating to AI Agent...")
         transaction_summary = format_transaction(transaction)
 
@@ -124,8 +201,8 @@ async def evaluate_transaction(transaction: Transaction):
         context = ""
         if not has_history:
             context += "[Note: New Beneficiary] "
-        if pattern_stats.get("recent_count_10m", 0) >= 3:
-            context += f"[Note: Velocity: {pattern_stats['recent_count_10m']} tx in last 10 min] "
+        if feature_stats.get("recent_count_10m", 0) >= 3:
+            context += f"[Note: Velocity: {feature_stats['recent_count_10m']} tx in last 10 min] "
         if pattern_reasons:
             context += f"[Pattern flags: {'; '.join(pattern_reasons)}] "
         if anomalies:
@@ -141,49 +218,101 @@ async def evaluate_transaction(transaction: Transaction):
 
         user_message_content = f"Analyze this transaction: {transaction_summary}. Context: {context}"
         
+        settings = get_settings()
+        messages = [get_system_message(), HumanMessage(content=user_message_content)]
+        if settings.AI_TOOL_PREFETCH_ENABLED:
+            # The required tool checks, answered from the stats already fetched above
+            messages += prefetched_tool_messages(transaction.from_account, transaction.to_account, feature_stats)
         initial_state = {
-            "messages": [get_system_message(), HumanMessage(content=user_message_content)],
+            "messages": messages,
             "transaction_id": transaction.transaction_id,
             "risk_score": 0,
             "decision": "UNKNOWN",
             "feedback": ""
         }
-        
-        # Use AsyncSqliteSaver (path from config so one DB regardless of cwd)
-        settings = get_settings()
-        async with AsyncSqliteSaver.from_conn_string(settings.CHECKPOINTS_DB_PATH) as checkpointer:
-            agent = workflow.compile(checkpointer=checkpointer, interrupt_before=["human_review"])
-            
+
+        async def _run_agent():
+            # Compiled once with a long-lived checkpointer (ai/runtime.py)
+            agent = await get_agent()
             final_state = await agent.ainvoke(initial_state, config=config)
-            
             # Check for interruption
-            state_snapshot = await agent.aget_state(config)
+            return final_state, await agent.aget_state(config)
+
+        def _degraded_result(why: str) -> dict:
+            decision, score = degraded_decision(combined_decision, combined_score, settings.AI_FALLBACK_REVIEW_FROM)
+            reason_parts = [r for r in pattern_reasons if r] + anti_patterns + anomalies
+            return _enrich_result({
+                "decision": decision,
+                "score": score,
+                "reason": f"AI agent unavailable ({why}); rule-based decision. "
+                          + (" ".join(reason_parts) if reason_parts else "No rule or pattern flags."),
+                "degraded": True,
+                "degraded_reason": why,
+            })
+
+        async def _agent_decision() -> dict:
+            # Bounded by the gateway (concurrency, rate, deadline, breaker); when the agent
+            # is not available answer from the rule/pattern/anomaly outcome instead
+            try:
+                final_state, state_snapshot = await ai_gateway.call(_run_agent)
+            except AIGatewayRejected as e:
+                logger.warning(f"AI agent unavailable for {transaction.transaction_id} ({e}); using rule-based decision")
+                return _degraded_result(e.reason)
+
             next_steps = state_snapshot.next
-            
+
             if next_steps and "human_review" in next_steps:
-                 logger.info(f"Transaction {transaction.transaction_id} paused for Human Review.")
-                 last_message_content = state_snapshot.values["messages"][-1].content
-                 parsed_result = _parse_json_response(last_message_content)
-                 pending_result = _enrich_result({
-                     "decision": "PENDING_REVIEW",
-                     "score": parsed_result.get("score", 85),
-                     "reason": parsed_result.get("reason", "High Risk transaction flagged for Manual Review.")
-                 })
-                 history_service.log_transaction(transaction, pending_result)
-                 return pending_result
-            
+                logger.info(f"Transaction {transaction.transaction_id} paused for Human Review.")
+                last_message_content = state_snapshot.values["messages"][-1].content
+                parsed_result = _parse_json_response(last_message_content)
+                return _enrich_result({
+                    "decision": "PENDING_REVIEW",
+                    "score": parsed_result.get("score", 85),
+                    "reason": parsed_result.get("reason", "High Risk transaction flagged for Manual Review.")
+                })
+
             output_text = final_state["messages"][-1].content
             logger.info(f"Agent raw response: {output_text}")
-        
-        # --- PERSISTENCE LAYER ---
-        db = SQLiteMemory()
-        db.add_message(session_id, "user", user_message_content)
-        db.add_message(session_id, "assistant", output_text)
-        # -------------------------
-
-        result = _parse_json_response(output_text)
-        result = _enrich_result(result)
-        history_service.log_transaction(transaction, result)
+
+            # --- PERSISTENCE LAYER ---
+            db = SQLiteMemory()
+            db.add_message(session_id, "user", user_message_content)
+            db.add_message(session_id, "assistant", output_text)
+            # -------------------------
+
+            result = _parse_json_response(output_text)
+            if result.get("reason") != _PARSE_FALLBACK_REASON:
+                verdict_cache.put(cache_key, engine_cfg, result)
+            return _enrich_result(result)
+
+        if submit_ai is None and ai_jobs.running:
+            submit_ai = ai_jobs.submit
+        if defer_ai and submit_ai is not None:
+            # Async mode: answer now with the provisional rule/pattern score; the agent
+            # runs on a background worker and overwrites the logged decision when done
+            result = _enrich_result({
+                "decision": "PENDING_AI",
+                "score": max(0, min(combined_score, 100)),
+                "reason": "Escalated to AI agent; provisional rule/pattern score. "
+                          "Final decision at GET /middleware/decision/{transaction_id}.",
+            })
+            # Logged before the run is queued, so its update always lands on this row
+            await async_history_service.log_transaction(transaction, result)
+            ticket_id = submit_ai(
+                transaction.transaction_id,
+                result,
+                lambda: _complete_deferred(transaction, _agent_decision),
+                lambda: _settle_deferred(transaction.transaction_id, _degraded_result(DEGRADED_SHUTDOWN)),
+            )
+            if ticket_id is None:
+                logger.warning(f"AI job queue full; rule-based decision for {transaction.transaction_id}")
+                result = _degraded_result(REJECT_SATURATED)
+                await _update_decision(transaction.transaction_id, result)
+                return result
+            return {**result, "ticket_id": ticket_id}
+
+        result = await _agent_decision()
+        await async_history_service.log_transaction(transaction, result)
         return result
 
     except Exception as e:
@@ -194,6 +323,34 @@ async def evaluate_transaction(transaction: Transaction):
             "reason": f"System Error: {str(e)}"
         }
 
+async def _complete_deferred(transaction: Transaction, agent_decision) -> dict:
+    """Background half of an async-mode scan: run the agent, record its decision."""
+    try:
+        result = await agent_decision()
+    except Exception as e:
+        logger.error(f"Error during AI evaluation: {e}", exc_info=True)
+        result = {
+            "decision": "REVIEW",
+            "score": 50,
+            "reason": f"System Error: {str(e)}"
+        }
+    await _update_decision(transaction.transaction_id, result)
+    logger.info(f"Async AI decision for {transaction.transaction_id}: {result['decision']}")
+    return result
+
+
+async def _settle_deferred(transaction_id: str, result: dict) -> dict:
+    """Record the rule-based decision of an async-mode scan whose agent run was cut off."""
+    await _update_decision(transaction_id, result)
+    return result
+
+
+async def _update_decision(transaction_id: str, result: dict) -> None:
+    await async_history_service.update_transaction_decision(
+        transaction_id, result["decision"], float(result.get("score", 50)), result.get("reason", "")
+    )
+
+
 def _parse_json_response(output_text):
     try:
         if "```json" in output_text:
@@ -217,5 +374,5 @@ def _parse_json_response(output_text):
         return {
             "decision": "REVIEW",
             "score": 60,
-            "reason": "AI parsing fallback - Invalid JSON"
+            "reason": _PARSE_FALLBACK_REASON
         }
@@ -1,7 +1,22 @@
 """
-Engine config: reads from hardcoded cfg.py. No database or API updates.
+Engine config: reads from hardcoded cfg.py. No database or API writes.
+
+cfg.py is parsed once into a frozen EngineConfig snapshot that every scan reads
+without copying. Editing cfg.py takes effect without a restart: the app polls its
+mtime (ENGINE_CONFIG_RELOAD_INTERVAL_SECONDS) and POST /config/reload forces a reload.
+A reload builds a new snapshot and swaps the module reference in one step, so a
+scan always sees one consistent set of thresholds; a cfg.py that fails to load
+or parse leaves the previous snapshot in place.
 """
-from app.services.fraud.cfg import ENGINE_CONFIG
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, fields
+from typing import Mapping
+
+from app.services.fraud import cfg as _cfg_module
+
+logger = logging.getLogger(__name__)
 
 # Keys that are integers (for type consistency if needed)
 INT_KEYS = {
@@ -12,11 +27,96 @@ INT_KEYS = {
 }
 
 
+@dataclass(frozen=True, slots=True)
+class EngineConfig:
+    """Parsed engine thresholds (defaults match cfg.py as shipped)."""
+    round_amount_tolerance: float = 0.01
+    unusual_hour_min_tx: int = 5
+    structuring_min_tx: int = 3
+    structuring_new_beneficiary_bonus: int = 15
+    off_hours_score: int = 25
+    round_amount_score: int = 20
+    recurring_beneficiary_min: int = 3
+    velocity_block_threshold: int = 10
+    velocity_review_threshold: int = 5
+    velocity_warn_threshold: int = 3
+    new_beneficiary_high_amount: float = 10_000.0
+    new_beneficiary_med_amount: float = 5_000.0
+    new_beneficiary_low_amount: float = 1_000.0
+    amount_spike_multiplier_avg: float = 3.0
+    amount_spike_multiplier_max: float = 2.0
+    min_transactions_for_avg: int = 2
+
+    @classmethod
+    def from_mapping(cls, values: Mapping) -> "EngineConfig":
+        """Parse a cfg.ENGINE_CONFIG-style dict; missing keys keep their defaults."""
+        parsed = {}
+        for field in fields(cls):
+            value = values.get(field.name)
+            if value is not None:
+                parsed[field.name] = int(value) if field.name in INT_KEYS else float(value)
+        return cls(**parsed)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+_CFG_PATH = _cfg_module.__file__
+_snapshot: EngineConfig = EngineConfig.from_mapping(_cfg_module.ENGINE_CONFIG)
+_cfg_mtime: int = os.stat(_CFG_PATH).st_mtime_ns
+_reload_lock = threading.Lock()
+
+
+def current() -> EngineConfig:
+    """The engine config snapshot in effect; read it once per scan and pass it along."""
+    return _snapshot
+
+
+def _read_cfg() -> dict:
+    # Compile the source directly; importlib.reload may reuse a stale .pyc after a quick edit
+    with open(_CFG_PATH, "r", encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": _cfg_module.__name__, "__file__": _CFG_PATH}
+    exec(compile(source, _CFG_PATH, "exec"), namespace)
+    return namespace["ENGINE_CONFIG"]
+
+
+def reload() -> EngineConfig:
+    """Re-read cfg.py and swap in the new snapshot. Raises (keeping the old one) if it is invalid."""
+    global _snapshot, _cfg_mtime
+    with _reload_lock:
+        mtime = os.stat(_CFG_PATH).st_mtime_ns
+        snapshot = EngineConfig.from_mapping(_read_cfg())
+        _cfg_mtime = mtime
+        if snapshot != _snapshot:
+            logger.info(f"Engine config reloaded from {_CFG_PATH}")
+        _snapshot = snapshot
+        return snapshot
+
+
+def reload_if_changed() -> None:
+    """Reload when cfg.py changed since the last (re)load; errors are logged, not raised."""
+    global _cfg_mtime
+    try:
+        mtime = os.stat(_CFG_PATH).st_mtime_ns
+    except OSError as e:
+        logger.error(f"Cannot stat engine config {_CFG_PATH}: {e}")
+        return
+    if mtime == _cfg_mtime:
+        return
+    try:
+        reload()
+    except Exception as e:
+        # Don't retry the same broken file every poll
+        _cfg_mtime = mtime
+        logger.error(f"Engine config reload failed, keeping previous thresholds: {e}")
+
+
 def get_all() -> dict:
     """Return the full engine config (from cfg.py)."""
-    return dict(ENGINE_CONFIG)
+    return _snapshot.as_dict()
 
 
 def get(key: str):
     """Return a single config value by key."""
-    return ENGINE_CONFIG.get(key)
+    return getattr(_snapshot, key, None)
@@ -0,0 +1,147 @@
+"""
+Continuous scoring for POST /middleware/stream (NDJSON) and the /middleware/stream/ws
+WebSocket.
+
+A connection feeds its transactions into one DecisionStream as it reads them and
+writes the decisions back in the order the transactions arrived:
+  - At most STREAM_MAX_IN_FLIGHT transactions of a connection are being scored or
+    waiting to be written. Past that, submit() waits, so the endpoint stops reading
+    the socket and TCP pushes back on the client (per-connection backpressure).
+  - Every chunk or message read is prefetched as a set, like a batch
+    (fraud/batch.py): one query per feature source for its senders and pairs, so
+    scoring runs from memory. A sender's 7-day hour histogram is kept and counted
+    up while it has transactions in flight.
+  - One sender's transactions are scored one after another in arrival order, so
+    each one's velocity, pair count and daily total include the ones before it.
+    Different senders are scored concurrently.
+  - At most AI_GATEWAY_MAX_CONCURRENCY agent runs of a connection are started at a
+    time; the other escalations wait their turn here rather than time out in the
+    gateway queue.
+  - Decisions that are ready together are handed out together, so the endpoint
+    writes one chunk or frame for many of them.
+
+An escalation holds back the decisions behind it until the agent decides, since
+output is in order. Feeds that can't wait send async_ai and get PENDING_AI with a
+ticket_id instead.
+"""
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from app.core.config import get_settings
+from app.models.transaction import Transaction
+from app.services.fraud.history import async_history_service
+from app.services.fraud.service import evaluate_transaction
+
+
+class DecisionStream:
+    """Bounded window of concurrent scans whose outputs come out in submission order."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        # runs in submission order, removed once their output was handed out
+        self._order: "deque[asyncio.Task]" = deque()
+        # sender -> its latest run, so the sender's next run starts after it
+        self._last_by_account: dict[str, asyncio.Task] = {}
+        # sender -> 7-day hour histogram, from prefetch() until its runs are done
+        self._hour_counts: dict[str, dict[int, int]] = {}
+        self._agent_slots = asyncio.Semaphore(max(1, get_settings().AI_GATEWAY_MAX_CONCURRENCY))
+        self._added = asyncio.Event()
+        self._closed = False
+        self.submitted = 0
+
+    async def prefetch(self, transactions: list[Transaction]) -> None:
+        """Load the features of the next transactions with one query per source."""
+        if not transactions:
+            return
+        hour_counts = await async_history_service.warm_feature_caches(
+            (t.from_account for t in transactions), ((t.from_account, t.to_account) for t in transactions)
+        )
+        for account, counts in hour_counts.items():
+            # A sender still in flight keeps the histogram its earlier runs counted up
+            self._hour_counts.setdefault(account, counts)
+
+    async def submit(self, transaction: Transaction, defer_ai: bool, render: Callable[[dict], Any]) -> None:
+        """Score the transaction after the sender's earlier ones; waits while the window is full."""
+        account = transaction.from_account
+
+        async def _score() -> Any:
+            counts = self._hour_counts.get(account)
+            preloaded = {"hour_counts_7d": dict(counts)} if counts is not None else None
+            if defer_ai:
+                result = await evaluate_transaction(transaction, defer_ai=True, preloaded=preloaded)
+            else:
+                escalated = []
+
+                def _set_aside(transaction_id: str, provisional: dict, run, fallback) -> str:
+                    escalated.append(run)
+                    return uuid.uuid4().hex
+
+                result = await evaluate_transaction(
+                    transaction, defer_ai=True, submit_ai=_set_aside, preloaded=preloaded
+                )
+                if escalated:
+                    async with self._agent_slots:
+                        result = await escalated[0]()
+            if counts is not None:
+                # The histogram is read from committed rows; count this one for the sender's next ones
+                counts[datetime.utcnow().hour] += 1
+            return render(result)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(self._last_by_account.get(account), _score))
+        self._last_by_account[account] = task
+        task.add_done_callback(lambda t: self._forget(account, t))
+        self._append(task)
+
+    async def submit_output(self, output: Any) -> None:
+        """Hand out output as is in this position (e.g. the error for an unreadable line)."""
+        await self._slots.acquire()
+        task = asyncio.get_running_loop().create_future()
+        task.set_result(output)
+        self._append(task)
+
+    def _append(self, task) -> None:
+        self._order.append(task)
+        self.submitted += 1
+        self._added.set()
+
+    def _forget(self, account: str, task: asyncio.Task) -> None:
+        if self._last_by_account.get(account) is task:
+            del self._last_by_account[account]
+            self._hour_counts.pop(account, None)
+
+    @staticmethod
+    async def _run(previous: Optional[asyncio.Task], score: Callable[[], Awaitable[Any]]) -> Any:
+        if previous is not None:
+            await asyncio.wait([previous])
+        return await score()
+
+    def close(self) -> None:
+        """No more submissions; results() ends after the last one."""
+        self._closed = True
+        self._added.set()
+
+    async def results(self) -> AsyncIterator[list]:
+        """Outputs in submission order, in lists of those that were ready together."""
+        while True:
+            while not self._order:
+                if self._closed:
+                    return
+                self._added.clear()
+                await self._added.wait()
+            chunk = [await self._order[0]]
+            self._order.popleft()
+            self._slots.release()
+            while self._order and self._order[0].done():
+                chunk.append(self._order.popleft().result())
+                self._slots.release()
+            yield chunk
+
+    async def drain(self) -> None:
+        """Wait for the scans still in flight (e.g. after the client went away)."""
+        if self._order:
+            await asyncio.gather(*self._order, return_exceptions=True)
@@ -0,0 +1,148 @@
+"""
+Cache of AI agent verdicts for escalated transactions (STEP 4 in service.py).
+
+Scans that reach the agent are keyed on a quantized picture of what the engine
+saw: velocity band, new-beneficiary flag, amount band, static rule score band
+and the set of scoring rules that fired (patterns, anomalies, anti-patterns).
+A scan with the same key reuses the stored decision and score instead of running
+the agent again. Its result is marked "cached" and the stored reason, written for
+another transaction, is prefixed with CACHED_REASON_PREFIX.
+
+Entries expire after AI_VERDICT_CACHE_TTL_SECONDS and the least recently used
+are evicted beyond AI_VERDICT_CACHE_SIZE (0 disables the cache). The whole cache
+is dropped when the engine config snapshot changes, since thresholds shape both
+the key and the context the agent was given. Only final agent verdicts are
+stored: human-review pauses, parse fallbacks and errors are not.
+
+Like the other in-memory state this is per process.
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.core.config import get_settings
+from app.services.fraud.store import EngineConfig
+
+# Band edges; a value's band is the number of edges at or below it
+VELOCITY_BANDS = (1, 3, 5, 10)
+AMOUNT_BANDS = (25, 100, 500, 1_000, 5_000, 10_000, 50_000, 200_000)
+RULE_SCORE_BANDS = (1, 25, 50, 75)
+
+CACHEABLE_DECISIONS = ("ALLOW", "REVIEW", "BLOCK")
+CACHED_REASON_PREFIX = "Matched a recent AI verdict for similar risk features"
+
+
+def verdict_key(
+    amount: float, recent_count: int, beneficiary_count: int, rule_score: float, fired: Iterable[str]
+) -> tuple:
+    """Canonical key for a scan: bands, new-beneficiary flag and the sorted fired rule ids."""
+    return (
+        bisect_right(VELOCITY_BANDS, recent_count),
+        beneficiary_count == 0,
+        bisect_right(AMOUNT_BANDS, amount),
+        bisect_right(RULE_SCORE_BANDS, rule_score),
+        tuple(sorted(set(fired))),
+    )
+
+
+class VerdictCache:
+    """TTL + LRU map of verdict_key -> {decision, score, reason}; thread-safe."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, verdict)
+        self._entries: "OrderedDict[tuple, tuple[float, dict]]" = OrderedDict()
+        self._config: Optional[EngineConfig] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def _check_config(self, cfg: EngineConfig) -> None:
+        # Caller holds the lock
+        if cfg is not self._config and cfg != self._config:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._config = cfg
+
+    def get(self, key: tuple, cfg: EngineConfig) -> Optional[dict]:
+        """The cached verdict for key under cfg, marked as reused, or None."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_config(cfg)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            verdict = entry[1]
+        return {
+            "decision": verdict["decision"],
+            "score": verdict["score"],
+            "reason": f"{CACHED_REASON_PREFIX}: {verdict['reason']}" if verdict["reason"] else CACHED_REASON_PREFIX,
+            "cached": True,
+        }
+
+    def put(self, key: tuple, cfg: EngineConfig, verdict: dict) -> bool:
+        """Store an agent verdict; False if it is not cacheable (or the cache is off)."""
+        if not self.enabled or verdict.get("decision") not in CACHEABLE_DECISIONS:
+            return False
+        stored = {"decision": verdict["decision"], "score": verdict.get("score"), "reason": verdict.get("reason")}
+        with self._lock:
+            self._check_config(cfg)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, stored)
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def report(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 6) if lookups else 0.0,
+                "stores": self.stores,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _build_verdict_cache() -> VerdictCache:
+    settings = get_settings()
+    return VerdictCache(settings.AI_VERDICT_CACHE_SIZE, settings.AI_VERDICT_CACHE_TTL_SECONDS)
+
+
+verdict_cache = _build_verdict_cache()
@@ -0,0 +1,218 @@
+"""
+In-process sliding-window state per sending account.
+
+Keeps what the velocity / structuring / amount-spike rules need without re-running
+SQL aggregates on every transaction (the daily limit has its own ledger, ledger.py):
+
+- 10-minute window: recent outbound events (count, distinct-beneficiary multiset,
+  latest details for the smurfing check).
+- 24-hour window: per-second buckets of positive amounts with a running count and
+  sum, plus a monotonic queue for the sliding max.
+
+log_transaction records into it; readers get O(1) stats. Accounts are tracked in an
+LRU bounded by WINDOW_MAX_ACCOUNTS and rebuilt lazily from SQLite on a miss (the
+history service runs the query and calls install()).
+
+State is per process: run one worker per DB (as the Dockerfile does) or accept that
+each worker only sees the transactions it logged since its last rebuild.
+"""
+import threading
+from collections import Counter, OrderedDict, deque
+from typing import Optional
+
+from app.core.config import get_settings
+
+VELOCITY_WINDOW_SECONDS = 10 * 60
+AMOUNT_WINDOW_SECONDS = 24 * 60 * 60
+DETAILS_LIMIT = 50
+
+
+class _AccountWindow:
+    __slots__ = (
+        "recent", "beneficiaries", "buckets", "amount_count", "amount_sum", "max_queue", "tx_ids",
+    )
+
+    def __init__(self):
+        # (ts_epoch, amount, to_account, timestamp) for the velocity window
+        self.recent: deque = deque()
+        self.beneficiaries: Counter = Counter()
+        # [ts_epoch, count, sum, tx_ids] for positive amounts in the 24h window
+        self.buckets: deque = deque()
+        self.amount_count = 0
+        self.amount_sum = 0.0
+        # (ts_epoch, amount), amounts strictly decreasing: front is the window max
+        self.max_queue: deque = deque()
+        # transaction_id -> to_account for everything still inside either window
+        self.tx_ids: dict[str, str] = {}
+
+    def add(self, transaction_id: str, to_account: str, amount: float, ts_epoch: int, timestamp: str):
+        self.tx_ids[transaction_id] = to_account
+        self.recent.append((ts_epoch, amount, to_account, timestamp))
+        self.beneficiaries[to_account] += 1
+        if amount is not None and amount > 0:
+            if self.buckets and self.buckets[-1][0] == ts_epoch:
+                bucket = self.buckets[-1]
+                bucket[1] += 1
+                bucket[2] += amount
+                bucket[3].append(transaction_id)
+            else:
+                self.buckets.append([ts_epoch, 1, amount, [transaction_id]])
+            self.amount_count += 1
+            self.amount_sum += amount
+            while self.max_queue and self.max_queue[-1][1] <= amount:
+                self.max_queue.pop()
+            self.max_queue.append((ts_epoch, amount))
+
+    def evict(self, now_epoch: int):
+        since_velocity = now_epoch - VELOCITY_WINDOW_SECONDS
+        since_amount = now_epoch - AMOUNT_WINDOW_SECONDS
+        while self.recent and self.recent[0][0] < since_velocity:
+            ts_epoch, _, to_account, _ = self.recent.popleft()
+            self.beneficiaries[to_account] -= 1
+            if self.beneficiaries[to_account] <= 0:
+                del self.beneficiaries[to_account]
+        while self.buckets and self.buckets[0][0] < since_amount:
+            _, count, total, tx_ids = self.buckets.popleft()
+            self.amount_count -= count
+            self.amount_sum -= total
+            for tx_id in tx_ids:
+                self.tx_ids.pop(tx_id, None)
+        if not self.buckets:
+            # Reset so float drift from add/subtract never outlives the window
+            self.amount_sum = 0.0
+        while self.max_queue and self.max_queue[0][0] < since_amount:
+            self.max_queue.popleft()
+        if not self.recent and not self.buckets:
+            self.tx_ids.clear()
+
+    def stats(self) -> dict:
+        details = [
+            {"amount": amount, "to_account": to_account, "timestamp": timestamp}
+            for _, amount, to_account, timestamp in reversed(self.recent)
+        ]
+        count = self.amount_count
+        total = round(self.amount_sum, 6) if count else 0.0
+        return {
+            "recent_count_10m": len(self.recent),
+            "unique_beneficiaries_10m": len(self.beneficiaries),
+            "recent_tx_details_10m": details[:DETAILS_LIMIT],
+            "amount_stats_24h": {
+                "avg_amount": total / count if count else 0,
+                "max_amount": float(self.max_queue[0][1]) if self.max_queue else 0,
+                "transaction_count": count,
+            },
+        }
+
+
+class AccountWindowStore:
+    """LRU of per-account sliding windows; thread-safe."""
+
+    def __init__(self, max_accounts: int):
+        self.max_accounts = max(1, max_accounts)
+        self._accounts: "OrderedDict[str, _AccountWindow]" = OrderedDict()
+        # Accounts being rebuilt from SQL -> one event buffer per in-flight rebuild
+        self._pending: dict[str, list[list[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        transaction_id: str,
+        from_account: str,
+        to_account: str,
+        amount: float,
+        ts_epoch: int,
+        timestamp: str,
+    ) -> None:
+        """Apply a logged transaction. Untracked accounts are skipped (rebuilt on next read)."""
+        event = (transaction_id, amount, to_account, timestamp, ts_epoch)
+        with self._lock:
+            for buffer in self._pending.get(from_account, ()):
+                buffer.append(event)
+            window = self._accounts.get(from_account)
+            if window is None:
+                return
+            if transaction_id in window.tx_ids:
+                # INSERT OR REPLACE moved an existing row; rebuild rather than patch
+                del self._accounts[from_account]
+                return
+            window.evict(ts_epoch)
+            window.add(transaction_id, to_account, amount, ts_epoch, timestamp)
+
+    def get(self, from_account: str, now_epoch: int) -> Optional[dict]:
+        """Window stats for the account, or None if it is not tracked (caller rebuilds)."""
+        with self._lock:
+            window = self._accounts.get(from_account)
+            if window is None:
+                return None
+            self._accounts.move_to_end(from_account)
+            window.evict(now_epoch)
+            return window.stats()
+
+    def find_transaction(self, from_account: str, transaction_id: str) -> tuple[bool, Optional[str]]:
+        """
+        (tracked, to_account): whether the account has a window, and the beneficiary
+        of transaction_id if it is inside that window.
+        """
+        with self._lock:
+            window = self._accounts.get(from_account)
+            if window is None:
+                return False, None
+            return True, window.tx_ids.get(transaction_id)
+
+    def begin_rebuild(self, from_account: str) -> list:
+        """
+        Start buffering events for an account whose rows are about to be read from SQL.
+        Returns the buffer to pass to install() / cancel_rebuild().
+        """
+        buffer: list[tuple] = []
+        with self._lock:
+            self._pending.setdefault(from_account, []).append(buffer)
+        return buffer
+
+    def _end_rebuild(self, from_account: str, buffer: list) -> None:
+        buffers = self._pending.get(from_account, [])
+        if any(b is buffer for b in buffers):
+            buffers[:] = [b for b in buffers if b is not buffer]
+        if not buffers:
+            self._pending.pop(from_account, None)
+
+    def install(self, from_account: str, rows, now_epoch: int, buffer: list) -> dict:
+        """
+        Build the account's window from SQL rows (transaction_id, amount, to_account,
+        timestamp, ts_epoch) covering the last 24h, merge events buffered since
+        begin_rebuild, and return its stats.
+        """
+        window = _AccountWindow()
+        seen = set()
+        for transaction_id, amount, to_account, timestamp, ts_epoch in sorted(rows, key=lambda r: r[4]):
+            seen.add(transaction_id)
+            window.add(transaction_id, to_account, amount, ts_epoch, timestamp)
+        with self._lock:
+            self._end_rebuild(from_account, buffer)
+            for event in buffer:
+                transaction_id, amount, to_account, timestamp, ts_epoch = event
+                if transaction_id not in seen:
+                    window.add(transaction_id, to_account, amount, ts_epoch, timestamp)
+            window.evict(now_epoch)
+            self._accounts[from_account] = window
+            self._accounts.move_to_end(from_account)
+            while len(self._accounts) > self.max_accounts:
+                self._accounts.popitem(last=False)
+            return window.stats()
+
+    def cancel_rebuild(self, from_account: str, buffer: list) -> None:
+        """Drop the event buffer of a rebuild whose query failed."""
+        with self._lock:
+            self._end_rebuild(from_account, buffer)
+
+    def invalidate(self, from_account: str) -> None:
+        with self._lock:
+            self._accounts.pop(from_account, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+            self._pending.clear()
+
+
+account_windows = AccountWindowStore(get_settings().WINDOW_MAX_ACCOUNTS)
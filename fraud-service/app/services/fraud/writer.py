@@ -0,0 +1,343 @@
+"""
+Write-behind queue for transaction rows.
+
+log_transaction hands its row to the queue and returns; a background task drains
+it and writes up to WRITE_BATCH_SIZE operations per transaction (one commit / WAL
+sync per batch instead of per row), waiting at most WRITE_FLUSH_INTERVAL_MS for a
+batch to fill. The queue is bounded by WRITE_QUEUE_MAX_ROWS: when the writer falls
+behind, callers wait on put() instead of growing memory without limit.
+
+A batch that fails to commit is retried with capped exponential backoff until it
+goes through; it is never dropped, since its decisions were already returned and
+the in-memory windows count its rows. Meanwhile the queue fills up and callers
+wait (backpressure), and report() shows the failure so readiness can fail. Only at
+shutdown is the wait bounded: whatever can't be written within the shutdown
+timeout is appended to a spill file, which start() replays before anything else.
+
+Rows stay visible as "pending" until their batch commits, so readers that rebuild
+from SQL (sliding windows, pair counts, account lookup) can overlay what is still
+queued. Decision updates go through the same queue to keep them ordered after the
+insert they modify.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INSERT = "insert"
+UPDATE = "update"
+
+# Transaction row layout, see history._transaction_row
+_TX_ID, _FROM, _TO = 0, 1, 2
+_DECISION_FIELDS = slice(6, 9)
+
+_STOP = object()
+
+
+class TransactionWriter:
+    """Bounded write-behind queue with group commit; flush() writes one batch."""
+
+    def __init__(
+        self,
+        flush: Callable[[list[tuple]], Awaitable[None]],
+        max_rows: int,
+        batch_size: int,
+        flush_interval_ms: int,
+        max_backoff_seconds: float = 5.0,
+        shutdown_timeout_seconds: float = 30.0,
+        spill_path: str = "",
+    ):
+        self._flush = flush
+        self.max_rows = max(1, max_rows)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0, flush_interval_ms) / 1000
+        self.max_backoff = max(0.1, max_backoff_seconds)
+        self.shutdown_timeout = max(0.0, shutdown_timeout_seconds)
+        self.spill_path = spill_path
+        self._queue: Optional[asyncio.Queue] = None
+        self._put_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        # transaction_id -> [seq, row] for rows not committed yet
+        self._pending: dict[str, list] = {}
+        # transaction_id -> [seq, (decision, risk_score, reason)] for queued updates
+        self._pending_decisions: dict[str, list] = {}
+        # account (sender or beneficiary) -> set of pending transaction_ids
+        self._by_account: dict[str, set[str]] = {}
+        self._seq = 0
+        # Bumped after every written batch; readers compare it to detect a flush mid-read
+        self.generation = 0
+        # Sync readers (agent tools) run in worker threads
+        self._lock = threading.Lock()
+        # Ops read back from the spill file by start(), written before the queue
+        self._replay: list[tuple] = []
+        # Loop time after which stop() gives up on the database and spills
+        self._stop_deadline: Optional[float] = None
+        self._spilling = False
+        self.written = 0
+        self.failed_attempts = 0
+        self.consecutive_failures = 0
+        self.failing_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.spilled = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def healthy(self) -> bool:
+        """False while a batch keeps failing to commit (rows are held, callers back up)."""
+        return self.consecutive_failures == 0
+
+    def start(self) -> None:
+        """Start the flush task on the running event loop (spilled ops are written first)."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_rows)
+        self._put_lock = asyncio.Lock()
+        self._stop_deadline = None
+        self._spilling = False
+        self._replay = self._load_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Flush everything queued so far, then stop the flush task. If the database
+        still refuses writes after the shutdown timeout, the rest is spilled.
+        """
+        if not self.running:
+            return
+        self._stop_deadline = asyncio.get_running_loop().time() + self.shutdown_timeout
+        async with self._put_lock:
+            await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    # --- producers ---
+
+    def track_insert(self, row: tuple) -> tuple[tuple, Optional[tuple]]:
+        """
+        Register a row as pending (visible to readers). Returns its queue op and the
+        pending row with the same transaction_id it supersedes, if any.
+        """
+        with self._lock:
+            self._seq += 1
+            previous = self._pending.get(row[_TX_ID])
+            if previous is not None:
+                self._unindex(row[_TX_ID], previous[1])
+            self._pending[row[_TX_ID]] = [self._seq, row]
+            for account in (row[_FROM], row[_TO]):
+                self._by_account.setdefault(account, set()).add(row[_TX_ID])
+            return (INSERT, row, self._seq), previous[1] if previous is not None else None
+
+    def track_update(self, transaction_id: str, decision: str, risk_score: float, reason: str) -> tuple:
+        """Apply a decision update to a pending row (if any) and return its queue op."""
+        with self._lock:
+            self._seq += 1
+            entry = self._pending.get(transaction_id)
+            if entry is not None:
+                row = list(entry[1])
+                row[_DECISION_FIELDS] = [decision, risk_score, reason]
+                entry[:] = [self._seq, tuple(row)]
+            else:
+                self._pending_decisions[transaction_id] = [self._seq, (decision, risk_score, reason)]
+            return (UPDATE, (decision, risk_score, reason, transaction_id), self._seq)
+
+    async def put(self, op: tuple) -> None:
+        """Queue an op from track_insert/track_update; waits while the queue is full."""
+        # Fair lock: when the queue is full, ops still enter it in seq order
+        async with self._put_lock:
+            await self._queue.put(op)
+
+    # --- readers ---
+
+    def pending_rows(self, account: str) -> list[tuple]:
+        """Uncommitted rows where the account is sender or beneficiary."""
+        with self._lock:
+            ids = self._by_account.get(account, ())
+            return [self._pending[tx_id][1] for tx_id in ids]
+
+    def pending_versions(self, transaction_ids) -> dict[str, tuple]:
+        """Uncommitted rows for these transaction_ids, whichever account they belong to."""
+        with self._lock:
+            if not self._pending:
+                return {}
+            return {
+                tx_id: self._pending[tx_id][1]
+                for tx_id in transaction_ids if tx_id in self._pending
+            }
+
+    def pending_decisions(self, transaction_ids) -> dict[str, tuple]:
+        """Queued (decision, risk_score, reason) updates for already-committed rows."""
+        with self._lock:
+            if not self._pending_decisions:
+                return {}
+            return {
+                tx_id: self._pending_decisions[tx_id][1]
+                for tx_id in transaction_ids if tx_id in self._pending_decisions
+            }
+
+    def pending_pair_ids(self, from_account: str, to_account: str) -> list[str]:
+        """Uncommitted transaction_ids from this sender to this beneficiary."""
+        with self._lock:
+            ids = self._by_account.get(from_account, ())
+            return [
+                tx_id for tx_id in ids
+                if self._pending[tx_id][1][_FROM] == from_account
+                and self._pending[tx_id][1][_TO] == to_account
+            ]
+
+    # --- flushing ---
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        if self._replay:
+            await self._write_replay()
+        stopping = False
+        while not stopping:
+            op = await self._queue.get()
+            if op is _STOP:
+                break
+            batch = [op]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        op = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    op = self._queue.get_nowait()
+                if op is _STOP:
+                    stopping = True
+                    break
+                batch.append(op)
+            await self._flush_batch(batch)
+
+    async def _flush_batch(self, batch: list[tuple], spill: bool = True) -> bool:
+        """Write a batch, retrying until it commits; False if it was spilled instead."""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while not self._spilling:
+            try:
+                await self._flush([(kind, params) for kind, params, _ in batch])
+            except Exception as e:
+                attempt += 1
+                self.failed_attempts += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                if self.failing_since is None:
+                    self.failing_since = time.time()
+                delay = min(0.1 * 2 ** attempt, self.max_backoff)
+                if self._stop_deadline is not None:
+                    remaining = self._stop_deadline - loop.time()
+                    if remaining <= 0:
+                        logger.error(
+                            f"Transaction writes still failing at shutdown ({e}); spilling to {self.spill_path}"
+                        )
+                        self._spilling = True
+                        break
+                    delay = min(delay, remaining)
+                logger.warning(
+                    f"Transaction write batch of {len(batch)} failed (attempt {attempt}), "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            self.written += len(batch)
+            self.consecutive_failures = 0
+            self.failing_since = None
+            self._release(batch)
+            return True
+        if spill:
+            self._spill(batch)
+        return False
+
+    # --- spill file (shutdown with the database unavailable) ---
+
+    def _spill(self, batch: list[tuple]) -> None:
+        if not self.spill_path:
+            logger.error(f"No WRITE_SPILL_PATH set; {len(batch)} transaction writes are lost")
+            return
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for kind, params, _ in batch:
+                f.write(json.dumps([kind, list(params)]) + "\n")
+        self.spilled += len(batch)
+
+    def _load_spill(self) -> list[tuple]:
+        """Spilled ops as queue ops, registered as pending (the file goes once they commit)."""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        ops = []
+        with open(self.spill_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                kind, params = json.loads(line)
+                if kind == INSERT:
+                    ops.append(self.track_insert(tuple(params))[0])
+                else:
+                    decision, risk_score, reason, transaction_id = params
+                    ops.append(self.track_update(transaction_id, decision, risk_score, reason))
+        logger.info(f"Replaying {len(ops)} spilled transaction writes from {self.spill_path}")
+        return ops
+
+    async def _write_replay(self) -> None:
+        replay, self._replay = self._replay, []
+        for i in range(0, len(replay), self.batch_size):
+            if not await self._flush_batch(replay[i:i + self.batch_size], spill=False):
+                # Stopped again before the database came back; the file still has them all
+                return
+        # Writes are idempotent (INSERT OR REPLACE), so a crash before this just replays again
+        os.remove(self.spill_path)
+
+    def report(self) -> dict:
+        with self._lock:
+            pending = len(self._pending) + len(self._pending_decisions)
+        return {
+            "running": self.running,
+            "healthy": self.healthy,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_rows": self.max_rows,
+            "pending_rows": pending,
+            "written": self.written,
+            "failed_attempts": self.failed_attempts,
+            "consecutive_failures": self.consecutive_failures,
+            "failing_since": self.failing_since,
+            "last_error": self.last_error,
+            "spilled": self.spilled,
+        }
+
+    def _release(self, batch: list[tuple]):
+        """Forget pending rows whose latest op was part of the written batch."""
+        written: dict[str, int] = {}
+        for kind, params, seq in batch:
+            tx_id = params[_TX_ID] if kind == INSERT else params[3]
+            written[tx_id] = max(seq, written.get(tx_id, 0))
+        with self._lock:
+            self.generation += 1
+            for tx_id, seq in written.items():
+                update = self._pending_decisions.get(tx_id)
+                if update is not None and update[0] <= seq:
+                    del self._pending_decisions[tx_id]
+                entry = self._pending.get(tx_id)
+                if entry is None or entry[0] > seq:
+                    continue
+                del self._pending[tx_id]
+                self._unindex(tx_id, entry[1])
+
+    def _unindex(self, transaction_id: str, row: tuple):
+        for account in (row[_FROM], row[_TO]):
+            ids = self._by_account.get(account)
+            if ids is not None:
+                ids.discard(transaction_id)
+                if not ids:
+                    del self._by_account[account]
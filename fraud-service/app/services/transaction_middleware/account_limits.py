@@ -4,6 +4,7 @@ reaches the fraud engine so limits cannot be bypassed by manipulating amount or
 """
 import sqlite3
 from app.core.config import get_settings
+from app.core.db import get_async_pool, get_connection, transaction as db_transaction
 
 # Account type limits: single transaction max and daily total max (USD)
 ACCOUNT_TYPE_LIMITS = {
@@ -23,6 +24,10 @@ def _get_db_path():
     return get_settings().DB_PATH
 
 
+# DB paths whose account_types table has been created in this process
+_initialized_paths: set[str] = set()
+
+
 def _init_accounts_table(conn: sqlite3.Connection):
     conn.execute("""
         CREATE TABLE IF NOT EXISTS account_types (
@@ -33,15 +38,38 @@ def _init_accounts_table(conn: sqlite3.Connection):
     conn.commit()
 
 
+def _accounts_connection(path: str) -> sqlite3.Connection:
+    conn = get_connection(path)
+    if path not in _initialized_paths:
+        _init_accounts_table(conn)
+        _initialized_paths.add(path)
+    return conn
+
+
 def get_account_type(account_id: str) -> str:
     """Return account type for account_id. Defaults to SAVINGS if unknown."""
+    conn = _accounts_connection(_get_db_path())
+    row = conn.execute(
+        "SELECT account_type FROM account_types WHERE account_id = ?",
+        (account_id,),
+    ).fetchone()
+    return _account_type_from_row(row)
+
+
+async def aget_account_type(account_id: str) -> str:
+    """Async get_account_type for request handlers (does not block the event loop)."""
     path = _get_db_path()
-    with sqlite3.connect(path) as conn:
-        _init_accounts_table(conn)
-        row = conn.execute(
+    _accounts_connection(path)
+    async with get_async_pool(path).acquire() as conn:
+        async with conn.execute(
             "SELECT account_type FROM account_types WHERE account_id = ?",
             (account_id,),
-        ).fetchone()
+        ) as cursor:
+            row = await cursor.fetchone()
+    return _account_type_from_row(row)
+
+
+def _account_type_from_row(row) -> str:
     if row:
         return row[0] if row[0] in ACCOUNT_TYPE_LIMITS else DEFAULT_ACCOUNT_TYPE
     return DEFAULT_ACCOUNT_TYPE
@@ -51,18 +79,25 @@ def set_account_type(account_id: str, account_type: str) -> None:
     if account_type not in ACCOUNT_TYPE_LIMITS:
         raise ValueError(f"Invalid account_type: {account_type}")
     path = _get_db_path()
-    with sqlite3.connect(path) as conn:
-        _init_accounts_table(conn)
+    _accounts_connection(path)
+    with db_transaction(path) as conn:
         conn.execute(
             "INSERT OR REPLACE INTO account_types (account_id, account_type) VALUES (?, ?)",
             (account_id, account_type),
         )
-        conn.commit()
 
 
 def get_limits_for_account(account_id: str) -> dict:
     """Return { account_type, single_tx_limit, daily_limit } for the account."""
-    atype = get_account_type(account_id)
+    return _limits_for_type(get_account_type(account_id))
+
+
+async def aget_limits_for_account(account_id: str) -> dict:
+    """Async get_limits_for_account."""
+    return _limits_for_type(await aget_account_type(account_id))
+
+
+def _limits_for_type(atype: str) -> dict:
     limits = ACCOUNT_TYPE_LIMITS[atype].copy()
     limits["account_type"] = atype
     return limits
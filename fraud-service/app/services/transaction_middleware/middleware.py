@@ -3,16 +3,18 @@ Transaction middleware: runs before the fraud engine. Ensures:
 1. Account-type limits (single-tx and daily) are enforced — no bypass by sending lower amount.
 2. OTP is required and valid when policy says so (e.g. above amount threshold).
 
-All checks happen before evaluate_transaction is called.
+All checks happen before evaluate_transaction is called. Lookups are awaited on the
+async DB pool so the event loop is never blocked.
 """
 import logging
 from dataclasses import dataclass
 from typing import Optional
 
 from app.models.transaction import Transaction
-from app.services.fraud.history import history_service
+from app.services.fraud.history import async_history_service
+from app.services.fraud.ledger import daily_ledger
 from app.services.transaction_middleware.account_limits import (
-    get_limits_for_account,
+    aget_limits_for_account,
     OTP_REQUIRED_AMOUNT_THRESHOLD,
 )
 from app.services.transaction_middleware.otp_store import verify_otp, otp_required_for_amount
@@ -32,17 +34,20 @@ class MiddlewareResult:
     daily_used: Optional[float] = None
 
 
-def run_transaction_middleware(
+async def run_transaction_middleware(
     transaction: Transaction,
     otp: Optional[str] = None,
 ) -> MiddlewareResult:
     """
     Run limit and OTP checks. Call this before evaluate_transaction.
     Returns MiddlewareResult; if allowed is False, do not proceed to fraud scan.
+    When allowed, the amount is held against the daily limit until the transaction
+    is logged; call release_daily_limit once evaluation is over (a no-op if it was
+    logged, frees the hold if it was blocked or failed).
     """
     from_account = transaction.from_account
     amount = transaction.amount
-    limits = get_limits_for_account(from_account)
+    limits = await aget_limits_for_account(from_account)
     single_tx_limit = limits["single_tx_limit"]
     daily_limit = limits["daily_limit"]
     account_type = limits["account_type"]
@@ -62,9 +67,13 @@ def run_transaction_middleware(
             daily_limit=daily_limit,
         )
 
-    # 2) Enforce daily limit (use actual history so you cannot bypass by splitting)
-    daily_used = history_service.get_daily_outbound_total(from_account)
-    if daily_used + amount > daily_limit:
+    # 2) Enforce daily limit (use actual history so you cannot bypass by splitting). The
+    #    amount is reserved atomically so parallel transfers cannot all pass; the caller
+    #    releases it if the transfer does not go through (release_daily_limit).
+    accepted, daily_used = await async_history_service.reserve_daily_limit(
+        from_account, transaction.transaction_id, amount, daily_limit
+    )
+    if not accepted:
         logger.warning(
             f"Transaction {transaction.transaction_id} rejected: daily total would be "
             f"{daily_used + amount} (limit {daily_limit}) for {from_account}"
@@ -82,6 +91,7 @@ def run_transaction_middleware(
     # 3) OTP required for amounts >= threshold
     if otp_required_for_amount(amount):
         if not otp or not otp.strip():
+            release_daily_limit(transaction.transaction_id)
             return MiddlewareResult(
                 allowed=False,
                 error_code="OTP_REQUIRED",
@@ -92,6 +102,7 @@ def run_transaction_middleware(
                 daily_used=daily_used,
             )
         if not verify_otp(transaction.transaction_id, otp.strip(), from_account):
+            release_daily_limit(transaction.transaction_id)
             return MiddlewareResult(
                 allowed=False,
                 error_code="OTP_INVALID",
@@ -111,3 +122,8 @@ def run_transaction_middleware(
         daily_limit=daily_limit,
         daily_used=daily_used,
     )
+
+
+def release_daily_limit(transaction_id: str) -> None:
+    """Drop the daily-limit reservation run_transaction_middleware made, unless already settled."""
+    daily_ledger.release(transaction_id)
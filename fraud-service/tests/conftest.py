@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Settings() requires an API key; the engine tests never call the provider
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the SQLite files the history store creates on import out of the working tree
+_scratch = tempfile.mkdtemp(prefix="fraud-tests-")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "transactions.db"))
+os.environ.setdefault("WRITE_SPILL_PATH", os.path.join(_scratch, "transactions.spill.jsonl"))
@@ -0,0 +1,82 @@
+"""AIDecisionJobs shutdown and stale PENDING_AI rows: no async AI run is left without a decision."""
+import asyncio
+import time
+
+from app.core.db import close_all_async
+from app.services.fraud.ai.jobs import DONE, AIDecisionJobs
+from app.services.fraud.history import _COLD_ROWS_SQL, async_history_service, history_service
+from app.services.fraud.writer import INSERT
+
+
+def _submit(jobs: AIDecisionJobs, transaction_id: str, seconds: float, fallbacks: list) -> None:
+    async def run():
+        await asyncio.sleep(seconds)
+        return {"decision": "ALLOW", "score": 10, "reason": "agent"}
+
+    async def fallback():
+        fallbacks.append(transaction_id)
+        return {"decision": "REVIEW", "score": 40, "reason": "rules", "degraded": True}
+
+    assert jobs.submit(transaction_id, {"decision": "PENDING_AI"}, run, fallback) is not None
+
+
+def test_stop_finishes_the_queue_within_the_timeout():
+    async def scenario():
+        jobs = AIDecisionJobs(workers=2, queue_size=10, max_results=10)
+        jobs.start()
+        fallbacks = []
+        for i in range(4):
+            _submit(jobs, f"t{i}", 0.01, fallbacks)
+        await jobs.stop(timeout=5)
+        return jobs, fallbacks
+
+    jobs, fallbacks = asyncio.run(scenario())
+    assert fallbacks == []
+    assert all(jobs.get(f"t{i}")[0] == DONE and jobs.get(f"t{i}")[2]["reason"] == "agent" for i in range(4))
+
+
+def test_stop_settles_queued_and_in_flight_runs(caplog):
+    async def scenario():
+        jobs = AIDecisionJobs(workers=1, queue_size=10, max_results=10)
+        jobs.start()
+        fallbacks = []
+        _submit(jobs, "slow", 60, fallbacks)
+        _submit(jobs, "queued", 60, fallbacks)
+        await asyncio.sleep(0.01)
+        await jobs.stop(timeout=0.05)
+        refused = jobs.submit("late", {}, None, None)
+        return jobs, fallbacks, refused
+
+    jobs, fallbacks, refused = asyncio.run(scenario())
+    assert fallbacks == ["slow", "queued"]
+    assert jobs.get("slow") == (DONE, jobs.get("slow")[1], {"decision": "REVIEW", "score": 40, "reason": "rules", "degraded": True})
+    assert jobs.get("queued")[0] == DONE
+    assert refused is None
+    assert "1 queued and 1 in-flight runs" in caplog.text
+
+
+def test_stale_pending_ai_rows_are_settled_and_stay_hot():
+    old = int(time.time()) - 3600
+
+    def row(transaction_id: str, ts_epoch: int) -> tuple:
+        return (transaction_id, "ACC-AI", "ACC-B", 20.0, "2025-01-01 00:00:00", ts_epoch, "PENDING_AI", 35.0, "provisional")
+
+    async def scenario():
+        try:
+            await async_history_service.write_batch([(INSERT, row("ai-old", old)), (INSERT, row("ai-new", old + 3500))])
+            pending_cold = [r[0] for r in history_service._fetchall(_COLD_ROWS_SQL, (old + 1, 100))]
+            settled = await async_history_service.settle_stale_ai_decisions(900)
+            return (
+                pending_cold,
+                settled,
+                await async_history_service.get_transaction_decision("ai-old"),
+                await async_history_service.get_transaction_decision("ai-new"),
+            )
+        finally:
+            await close_all_async()
+
+    pending_cold, settled, old_decision, new_decision = asyncio.run(scenario())
+    assert "ai-old" not in pending_cold
+    assert settled == 1
+    assert old_decision["decision"] == "REVIEW" and old_decision["score"] == 35.0
+    assert new_decision["decision"] == "PENDING_AI"
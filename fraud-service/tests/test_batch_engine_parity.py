@@ -0,0 +1,198 @@
+"""
+score_batch against the scalar engine: basic_rule_check, pattern_check,
+detect_anomalies_and_patterns and the static steps of evaluate_transaction, on
+seeded random transactions under more than one EngineConfig.
+"""
+import random
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.fraud import engine, rules
+from app.services.fraud.batch_engine import (
+    DECISIONS,
+    AnomalyFlag,
+    BatchColumns,
+    describe,
+    is_round_amount,
+    score_batch,
+)
+from app.services.fraud.store import EngineConfig
+
+CONFIGS = {
+    "default": EngineConfig(),
+    "tight": EngineConfig(
+        round_amount_tolerance=0.05,
+        velocity_block_threshold=4,
+        velocity_review_threshold=2,
+        velocity_warn_threshold=1,
+        unusual_hour_min_tx=1,
+        min_transactions_for_avg=1,
+        new_beneficiary_low_amount=500.0,
+    ),
+}
+
+AMOUNTS = [
+    0, -5, 10, 24.99, 99, 100, 500, 999.99, 1000, 1000.5, 1500, 2500, 5000, 5001,
+    9999.5, 10000, 10001, 20000, 49999, 50000.01, 60000, 200001, 300000,
+]
+DEVICES = ["Chrome on Windows", "kali linux", "nox player", "root/chrome", "rooted phone", "iPhone", "BlueStacks emulator", ""]
+
+ANOMALIES = AnomalyFlag.AMOUNT_ANOMALY | AnomalyFlag.TIME_ANOMALY | AnomalyFlag.ROUND_AMOUNT
+PATTERNS = AnomalyFlag.RECURRING_BENEFICIARY | AnomalyFlag.CONSISTENT_AMOUNT
+ANTI_PATTERNS = (
+    AnomalyFlag.STRUCTURING | AnomalyFlag.MULTIPLE_NEW_BENEFICIARIES
+    | AnomalyFlag.ROUND_AMOUNT_BURST | AnomalyFlag.BURST_TO_NEW_BENEFICIARY
+)
+
+
+@pytest.fixture
+def frozen_hour(monkeypatch):
+    """Pin the hour the scalar time-anomaly rule reads; returns a setter."""
+    def _freeze(hour: int) -> None:
+        class _Fixed(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime(2025, 1, 1, hour, 30)
+
+        monkeypatch.setattr(rules, "datetime", _Fixed)
+    return _freeze
+
+
+def _random_case(rnd: random.Random):
+    amount = rnd.choice(AMOUNTS) if rnd.random() < 0.5 else round(rnd.uniform(-10, 300000), rnd.choice([0, 2]))
+    transaction = SimpleNamespace(
+        amount=amount, from_account="a", to_account=rnd.choice(["a", "b"]), device_id=rnd.choice(DEVICES)
+    )
+    hour_counts = {h: 0 for h in range(24)}
+    for _ in range(rnd.randint(0, 12)):
+        hour_counts[rnd.randrange(24)] += 1
+    stats = {
+        "recent_count_10m": rnd.randint(0, 12),
+        "beneficiary_count": rnd.randint(0, 5),
+        "amount_stats_24h": {
+            "avg_amount": rnd.choice([0, rnd.uniform(1, 20000), 500.0]),
+            "max_amount": rnd.choice([0, rnd.uniform(1, 40000)]),
+            "transaction_count": rnd.randint(0, 6),
+        },
+        "unique_beneficiaries_10m": rnd.randint(0, 5),
+        "recent_tx_details_10m": [
+            {"amount": rnd.choice([1000, 500, 33.3, 5000, 2000.01, None])} for _ in range(rnd.randint(0, 5))
+        ],
+        "hour_counts_7d": hour_counts,
+    }
+    return transaction, stats
+
+
+def _scalar(transaction, stats, cfg):
+    """The per-row outputs score_batch reports, from the scalar functions (as in service.py)."""
+    rule_decision, rule_score = engine.basic_rule_check(transaction)
+    pattern_decision, pattern_score, pattern_reasons = engine.pattern_check(transaction, stats, cfg)
+    delta, anomalies, patterns, anti_patterns = engine.detect_anomalies_and_patterns(transaction, stats, cfg)
+    outputs = (
+        rule_decision, rule_score, pattern_decision, pattern_score, delta,
+        len(pattern_reasons), len(anomalies), len(patterns), len(anti_patterns),
+    )
+    if rule_decision == "BLOCK" and rule_score > 75:
+        return outputs + ("BLOCK", min(rule_score, 100), False)
+
+    with_anomaly = pattern_score + delta
+    if pattern_decision == "ALLOW" and delta >= 50:
+        pattern_decision = "REVIEW"
+    if pattern_decision == "ALLOW" and delta > 75:
+        pattern_decision = "BLOCK"
+    combined_score = max(rule_score, with_anomaly)
+    combined_decision = rule_decision
+    if pattern_decision == "BLOCK" or (pattern_decision == "REVIEW" and combined_decision == "ALLOW"):
+        combined_decision = pattern_decision
+    if rule_decision == "BLOCK" or pattern_decision == "BLOCK":
+        combined_decision = "BLOCK"
+
+    if combined_decision == "ALLOW" and stats["recent_count_10m"] < 5:
+        if stats["beneficiary_count"] > 0 and transaction.amount < 100:
+            return outputs + ("ALLOW", 5, False)
+        if transaction.amount < 25:
+            return outputs + ("ALLOW", 1, False)
+    if combined_decision == "BLOCK" and (rule_score > 75 or with_anomaly > 75):
+        return outputs + ("BLOCK", min(combined_score, 100), False)
+    return outputs + (combined_decision, combined_score, True)
+
+
+def _batch_row(scores, i):
+    def count(mask, flags=None):
+        mask = int(mask) if flags is None else int(mask) & int(flags)
+        return bin(mask).count("1")
+
+    return (
+        DECISIONS[scores.rule_decision[i]], int(scores.rule_score[i]),
+        DECISIONS[scores.pattern_decision[i]], int(scores.pattern_score[i]), int(scores.anomaly_score_delta[i]),
+        count(scores.pattern_flags[i]),
+        count(scores.anomaly_flags[i], ANOMALIES),
+        count(scores.anomaly_flags[i], PATTERNS),
+        count(scores.anomaly_flags[i], ANTI_PATTERNS),
+        DECISIONS[scores.decision[i]], int(scores.score[i]), bool(scores.needs_ai[i]),
+    )
+
+
+@pytest.mark.parametrize("config_name", sorted(CONFIGS))
+@pytest.mark.parametrize("hour", [3, 14])
+def test_score_batch_matches_scalar_engine(config_name, hour, frozen_hour):
+    cfg = CONFIGS[config_name]
+    frozen_hour(hour)
+    rnd = random.Random(f"{config_name}-{hour}")
+    cases = [_random_case(rnd) for _ in range(3000)]
+    transactions = [t for t, _ in cases]
+    snapshots = [s for _, s in cases]
+
+    scores = score_batch(BatchColumns.from_snapshots(transactions, snapshots), cfg, hour)
+
+    mismatches = [
+        (i, expected, _batch_row(scores, i))
+        for i, expected in enumerate(_scalar(t, s, cfg) for t, s in cases)
+        if _batch_row(scores, i) != expected
+    ]
+    assert not mismatches, mismatches[:5]
+
+
+def test_static_block_ignores_patterns():
+    transaction = SimpleNamespace(amount=300000, from_account="a", to_account="b", device_id="iPhone")
+    stats = {"recent_count_10m": 8, "beneficiary_count": 1}
+
+    scores = score_batch(BatchColumns.from_snapshots([transaction], [stats]), EngineConfig(), 12)
+
+    assert scores.decision_labels() == ["BLOCK"]
+    assert int(scores.score[0]) == 90
+    assert not scores.needs_ai[0]
+
+
+def test_describe_names_flags():
+    transaction = SimpleNamespace(amount=5000, from_account="a", to_account="b", device_id="iPhone")
+    stats = {"recent_count_10m": 3, "beneficiary_count": 0, "unique_beneficiaries_10m": 3}
+
+    scores = score_batch(BatchColumns.from_snapshots([transaction], [stats]), EngineConfig(), 12)
+
+    names = describe(scores.anomaly_flags[0], AnomalyFlag)
+    assert "ROUND_AMOUNT" in names
+    assert "STRUCTURING" in names
+    assert "MULTIPLE_NEW_BENEFICIARIES" in names
+
+
+@pytest.mark.parametrize("tolerance", [0.0, 0.01, 0.2])
+def test_is_round_amount_matches_scalar(tolerance):
+    amounts = np.concatenate([
+        np.arange(-10, 20000, 0.25),
+        np.random.default_rng(1).uniform(0, 1e7, 20000),
+    ])
+    expected = np.array([rules.is_round_amount(float(a), tolerance) for a in amounts])
+
+    assert (is_round_amount(amounts, tolerance) == expected).all()
+
+
+def test_empty_batch():
+    scores = score_batch(BatchColumns.from_snapshots([], []), EngineConfig(), 12)
+
+    assert scores.decision_labels() == []
+    assert scores.score.shape == (0,)
+    assert scores.needs_ai.shape == (0,)
@@ -0,0 +1,30 @@
+"""BeneficiaryPairCache's "seen before" filter: loaded on demand, never answers 0 for a logged pair."""
+from app.services.fraud.beneficiaries import BeneficiaryPairCache
+
+
+def test_filter_answers_only_after_load():
+    cache = BeneficiaryPairCache(max_pairs=10, filter_capacity=100_000)
+    assert cache.filter_enabled
+    assert cache.get("a", "new") is None
+
+    def read_pairs():
+        for i in range(25_000):
+            if i == 12_000:
+                # Logged while the table is being read
+                cache.increment("a", "during-load")
+            yield "a", f"b{i}"
+
+    assert cache.load_filter(read_pairs) == 25_000
+    assert cache.get("a", "b0") is None and cache.get("a", "b24999") is None
+    assert cache.get("a", "during-load") is None
+    cache.increment("a", "after-load")
+    assert cache.get("a", "after-load") is None
+    assert sum(cache.get("z", f"never{i}") == 0 for i in range(1_000)) > 900
+
+
+def test_disabled_filter_is_never_allocated():
+    cache = BeneficiaryPairCache(max_pairs=10)
+    assert not cache.filter_enabled
+    assert cache.load_filter(lambda: [("a", "b")]) == 0
+    cache.increment("a", "b")
+    assert cache.get("a", "c") is None and cache._filter is None
@@ -0,0 +1,98 @@
+"""TransactionHistory and AsyncTransactionHistory read the same features through the shared plans."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.core.db import close_all_async
+from app.models.transaction import Transaction
+from app.services.fraud.beneficiaries import beneficiary_pairs
+from app.services.fraud.history import SOURCE_BENEFICIARY, async_history_service, history_service
+from app.services.fraud.ledger import daily_ledger
+from app.services.fraud.windows import account_windows
+
+ACCOUNTS = ["ACC-SYNC-1", "ACC-SYNC-2"]
+PAIRS = [("ACC-SYNC-1", "ACC-B1"), ("ACC-SYNC-1", "ACC-B2"), ("ACC-SYNC-2", "ACC-B1"), ("ACC-SYNC-2", "ACC-NEW")]
+
+
+def _clear_caches():
+    account_windows.clear()
+    beneficiary_pairs.clear()
+    daily_ledger.clear()
+
+
+def _read_async(coroutines):
+    async def scenario():
+        try:
+            return [await c() for c in coroutines]
+        finally:
+            await close_all_async()
+
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded():
+    decisions = ["ALLOW", "REVIEW", "BLOCK"]
+    seeds = []
+    for i in range(12):
+        from_account, to_account = PAIRS[i % 3]
+        transaction = Transaction(
+            transaction_id=f"sync-{i}", from_account=from_account, to_account=to_account, amount=100.0 * (i + 1),
+            timestamp=datetime.utcnow(), ip_address="10.0.0.1", device_id="iPhone",
+        )
+        result = {"decision": decisions[i % 3], "score": 10, "reason": "seed"}
+        seeds.append(lambda t=transaction, r=result: async_history_service.log_transaction(t, r))
+    _read_async(seeds)
+    yield
+    _clear_caches()
+
+
+@pytest.mark.parametrize("sources", [None, (SOURCE_BENEFICIARY,)])
+def test_feature_snapshot_matches(sources):
+    _clear_caches()
+    expected = [history_service.get_feature_snapshot(*pair, sources=sources) for pair in PAIRS]
+    _clear_caches()
+    got = _read_async([lambda pair=pair: async_history_service.get_feature_snapshot(*pair, sources=sources) for pair in PAIRS])
+    assert got == expected
+
+
+def test_non_default_window_snapshot_matches():
+    expected = [history_service.get_feature_snapshot(*pair, velocity_minutes=30) for pair in PAIRS]
+    got = _read_async([lambda pair=pair: async_history_service.get_feature_snapshot(*pair, velocity_minutes=30) for pair in PAIRS])
+    assert got == expected
+
+
+def test_window_stats_and_ledger_match():
+    _clear_caches()
+    expected = [(history_service.get_recent_count_from_account(a), history_service.get_daily_outbound_total(a)) for a in ACCOUNTS]
+    _clear_caches()
+
+    async def read(account):
+        return (
+            await async_history_service.get_recent_count_from_account(account),
+            await async_history_service.get_daily_outbound_total(account),
+        )
+
+    got = _read_async([lambda a=a: read(a) for a in ACCOUNTS])
+    assert got == expected
+    # Blocked transfers don't count toward the daily total
+    assert expected[0] == (8, 100.0 * sum(i + 1 for i in range(12) if i % 3 != 2 and PAIRS[i % 3][0] == "ACC-SYNC-1"))
+
+
+def test_failed_query_cancels_the_rebuild(monkeypatch):
+    _clear_caches()
+
+    def broken(sql, params):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(history_service, "_fetchall", broken)
+    with pytest.raises(RuntimeError, match="disk I/O error"):
+        history_service.get_feature_snapshot("ACC-SYNC-1", "ACC-B1")
+    with pytest.raises(RuntimeError, match="disk I/O error"):
+        history_service.get_daily_outbound_total("ACC-SYNC-1")
+    assert "ACC-SYNC-1" not in account_windows._pending
+    assert "ACC-SYNC-1" not in daily_ledger._pending
+    assert account_windows.get("ACC-SYNC-1", 0) is None
+    monkeypatch.undo()
+    assert history_service.get_recent_count_from_account("ACC-SYNC-1") == 8
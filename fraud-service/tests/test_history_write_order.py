@@ -0,0 +1,43 @@
+"""Re-logs of one transaction_id reach the write-behind queue in the order they were tracked."""
+import asyncio
+from datetime import datetime
+
+from app.core.db import close_all_async
+from app.models.transaction import Transaction
+from app.services.fraud.history import async_history_service, transaction_writer
+
+
+def test_relogs_commit_in_tracking_order(monkeypatch):
+    transaction = Transaction(
+        transaction_id="order-1", from_account="ACC-ORDER", to_account="ACC-BEN", amount=50.0,
+        timestamp=datetime.utcnow(), ip_address="10.0.0.1", device_id="iPhone",
+    )
+    lookup = async_history_service._stored_pair
+
+    async def slow_first_lookup(row):
+        # The first log's lookup is still in flight while the second one runs start to finish
+        if row[6] == "REVIEW":
+            await asyncio.sleep(0.05)
+        return await lookup(row)
+
+    monkeypatch.setattr(async_history_service, "_stored_pair", slow_first_lookup)
+
+    async def scenario():
+        transaction_writer.start()
+        try:
+            await asyncio.gather(
+                async_history_service.log_transaction(transaction, {"decision": "REVIEW", "score": 60, "reason": "first"}),
+                async_history_service.log_transaction(transaction, {"decision": "BLOCK", "score": 90, "reason": "second"}),
+            )
+            queued = transaction_writer.pending_versions(("order-1",))["order-1"]
+            # stop() flushes the queue; the decision is then read back from SQLite
+            await transaction_writer.stop()
+            return queued, await async_history_service.get_transaction_decision("order-1")
+        finally:
+            await transaction_writer.stop()
+            await close_all_async()
+
+    queued, committed = asyncio.run(scenario())
+
+    # Whatever version the in-memory state settled on is the one that is committed
+    assert committed == {"decision": queued[6], "score": queued[7], "reason": queued[8]}
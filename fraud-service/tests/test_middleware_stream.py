@@ -0,0 +1,78 @@
+"""POST /middleware/stream and WS /middleware/stream/ws: line limits and read failures end the stream with an error line."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.main import app
+from app.services.fraud.stream import DecisionStream
+
+
+def _line(i: int) -> str:
+    return json.dumps({"transaction_id": f"s{i}", "from_account": f"ACC-STREAM-{i}", "to_account": "ACC-B", "amount": 10})
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def small_lines(monkeypatch):
+    monkeypatch.setattr(get_settings(), "STREAM_MAX_LINE_BYTES", 256)
+
+
+def _fail_prefetch_after(monkeypatch, calls: int):
+    prefetch = DecisionStream.prefetch
+    seen = []
+
+    async def flaky(self, transactions):
+        seen.append(transactions)
+        if len(seen) > calls:
+            raise RuntimeError("database is locked")
+        await prefetch(self, transactions)
+
+    monkeypatch.setattr(DecisionStream, "prefetch", flaky)
+
+
+def test_ndjson_line_too_long(client, small_lines):
+    body = "\n".join([_line(1), _line(2), "x" * 300, _line(4)]) + "\n"
+    response = client.post("/api/v1/middleware/stream", content=body)
+    out = [json.loads(line) for line in response.text.splitlines()]
+    assert [o.get("transaction_id") for o in out[:2]] == ["s1", "s2"]
+    assert out[2]["line"] == 3 and "STREAM_MAX_LINE_BYTES" in out[2]["error"]
+    assert len(out) == 3
+
+
+def test_ndjson_read_failure(client, monkeypatch):
+    _fail_prefetch_after(monkeypatch, 0)
+    response = client.post("/api/v1/middleware/stream", content=_line(1) + "\n" + _line(2) + "\n")
+    assert response.status_code == 200
+    out = [json.loads(line) for line in response.text.splitlines()]
+    assert out == [{"line": 1, "error": "internal error while reading the stream; no further lines were read"}]
+
+
+def test_ws_line_too_long(client, small_lines):
+    with client.websocket_connect("/api/v1/middleware/stream/ws") as ws:
+        ws.send_text(_line(1) + "\n" + "x" * 300 + "\n" + _line(3))
+        out = []
+        while len(out) < 2:
+            out += [json.loads(line) for line in ws.receive_text().splitlines()]
+        assert out[0]["transaction_id"] == "s1"
+        assert out[1]["line"] == 2 and "STREAM_MAX_LINE_BYTES" in out[1]["error"]
+        assert ws.receive()["type"] == "websocket.close"
+
+
+def test_ws_read_failure(client, monkeypatch):
+    _fail_prefetch_after(monkeypatch, 1)
+    with client.websocket_connect("/api/v1/middleware/stream/ws") as ws:
+        ws.send_text(_line(1) + "\n" + _line(2))
+        ws.send_text(_line(3))
+        out = []
+        while len(out) < 3:
+            out += [json.loads(line) for line in ws.receive_text().splitlines()]
+        assert [o.get("transaction_id") for o in out[:2]] == ["s1", "s2"]
+        assert out[2]["line"] == 3 and out[2]["error"].startswith("internal error")
+        assert ws.receive()["type"] == "websocket.close"
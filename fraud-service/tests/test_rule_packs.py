@@ -0,0 +1,121 @@
+"""
+The JSON rule packs against the engine they replaced, and load_rule_packs validation.
+
+data/rule_pack_baseline.json holds seeded random scans with the outputs of the
+hand-written pattern_check / detect_anomalies_and_patterns of the baseline
+engine.py (before the rule DSL), under the default and a tightened EngineConfig.
+"""
+import json
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.fraud import engine, rules
+from app.services.fraud.rules import BUILTIN_RULES_PATH, RuleError, load_rule_packs
+from app.services.fraud.store import EngineConfig
+
+with open(os.path.join(os.path.dirname(__file__), "data", "rule_pack_baseline.json"), encoding="utf-8") as f:
+    BASELINE = json.load(f)
+CONFIGS = {name: EngineConfig(**values) for name, values in BASELINE["configs"].items()}
+
+
+def _freeze_hour(monkeypatch, hour: int) -> None:
+    class _Fixed(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2025, 1, 1, hour, 30)
+
+    monkeypatch.setattr(rules, "datetime", _Fixed)
+
+
+def _scan(case: dict) -> tuple:
+    transaction = SimpleNamespace(amount=case["amount"], from_account="A", to_account="B", device_id="iPhone")
+    stats = dict(case["stats"], hour_counts_7d=dict(enumerate(case["stats"]["hour_counts_7d"])))
+    return transaction, stats, CONFIGS[case["config"]]
+
+
+@pytest.mark.parametrize("index", range(len(BASELINE["cases"])))
+def test_pattern_check_matches_baseline(index):
+    case = BASELINE["cases"][index]
+    decision, score, reasons = engine.pattern_check(*_scan(case))
+    assert [decision, score, reasons] == case["pattern_check"]
+
+
+@pytest.mark.parametrize("index", range(len(BASELINE["cases"])))
+def test_detect_anomalies_and_patterns_matches_baseline(index, monkeypatch):
+    case = BASELINE["cases"][index]
+    _freeze_hour(monkeypatch, case["hour"])
+    delta, anomalies, patterns, anti_patterns = engine.detect_anomalies_and_patterns(*_scan(case))
+    assert [delta, anomalies, patterns, anti_patterns] == case["detect_anomalies_and_patterns"]
+
+
+def test_baseline_covers_every_rule():
+    """The fixture exercises each pattern and anomaly rule at least once."""
+    reasons = []
+    for case in BASELINE["cases"]:
+        reasons += case["pattern_check"][2]
+        for output in case["detect_anomalies_and_patterns"][1:]:
+            reasons += output
+    for prefix in (
+        "High velocity", "Elevated velocity", "Unusual frequency", "New beneficiary + high amount",
+        "New beneficiary + medium amount", "New beneficiary + amount above", "Amount spike",
+        "Amount above recent max", "Amount anomaly", "Time anomaly", "Round amount", "Recurring beneficiary",
+        "Amount consistent", "Structuring", "Multiple new beneficiaries", "Multiple round-amount",
+        "Large transfer to new beneficiary",
+    ):
+        assert any(r.startswith(prefix) for r in reasons), prefix
+
+
+def _custom(tmp_path, packs: dict) -> str:
+    path = tmp_path / "custom_rules.json"
+    path.write_text(json.dumps(packs), encoding="utf-8")
+    return str(path)
+
+
+def test_custom_rules_are_appended(tmp_path):
+    custom = _custom(tmp_path, {"pattern_check": {"rules": [
+        {"id": "huge_first_payment", "when": "beneficiary_count == 0 and amount > 40000", "score": 10,
+         "reason": "First payment of ${amount:,.0f}"},
+    ]}})
+    packs = load_rule_packs(custom_path=custom)
+    assert packs["pattern_check"].rules[-1].id == "huge_first_payment"
+    assert len(packs["pattern_check"].rules) == len(load_rule_packs()["pattern_check"].rules) + 1
+
+
+def test_unknown_pack_is_rejected(tmp_path):
+    custom = _custom(tmp_path, {"pattern_checks": {"rules": [{"id": "x", "when": "amount > 1"}]}})
+    with pytest.raises(RuleError, match="Unknown rule pack.*pattern_checks"):
+        load_rule_packs(BUILTIN_RULES_PATH, custom)
+
+
+@pytest.mark.parametrize("when, error", [
+    ("__import__('os').system('true')", "Unsupported call"),
+    ("amount.__class__", "Unsupported attribute"),
+    ("cfg.__class__", "Unknown engine config key"),
+    ("cfg.no_such_threshold > 1", "Unknown engine config key"),
+    ("open('/etc/passwd')", "Unsupported call"),
+    ("balance > 100", "Unknown feature"),
+    ("amount > 'x'", "Unsupported constant"),
+    ("[amount][0] > 1", "Unsupported syntax"),
+    ("(lambda: 1)()", "Unsupported"),
+    ("amount ** 2 > 1", "Unsupported syntax"),
+    ("amount > 1; amount", "Invalid expression"),
+])
+def test_disallowed_expressions_are_rejected(tmp_path, when, error):
+    custom = _custom(tmp_path, {"anomalies": {"rules": [{"id": "bad", "when": when, "reason": "x"}]}})
+    with pytest.raises(RuleError, match=error):
+        load_rule_packs(BUILTIN_RULES_PATH, custom)
+
+
+def test_invalid_rule_specs_are_rejected(tmp_path):
+    for spec, error in [
+        ({"id": "no_condition"}, "needs an id and a when"),
+        ({"id": "bad_decision", "when": "amount > 1", "decision": "DENY"}, "unknown decision"),
+        ({"id": "bad_reason", "when": "amount > 1", "reason": "{balance}"}, "Unknown feature in reason template"),
+        ({"id": "velocity_block", "when": "amount > 1"}, "Duplicate rule id"),
+    ]:
+        custom = _custom(tmp_path, {"pattern_check": {"rules": [spec]}})
+        with pytest.raises(RuleError, match=error):
+            load_rule_packs(BUILTIN_RULES_PATH, custom)
@@ -0,0 +1,51 @@
+"""SegmentArchive: bounded caches, day skipping via the account filter, legacy days."""
+import os
+
+from app.services.fraud.archive import SegmentArchive
+
+
+def _row(tid, sender, receiver, day, offset=0):
+    ts = day * 86400 + offset
+    return (tid, sender, receiver, 10.0, "", ts, "APPROVE", 0.1, "")
+
+
+def _archive(tmp_path, **kwargs):
+    archive = SegmentArchive(str(tmp_path), index_cache_days=2, filter_cache_days=3, **kwargs)
+    for day in range(100, 110):
+        archive.append_day(day, [_row(f"t{day}", f"acct{day}", "shared", day)])
+    return archive
+
+
+def test_lookup_skips_days_without_the_account(tmp_path):
+    archive = _archive(tmp_path)
+    assert [r[0] for r in archive.account_rows("acct103", 10)] == ["t103"]
+    # Only the matching day's index was parsed; the caches stay within their bounds
+    assert list(archive._indexes) == [103]
+    assert len(archive._filters) == 3
+    assert [r[0] for r in archive.account_rows("shared", 20)] == [f"t{d}" for d in range(109, 99, -1)]
+    assert len(archive._indexes) == 2
+    assert archive.account_rows("nobody", 10) == []
+
+
+def test_days_archived_without_a_filter_get_one(tmp_path):
+    archive = _archive(tmp_path)
+    for day in range(100, 110):
+        os.remove(archive._filter_path(day))
+    fresh = SegmentArchive(str(tmp_path))
+    assert [r[0] for r in fresh.account_rows("acct105", 10)] == ["t105"]
+    assert all(os.path.exists(fresh._filter_path(day)) for day in range(100, 110))
+    fresh.append_day(105, [_row("t105b", "acct105", "late", 105, 60)])
+    assert [r[0] for r in fresh.account_rows("late", 10)] == ["t105b"]
+
+
+def test_purge_removes_filters_and_cached_days(tmp_path):
+    archive = _archive(tmp_path)
+    archive.account_rows("shared", 20)
+    assert archive.purge_before(108) == 8
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        f"transactions-{name}{ext}"
+        for name in ("19700419", "19700420")
+        for ext in (".seg", ".idx.json", ".accounts")
+    )
+    assert all(day >= 108 for day in list(archive._indexes) + list(archive._filters))
+    assert [r[0] for r in archive.account_rows("shared", 20)] == ["t109", "t108"]
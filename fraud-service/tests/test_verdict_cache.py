@@ -0,0 +1,23 @@
+"""VerdictCache hits are marked as reused and never pass another transaction's reason off as their own."""
+from app.api.v1.endpoints.middleware import _to_decision_response
+from app.services.fraud.store import current as current_engine_config
+from app.services.fraud.verdicts import CACHED_REASON_PREFIX, VerdictCache, verdict_key
+
+
+def test_hit_is_marked_cached_with_prefixed_reason():
+    cache = VerdictCache(max_entries=10, ttl_seconds=60)
+    cfg = current_engine_config()
+    key = verdict_key(800.0, 2, 0, 30, ["new_beneficiary"])
+    assert cache.get(key, cfg) is None
+    cache.put(key, cfg, {"decision": "REVIEW", "score": 70, "reason": "First transfer of 800 to ACC-9 at 3am."})
+
+    hit = cache.get(key, cfg)
+    assert hit == {
+        "decision": "REVIEW",
+        "score": 70,
+        "reason": f"{CACHED_REASON_PREFIX}: First transfer of 800 to ACC-9 at 3am.",
+        "cached": True,
+    }
+    response = _to_decision_response("tx-2", hit)
+    assert response.cached and response.reason.startswith(CACHED_REASON_PREFIX)
+    assert not _to_decision_response("tx-3", {"decision": "ALLOW", "score": 5}).cached
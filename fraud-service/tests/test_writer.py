@@ -0,0 +1,105 @@
+"""TransactionWriter: failed batches are retried, never dropped, and spilled only at shutdown."""
+import asyncio
+
+from app.services.fraud.writer import INSERT, TransactionWriter
+
+
+def _row(i: int) -> tuple:
+    return (f"t{i}", "a", "b", 10.0, "2025-01-01T00:00:00", 1735689600, "ALLOW", 1, "ok")
+
+
+class _FlakyStore:
+    """flush() that fails while `down` is set and records what it wrote."""
+
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.written: list[tuple] = []
+
+    async def flush(self, ops):
+        if self.down:
+            raise RuntimeError("database is locked")
+        self.written.extend(params for kind, params in ops if kind == INSERT)
+
+
+async def _log(writer: TransactionWriter, i: int) -> None:
+    op, _ = writer.track_insert(_row(i))
+    await writer.put(op)
+
+
+def test_failing_batch_is_retried_until_it_commits():
+    async def scenario():
+        store = _FlakyStore(down=True)
+        writer = TransactionWriter(store.flush, 100, 10, 1, max_backoff_seconds=0.1)
+        writer.start()
+        for i in range(3):
+            await _log(writer, i)
+        await asyncio.sleep(0.5)
+        failing = writer.report()
+        store.down = False
+        await asyncio.sleep(0.3)
+        await writer.stop()
+        return store, writer, failing
+
+    store, writer, failing = asyncio.run(scenario())
+
+    assert not failing["healthy"] and failing["consecutive_failures"] > 1
+    assert failing["pending_rows"] == 3
+    assert [row[0] for row in store.written] == ["t0", "t1", "t2"]
+    assert writer.healthy and writer.report()["pending_rows"] == 0
+
+
+def test_full_queue_backs_up_callers_while_failing():
+    async def scenario():
+        store = _FlakyStore(down=True)
+        writer = TransactionWriter(store.flush, 2, 1, 1, max_backoff_seconds=0.1)
+        writer.start()
+        logged = 0
+
+        async def producer():
+            nonlocal logged
+            for i in range(10):
+                await _log(writer, i)
+                logged += 1
+
+        task = asyncio.create_task(producer())
+        await asyncio.sleep(0.3)
+        blocked_at = logged
+        store.down = False
+        await task
+        await writer.stop()
+        return store, blocked_at
+
+    store, blocked_at = asyncio.run(scenario())
+
+    assert blocked_at < 10
+    assert [row[0] for row in store.written] == [f"t{i}" for i in range(10)]
+
+
+def test_shutdown_spills_and_next_start_replays(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+
+    async def shutdown_while_down():
+        store = _FlakyStore(down=True)
+        writer = TransactionWriter(
+            store.flush, 100, 10, 1, max_backoff_seconds=0.05, shutdown_timeout_seconds=0.2, spill_path=str(spill)
+        )
+        writer.start()
+        for i in range(3):
+            await _log(writer, i)
+        await writer.stop()
+        return writer
+
+    async def restart():
+        store = _FlakyStore()
+        writer = TransactionWriter(store.flush, 100, 10, 1, spill_path=str(spill))
+        writer.start()
+        await writer.stop()
+        return store
+
+    writer = asyncio.run(shutdown_while_down())
+    assert writer.spilled == 3 and spill.exists()
+
+    store = asyncio.run(restart())
+    assert [row[0] for row in store.written] == ["t0", "t1", "t2"]
+    assert list(store.written[0]) == list(_row(0))
+    assert not spill.exists()